@@ -0,0 +1,68 @@
+"""
+Benchmark for opening huge METS files: time until the page list can be shown, eager Document.load vs. MetsSummary
+
+Uses a synthetic mets.xml with PAGES pages and one file per page in each of GROUPS file groups
+
+Usage: python benchmarks/bench_mets.py
+"""
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Callable
+
+from ocrd_browser.model import Document
+from ocrd_browser.model.mets_summary import MetsSummary
+from ocrd_browser.util.file_groups import FileGroupHandle
+
+PAGES = 20000
+GROUPS = ['OCR-D-IMG', 'OCR-D-IMG-BIN', 'OCR-D-SEG', 'OCR-D-OCR']
+
+HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<mets:mets xmlns:mets="http://www.loc.gov/METS/" xmlns:mods="http://www.loc.gov/mods/v3" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <mets:dmdSec ID="DMDLOG_0000"><mets:mdWrap MDTYPE="MODS"><mets:xmlData><mods:mods>
+    <mods:identifier type="purl">https://example.org/benchmark</mods:identifier>
+  </mods:mods></mets:xmlData></mets:mdWrap></mets:dmdSec>
+  <mets:fileSec>
+'''
+
+
+def synthetic_mets(path: Path) -> None:
+    with open(path, 'w') as mets:
+        mets.write(HEADER)
+        for group in GROUPS:
+            mimetype = 'image/png' if group.startswith('OCR-D-IMG') else 'application/vnd.prima.page+xml'
+            extension = 'png' if group.startswith('OCR-D-IMG') else 'xml'
+            mets.write('    <mets:fileGrp USE="{}">\n'.format(group))
+            for page in range(PAGES):
+                mets.write('      <mets:file ID="{0}_{1:06d}" MIMETYPE="{2}"><mets:FLocat LOCTYPE="OTHER" OTHERLOCTYPE="FILE" '
+                           'xlink:href="{0}/{0}_{1:06d}.{3}"/></mets:file>\n'.format(group, page, mimetype, extension))
+            mets.write('    </mets:fileGrp>\n')
+        mets.write('  </mets:fileSec>\n  <mets:structMap TYPE="PHYSICAL">\n    <mets:div TYPE="physSequence">\n')
+        for page in range(PAGES):
+            mets.write('      <mets:div TYPE="page" ID="PHYS_{:06d}">'.format(page))
+            mets.write(''.join('<mets:fptr FILEID="{}_{:06d}"/>'.format(group, page) for group in GROUPS))
+            mets.write('</mets:div>\n')
+        mets.write('    </mets:div>\n  </mets:structMap>\n</mets:mets>\n')
+
+
+def seconds(open_page_list: Callable[[], Any]) -> float:
+    start = perf_counter()
+    open_page_list()
+    return perf_counter() - start
+
+
+def main() -> None:
+    group = FileGroupHandle('OCR-D-IMG', 'image/png')
+    with TemporaryDirectory() as directory:
+        path = Path(directory) / 'mets.xml'
+        synthetic_mets(path)
+        print('{} pages, {:.1f} MB'.format(PAGES, path.stat().st_size / 1024 / 1024))
+        print('{:<28} {:>8.2f} s'.format('MetsSummary.parse', seconds(lambda: MetsSummary.parse(path))))
+        print('{:<28} {:>8.2f} s'.format('Document.load', seconds(lambda: Document.load(path).get_image_paths(group))))
+        # Last, the Workspace keeps loading in the background
+        print('{:<28} {:>8.2f} s'.format('Document.load(lazy=True)',
+                                         seconds(lambda: Document.load(path, lazy=True).get_image_paths(group))))
+
+
+if __name__ == '__main__':
+    main()
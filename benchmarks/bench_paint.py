@@ -0,0 +1,105 @@
+"""
+Benchmark for Operations.paint: full canvas layers per depth vs. layers per cluster of overlapping operations
+
+Usage: python benchmarks/bench_paint.py [PAGE-XML file]
+"""
+import logging
+import sys
+from multiprocessing import get_context
+from pathlib import Path
+from resource import getrusage, RUSAGE_SELF
+from time import perf_counter
+from typing import Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from ocrd_models.ocrd_page import parse
+from ocrd_browser.model.page_xml_renderer import PageXmlRenderer, Feature, Operations, RegionMap
+
+DEFAULT_PAGE = Path(__file__).parent.parent / 'tests/example/workspaces/aletheiaexamplepage/OCR-D-GT-PAGE/PAGE_2017.xml'
+REPEAT = 5
+FEATURES = Feature.DEFAULT | Feature.WORDS | Feature.ORDER
+QUIET = logging.getLogger('benchmark')
+QUIET.disabled = True
+IDENTITY = {'transform': [[1., 0., 0.], [0., 1., 0.], [0., 0., 1.]], 'angle': 0, 'features': ''}
+
+
+def renderer(path: str) -> PageXmlRenderer:
+    pc_gts = parse(path, silence=True)
+    page = pc_gts.get_Page()
+    canvas = Image.fromarray(np.random.default_rng(42).integers(0, 256, (page.imageHeight, page.imageWidth, 3), dtype=np.uint8))
+    page_renderer = PageXmlRenderer(canvas, IDENTITY, 'benchmark', FEATURES, logger=QUIET)
+    page_renderer.render_all(pc_gts)
+    return page_renderer
+
+
+def paint_full_layers(operations: Operations, canvas: Image.Image) -> Tuple[Image.Image, RegionMap]:
+    """
+    The former Operations.paint: one RGBA layer of canvas size per depth
+    """
+    regions = RegionMap()
+    for _depth, layer_operations in operations.layers():
+        layer = Image.new(mode='RGBA', size=canvas.size, color='#FFFFFF00')
+        draw = ImageDraw.Draw(layer)
+        for operation in layer_operations:
+            operation.paint(draw, regions)
+        canvas.alpha_composite(layer)
+    operations.operations.clear()
+    return canvas, regions
+
+
+def measure(path: str, strategy: str) -> Tuple[float, float, bytes]:
+    page_renderer = renderer(path)
+    canvas = page_renderer.canvas.copy()
+    rss_before = getrusage(RUSAGE_SELF).ru_maxrss
+    start = perf_counter()
+    if strategy == 'full':
+        image, _ = paint_full_layers(page_renderer.operations, canvas)
+    else:
+        image, _ = page_renderer.operations.paint(canvas)
+    elapsed = perf_counter() - start
+    peak_increase = (getrusage(RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+    return elapsed, peak_increase, image.tobytes()
+
+
+def page_size(path: str) -> Tuple[int, int]:
+    page = parse(path, silence=True).get_Page()
+    return page.imageWidth, page.imageHeight
+
+
+def layer_megapixels(path: str) -> Tuple[int, float, float, float]:
+    """
+    Number of layers, blended megapixels with full canvas layers and with clustered layers, largest clustered layer
+    """
+    size = page_size(path)
+    layers = list(renderer(path).operations.layers())
+    areas = [
+        (right - left) * (bottom - top)
+        for _depth, layer_operations in layers
+        for (left, top, right, bottom), _cluster in Operations.clusters(layer_operations, size)
+    ]
+    return len(layers), len(layers) * size[0] * size[1] / 1e6, sum(areas) / 1e6, max(areas, default=0) / 1e6
+
+
+def main() -> None:
+    path = sys.argv[1] if len(sys.argv) > 1 else str(DEFAULT_PAGE)
+    width, height = page_size(path)
+    print('{} ({}x{} px)'.format(path, width, height))
+    layers, full, clustered, largest = layer_megapixels(path)
+    print('{:d} layers, blended pixels: {:.1f} MPx full vs. {:.1f} MPx clustered, largest clustered layer {:.1f} MPx'.format(layers, full, clustered, largest))
+
+    # Every run in a fresh process, so peak memory of one strategy doesn't hide the other
+    results = {}
+    with get_context('fork').Pool(1, maxtasksperchild=1) as pool:
+        for strategy in ['full', 'clustered']:
+            runs = [pool.apply(measure, (path, strategy)) for _ in range(REPEAT)]
+            print('{:>9s}: {:6.3f} s (best of {:d}), peak RSS +{:6.1f} MB'.format(
+                strategy, min(elapsed for elapsed, _, _ in runs), REPEAT, max(peak for _, peak, _ in runs)
+            ))
+            results[strategy] = runs[0][2]
+    print('identical output: {}'.format(results['full'] == results['clustered']))
+
+
+if __name__ == '__main__':
+    main()
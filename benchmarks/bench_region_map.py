@@ -0,0 +1,97 @@
+"""
+Benchmark for RegionMap.find_region: spatial index vs. walking the region tree
+
+Uses a synthetic page with 2 columns of 80 lines with 12 words of 15 glyphs each (about 31k regions)
+
+Usage: python benchmarks/bench_region_map.py
+"""
+import logging
+from random import Random
+from time import perf_counter
+from typing import Callable, List, Tuple
+
+from PIL import Image
+from shapely.geometry import Point
+
+from ocrd_models.ocrd_page import (
+    PcGtsType, PageType, TextRegionType, TextLineType, WordType, GlyphType, CoordsType, TextEquivType, to_xml, parseString
+)
+from ocrd_browser.model.page_xml_renderer import PageXmlRenderer, Feature, RegionMap, RegionBase
+
+WIDTH, HEIGHT = 5000, 7000
+COLUMNS, LINES, WORDS, GLYPHS = 2, 80, 12, 15
+QUERIES = 100
+QUIET = logging.getLogger('benchmark')
+QUIET.disabled = True
+IDENTITY = {'transform': [[1., 0., 0.], [0., 1., 0.], [0., 0., 1.]], 'angle': 0, 'features': ''}
+
+
+def coords(left: float, top: float, right: float, bottom: float) -> CoordsType:
+    return CoordsType(points='{0:d},{1:d} {2:d},{1:d} {2:d},{3:d} {0:d},{3:d}'.format(int(left), int(top), int(right), int(bottom)))
+
+
+def synthetic_page() -> PcGtsType:
+    page = PageType(imageFilename='synthetic.png', imageWidth=WIDTH, imageHeight=HEIGHT)
+    column_width, line_height = (WIDTH - 300) / COLUMNS, (HEIGHT - 200) / LINES
+    word_width = (column_width - 100) / WORDS
+    glyph_width = word_width * 0.9 / GLYPHS
+    for c in range(COLUMNS):
+        left = 100 + c * (column_width + 100)
+        region = TextRegionType(id='r{}'.format(c), Coords=coords(left, 100, left + column_width, HEIGHT - 100))
+        for li in range(LINES):
+            top = 100 + li * line_height
+            line = TextLineType(id='r{}l{}'.format(c, li), Coords=coords(left, top, left + column_width, top + line_height * 0.8))
+            for w in range(WORDS):
+                word_left = left + w * word_width
+                word = WordType(id='r{}l{}w{}'.format(c, li, w), Coords=coords(word_left, top, word_left + word_width * 0.9, top + line_height * 0.8))
+                for g in range(GLYPHS):
+                    glyph_left = word_left + g * glyph_width
+                    word.add_Glyph(GlyphType(
+                        id='r{}l{}w{}g{}'.format(c, li, w, g),
+                        Coords=coords(glyph_left, top, glyph_left + glyph_width * 0.95, top + line_height * 0.8),
+                        TextEquiv=[TextEquivType(Unicode='x')]
+                    ))
+                line.add_Word(word)
+            region.add_TextLine(line)
+        page.add_TextRegion(region)
+    # Round trip through XML, so regions know their parents like in a loaded document
+    return parseString(to_xml(PcGtsType(pcGtsId='synthetic', Page=page)).encode('utf-8'), silence=True)
+
+
+def region_map(pc_gts: PcGtsType, features: Feature) -> RegionMap:
+    # Regions don't depend on the scale, so rasterize small
+    renderer = PageXmlRenderer(Image.new('RGB', (WIDTH, HEIGHT)), IDENTITY, 'synthetic', features, logger=QUIET, scale=0.05)
+    renderer.render_all(pc_gts)
+    return renderer.get_result()[1]
+
+
+def timed(find: Callable[[Point], List[object]], points: List[Point]) -> Tuple[float, List[List[object]]]:
+    start = perf_counter()
+    results = [find(p) for p in points]
+    return (perf_counter() - start) / len(points), results
+
+
+def main() -> None:
+    pc_gts = synthetic_page()
+    random = Random(42)
+    points = [Point(random.uniform(0, WIDTH), random.uniform(0, HEIGHT)) for _ in range(QUERIES)]
+    levels = [
+        ('word level', Feature.REGIONS | Feature.LINES | Feature.WORDS),
+        ('glyph level', Feature.REGIONS | Feature.LINES | Feature.WORDS | Feature.GLYPHS),
+        # Without their words, glyphs end up flat on the top level of the region tree
+        ('glyphs only', Feature.REGIONS | Feature.GLYPHS),
+    ]
+    for name, features in levels:
+        regions = region_map(pc_gts, features)
+        start = perf_counter()
+        regions.build_index()
+        build = perf_counter() - start
+        walk, walk_results = timed(lambda p: RegionBase.find_regions(regions, p), points)
+        index, index_results = timed(regions.find_regions, points)
+        print('{:>11s}: {:6d} regions, tree walk {:8.3f} ms/query, index {:6.3f} ms/query ({:.0f}x), index built in {:.0f} ms, identical results: {}'.format(
+            name, len(regions.nodes_by_region), walk * 1000, index * 1000, walk / index, build * 1000, walk_results == index_results
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark for Document.reorder: one XPath query per page vs. one pass over the physSequence
+
+Uses a synthetic mets.xml with a physSequence of PAGES pages, both variants include writing the mets.xml once
+
+Usage: python benchmarks/bench_reorder.py
+"""
+from pathlib import Path
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, List
+
+from ocrd import Resolver
+from ocrd_models.constants import NAMESPACES as NS
+
+from ocrd_browser.model import Document
+
+PAGES = 5000
+GROUPS = ['OCR-D-IMG', 'OCR-D-GT-PAGE']
+
+HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<mets:mets xmlns:mets="http://www.loc.gov/METS/" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <mets:fileSec>
+'''
+
+
+def synthetic_mets(path: Path) -> None:
+    with open(path, 'w') as mets:
+        mets.write(HEADER)
+        for group in GROUPS:
+            mets.write('    <mets:fileGrp USE="{}">\n'.format(group))
+            for page in range(PAGES):
+                mets.write('      <mets:file ID="{0}_{1:05d}" MIMETYPE="image/png"><mets:FLocat LOCTYPE="OTHER" OTHERLOCTYPE="FILE" '
+                           'xlink:href="{0}/{0}_{1:05d}.png"/></mets:file>\n'.format(group, page))
+            mets.write('    </mets:fileGrp>\n')
+        mets.write('  </mets:fileSec>\n  <mets:structMap TYPE="PHYSICAL">\n    <mets:div TYPE="physSequence">\n')
+        for page in range(PAGES):
+            mets.write('      <mets:div TYPE="page" ID="PHYS_{:05d}">'.format(page))
+            mets.write(''.join('<mets:fptr FILEID="{}_{:05d}"/>'.format(group, page) for group in GROUPS))
+            mets.write('</mets:div>\n')
+        mets.write('    </mets:div>\n  </mets:structMap>\n</mets:mets>\n')
+
+
+def xpath_per_page(document: Document, ordered_page_ids: List[str]) -> None:
+    """
+    Document.reorder before: one XPath query per page and a refresh of all OcrdMets caches
+    """
+    page_sequence = document.xpath('mets:structMap[@TYPE="PHYSICAL"]/mets:div[@TYPE="physSequence"]')[0]
+    ordered_divs = []
+    for page_id in ordered_page_ids:
+        divs = page_sequence.xpath('mets:div[@TYPE="page"][@ID="%s"]' % page_id, namespaces=NS)
+        if divs:
+            ordered_divs.append(divs[0])
+            page_sequence.remove(divs[0])
+    for div in ordered_divs:
+        page_sequence.append(div)
+    document.workspace.mets.refresh_caches()
+    document.save_mets()
+
+
+def seconds(reorder: Callable[[Document, List[str]], None], path: Path, ordered_page_ids: List[str]) -> float:
+    document = Document(Resolver().workspace_from_url(str(path), download=False), editable=True)
+    start = perf_counter()
+    reorder(document, ordered_page_ids)
+    elapsed = perf_counter() - start
+    assert Document.load(path).page_ids == ordered_page_ids
+    return elapsed
+
+
+def main() -> None:
+    with TemporaryDirectory() as directory:
+        path = Path(directory) / 'mets.xml'
+        synthetic_mets(path)
+        ordered_page_ids = ['PHYS_{:05d}'.format(page) for page in range(PAGES)]
+        Random(42).shuffle(ordered_page_ids)
+        print('{} pages'.format(PAGES))
+        print('{:<28} {:>8.2f} s'.format('XPath per page', seconds(xpath_per_page, path, ordered_page_ids)))
+        print('{:<28} {:>8.2f} s'.format('Document.reorder', seconds(Document.reorder, path, ordered_page_ids)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark for page list thumbnails: full decode with cv2.imread vs. load_thumbnail at reduced resolution
+
+Uses synthetic 2500x3500 pages in the formats found in OCR-D workspaces
+
+Usage: python benchmarks/bench_thumbnails.py
+"""
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from ocrd_browser.util.image import cv_scale, cv_to_pixbuf, pil_scale, pil_to_pixbuf
+from ocrd_browser.util.thumbnails import ThumbnailCache, load_thumbnail
+
+WIDTH, HEIGHT = 2500, 3500
+PAGES = 8
+
+
+def synthetic_page(seed: int) -> Image.Image:
+    # Noise with some structure, so compression behaves somewhat like on a scan
+    noise = np.random.default_rng(seed).integers(0, 64, (HEIGHT // 4, WIDTH // 4, 3), dtype=np.uint8)
+    return Image.fromarray(noise).resize((WIDTH, HEIGHT)).point(lambda v: 160 + v)
+
+
+WRITERS: Dict[str, Callable[[Image.Image, Path], None]] = {
+    'JPEG': lambda page, path: page.save(path.with_suffix('.jpg'), quality=90),
+    'PNG': lambda page, path: page.save(path.with_suffix('.png')),
+    'TIFF': lambda page, path: page.save(path.with_suffix('.tif'), compression='tiff_deflate'),
+    'TIFF G4': lambda page, path: page.convert('1').save(path.with_suffix('.tif'), compression='group4'),
+    'TIFF pyramid': lambda page, path: page.save(
+        path.with_suffix('.tif'), compression='tiff_deflate', save_all=True,
+        append_images=[page.reduce(factor) for factor in (2, 4, 8)], tiffinfo={254: 1}
+    ),
+}
+
+
+def full_decode(path: Path) -> None:
+    cv_to_pixbuf(cv_scale(cv2.imread(str(path)), 100, None))
+
+
+def reduced_decode(path: Path) -> None:
+    pil_to_pixbuf(pil_scale(load_thumbnail(path, ThumbnailCache.SIZE).image, 100, None))
+
+
+def pages_per_second(decode: Callable[[Path], None], paths: List[Path]) -> float:
+    start = perf_counter()
+    for path in paths:
+        decode(path)
+    return len(paths) / (perf_counter() - start)
+
+
+def main() -> None:
+    pages = [synthetic_page(seed) for seed in range(PAGES)]
+    with TemporaryDirectory() as directory:
+        for name, write in WRITERS.items():
+            subdirectory = Path(directory) / name.replace(' ', '_')
+            subdirectory.mkdir()
+            for n, page in enumerate(pages):
+                write(page, subdirectory / 'page{}'.format(n))
+            paths = sorted(subdirectory.iterdir())
+            full = pages_per_second(full_decode, paths)
+            reduced = pages_per_second(reduced_decode, paths)
+            print('{:>12s}: full decode {:6.1f} pages/s, reduced decode {:7.1f} pages/s ({:.1f}x)'.format(name, full, reduced, reduced / full))
+
+
+if __name__ == '__main__':
+    main()
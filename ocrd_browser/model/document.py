@@ -1,26 +1,35 @@
 from __future__ import annotations
-from typing import Optional, Tuple, List, Union, cast, Callable, Any, Dict, Sequence, TYPE_CHECKING
+from typing import Optional, Tuple, List, Union, cast, Callable, Any, Dict, Iterator, Sequence, NamedTuple, Set, TYPE_CHECKING
 
 import atexit
 import errno
 import os
+import re
 import shutil
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from copy import copy
 from functools import wraps
+from threading import Lock, RLock
 
 from ocrd import Resolver
+from ocrd_browser.model.mets_summary import MetsSummary
 from ocrd_browser.model.page import Page
-from ocrd_browser.util.file_groups import best_file_group, FileGroupHandle, PatternList
+from ocrd_browser.util.cache import LruCacheView
+from ocrd_browser.util.config import SettingsFactory
+from ocrd_browser.util.file_groups import best_file_group, FileGroupHandle, FileGroupStats, PatternList
+from ocrd_browser.util.files import copy_if_changed, reflink, reflink_or_copy, replace_atomically, snapshot
 from ocrd_browser.util.image import add_dpi_to_png_buffer
 from ocrd_browser.util.streams import SilencedStreams
 from ocrd_modelfactory import page_from_file
 from ocrd_models.constants import NAMESPACES as NS
-from ocrd_models import OcrdFile
-from ocrd_utils import pushd_popd
-from ocrd_utils.constants import MIME_TO_EXT
+from ocrd_models import OcrdFile, OcrdMets
+from ocrd_utils import MIMETYPE_PAGE, pushd_popd
+from ocrd_utils.constants import MIME_TO_EXT, REGEX_PREFIX
 from ocrd_utils import getLogger
 
 from pathlib import Path
-from tempfile import mkdtemp
+from tempfile import gettempdir, mkdtemp
 from datetime import datetime
 from urllib.parse import urlparse, unquote
 from PIL import Image
@@ -39,6 +48,35 @@ if TYPE_CHECKING:
 
 
 EventCallBack = Optional[Callable[[str, Any], None]]
+PageFileIndex = Dict[str, Dict[FileGroupHandle, List[OcrdFile]]]
+PageCacheKey = Tuple[str, Optional[str]]
+# Affected page ids of a document_changed event, old_to_new page ids for 'reordered'
+PageChanges = Union[List[str], Dict[str, str]]
+
+FILE_POINTER_XPATH = 'mets:structMap[@TYPE="PHYSICAL"]/mets:div[@TYPE="physSequence"]/mets:div[@TYPE="page"]/mets:fptr'
+
+
+def _matches(pattern: Optional[str], value: str) -> bool:
+    """
+    Matches value like OcrdMets.find_files does: None matches everything, '//' prefixes a regular expression
+    """
+    if pattern is None:
+        return True
+    if pattern.startswith(REGEX_PREFIX):
+        return re.fullmatch(pattern[len(REGEX_PREFIX):], value) is not None
+    return pattern == value
+
+
+# Parsed PAGE-XML takes about 12 times the size of its file in memory
+PC_GTS_BYTES_PER_FILE_BYTE = 12
+
+
+class CachedPcGts(NamedTuple):
+    path: Path
+    mtime: Optional[int]
+    pc_gts: PcGtsType
+    # Estimated memory footprint in bytes
+    size: int = 0
 
 
 def check_editable(func: Callable[..., Any]) -> Callable[..., Any]:
@@ -54,42 +92,130 @@ def check_editable(func: Callable[..., Any]) -> Callable[..., Any]:
 
 class Document:
     temporary_workspaces: List[str] = []
+    # Serializes everything that changes the process wide cwd (pushd_popd) or sys.stdout/stderr (SilencedStreams),
+    # parsing PAGE-XML and loading images happen in the prefetch threads too
+    io_lock = RLock()
 
     def __init__(self, workspace: Optional[Workspace], emitter: Optional[EventCallBack] = None, editable: bool = False,
                  original_url: str = None):
-        self.workspace = workspace
+        self._workspace = workspace
+        # Workspace and page file index while loading in the background, see Document.load
+        self._loading: Optional[Future[Tuple[Workspace, PageFileIndex]]] = None
+        self._summary: Optional[MetsSummary] = None
+        # Guards taking over the loaded Workspace, the prefetch and thumbnail threads need it too
+        self._loading_lock = Lock()
         self.emitter = emitter
         self._original_url = original_url
         self._editable = editable
         self._empty = True
         self._modified = False
+        self._page_file_index: Optional[PageFileIndex] = None
+        self._file_group_stats: Optional[Dict[FileGroupHandle, FileGroupStats]] = None
+        self._page_ids: Optional[List[str]] = None
+        self._page_positions: Optional[Dict[str, int]] = None
+        # Counts against the shared memory budget ([Cache] memory) and holds at most [Cache] pageXml entries
+        self.page_cache: LruCacheView[PageCacheKey, CachedPcGts] = LruCacheView(
+            lambda cached: cached.size, max_entries=SettingsFactory.settings().cache.page_xml
+        )
+        # Nesting depth of batch(), whether the mets.xml needs saving at its end and the deferred document_changed events
+        self._batch_depth = 0
+        self._batch_unsaved = False
+        self._batch_changes: List[Tuple[str, PageChanges]] = []
         if self.workspace:
-            os.chdir(self.workspace.directory)
+            with self.io_lock:
+                os.chdir(self.workspace.directory)
 
     @classmethod
     def create(cls, emitter: EventCallBack = None) -> Document:
         return cls(None, emitter=emitter)
 
     @classmethod
-    def load(cls, mets_url: Union[Path, str] = None, emitter: EventCallBack = None) -> Document:
+    def load(cls, mets_url: Union[Path, str] = None, emitter: EventCallBack = None, lazy: bool = False) -> Document:
         """
         Load a project from an url as a readonly view
 
+        With lazy=True only page_ids, file_groups and the files per page get read (streaming, see MetsSummary) before
+        returning, the Workspace and the page file index get built in the background. Until then page_ids,
+        file_groups, get_image_paths, directory and title answer from the summary, everything else waits for the
+        Workspace, see when_loaded.
+
         If you want to modify the Workspace, use Document.clone instead
         """
         if not mets_url:
             return cls.create(emitter=emitter)
         mets_path = cls._to_path(mets_url)
 
+        if lazy:
+            doc = cls(None, emitter=emitter, original_url=str(mets_url))
+            doc._summary = MetsSummary.parse(mets_path)
+            # Resolved before changing the cwd, the loading thread would resolve a relative path against the new one
+            mets_path = mets_path.resolve()
+            with cls.io_lock:
+                os.chdir(doc._summary.directory)
+            loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='load')
+            doc._loading = loader.submit(cls._load_workspace, mets_path)
+            loader.shutdown(wait=False)
+            doc._empty = False
+            return doc
+
         workspace = Resolver().workspace_from_url(str(mets_path), download=False)
         doc = cls(workspace, emitter=emitter, original_url=str(mets_url))
         doc._empty = False
         return doc
 
+    @classmethod
+    def _load_workspace(cls, mets_path: Path) -> Tuple[Workspace, PageFileIndex]:
+        workspace = Resolver().workspace_from_url(str(mets_path), download=False)
+        return workspace, cls._build_page_file_index(workspace)
+
+    @property
+    def workspace(self) -> Optional[Workspace]:
+        """
+        The ocrd Workspace, waits for it if it is still loading in the background
+        """
+        if self._loading is not None:
+            with self._loading_lock:
+                if self._loading is not None:
+                    workspace, page_file_index = self._loading.result()
+                    self._workspace, self._loading, self._summary = workspace, None, None
+                    if self._page_file_index is None:
+                        self._page_file_index = page_file_index
+        return self._workspace
+
+    @workspace.setter
+    def workspace(self, workspace: Optional[Workspace]) -> None:
+        with self._loading_lock:
+            self._workspace, self._loading, self._summary = workspace, None, None
+
+    @property
+    def loading(self) -> bool:
+        """
+        Whether the Workspace is still loading in the background
+        """
+        return self._loading is not None and not self._loading.done()
+
+    def when_loaded(self, callback: Callable[[Document], None]) -> None:
+        """
+        Calls callback(document) once the Workspace is loaded, from the loading thread or right away if already loaded
+        """
+        if self._loading is None:
+            callback(self)
+        else:
+            self._loading.add_done_callback(lambda _future: callback(self))
+
+    def _pending_summary(self) -> Optional[MetsSummary]:
+        """
+        The MetsSummary, as long as the Workspace was not needed yet
+        """
+        return self._summary if self._loading is not None else None
+
     @classmethod
     def clone(cls, mets_url: Union[Path, str], emitter: EventCallBack = None, editable: bool = True) -> Document:
         """
         Clones a project (mets.xml and all used files) to a temporary directory for editing
+
+        The local files get reflinked where the file system allows and copied otherwise, so writing to the clone never
+        changes the original. Remote files get downloaded on first access.
         """
         doc = cls(cls._clone_workspace(mets_url), emitter=emitter, editable=editable, original_url=str(mets_url))
         doc._empty = False
@@ -102,13 +228,82 @@ class Document:
         """
         log = getLogger('ocrd_browser.model.document.Document._clone_workspace')
         mets_url = cls._strip_local(mets_url, disallow_remote=False)
-        temporary_workspace = mkdtemp(prefix='browse-ocrd-clone-')
-        cls.temporary_workspaces.append(temporary_workspace)
-        # TODO download = False and lazy loading would be nice for responsiveness
+        remote = urlparse(mets_url).scheme not in ('', 'file')
+        source_directory = Path(mets_url).parent
+        temporary_workspace = cls._temporary_workspace(None if remote else Path(mets_url))
         log.info("Cloning '%s' to '%s'", mets_url, temporary_workspace)
-        workspace = Resolver().workspace_from_url(mets_url=mets_url, dst_dir=temporary_workspace, download=True)
+        # Remote and missing files get downloaded by Workspace.download_file on first access
+        workspace = Resolver().workspace_from_url(mets_url=mets_url, dst_dir=temporary_workspace, download=False)
+        if remote:
+            return workspace
+        methods: Dict[str, int] = {}
+        for file in workspace.mets.find_files():
+            source = source_directory / file.local_filename if file.local_filename else None
+            if source is None or not source.is_file():
+                continue
+            destination = Path(temporary_workspace) / file.local_filename
+            if destination.exists():
+                continue
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            method = reflink_or_copy(source, destination)
+            methods[method] = methods.get(method, 0) + 1
+        log.info('Cloned files by %s', ', '.join('{}: {}'.format(method, n) for method, n in methods.items()))
         return workspace
 
+    @classmethod
+    def _temporary_workspace(cls, mets_path: Optional[Path]) -> str:
+        """
+        Creates a directory for a clone of the workspace of mets_path
+
+        Next to the workspace if its file system supports reflinks, as the system temp directory is often another
+        file system, where all files would get copied. Otherwise in the system temp directory, so no directories
+        show up next to the workspace. Clones left behind by processes that crashed get removed on the way.
+        """
+        log = getLogger('ocrd_browser.model.document.Document._temporary_workspace')
+        prefix = 'browse-ocrd-clone-{}-'.format(os.getpid())
+        temporary_workspace = None
+        if mets_path is not None:
+            directory = mets_path.resolve().parent.parent
+            try:
+                cls._remove_abandoned_clones(directory)
+                temporary_workspace = mkdtemp(prefix='.' + prefix, dir=directory)
+                probe = Path(temporary_workspace) / '.reflink'
+                if reflink(mets_path, probe):
+                    probe.unlink()
+                else:
+                    os.rmdir(temporary_workspace)
+                    temporary_workspace = None
+            except OSError as e:
+                log.warning("Could not clone next to '%s', files get copied to the temp directory: %s", mets_path, e)
+                temporary_workspace = None
+        if temporary_workspace is None:
+            cls._remove_abandoned_clones(Path(gettempdir()))
+            temporary_workspace = mkdtemp(prefix=prefix)
+        cls.temporary_workspaces.append(temporary_workspace)
+        return temporary_workspace
+
+    @staticmethod
+    def _remove_abandoned_clones(directory: Path) -> None:
+        """
+        Deletes the clones in directory whose process is not running anymore, like after a crash
+        """
+        if os.name != 'posix':
+            # os.kill(pid, 0) would terminate the process on Windows
+            return
+        for clone in directory.glob('*browse-ocrd-clone-*'):
+            match = re.fullmatch(r'\.?browse-ocrd-clone-(\d+)-\w+', clone.name)
+            if not match or not clone.is_dir():
+                continue
+            try:
+                os.kill(int(match.group(1)), 0)
+            except ProcessLookupError:
+                getLogger('ocrd_browser.model.document.Document._remove_abandoned_clones').info(
+                    "Removing abandoned clone '%s'", clone)
+                shutil.rmtree(clone, ignore_errors=True)
+            except OSError:
+                # Running, but owned by another user
+                pass
+
     @check_editable
     def save(self, backup_directory: Union[bool, Path, str] = True) -> None:
         if not self._original_url:
@@ -116,40 +311,105 @@ class Document:
         self.save_as(self._original_url, backup_directory=backup_directory)
 
     def save_as(self, mets_url: Union[Path, str], backup_directory: Union[bool, Path, str] = True) -> None:
+        """
+        Saves the workspace to mets_url, only files that are new or changed (by size and modification time) get copied
+
+        The files get copied in parallel ([Save] workers), the mets.xml gets replaced atomically after all files are
+        copied, then files that only the replaced mets.xml referenced get deleted.
+        With backup_directory, an existing workspace gets backed up there first (True derives a .bak.* directory name):
+        [Save] backup = link snapshots it with reflinks or hard links, move moves it away.
+        """
         log = getLogger('ocrd_browser.model.document.Document.save_as')
         mets_path = self._to_path(mets_url)
 
         workspace_directory = mets_path.parent
-        if workspace_directory.exists():
-            if backup_directory:
-                if isinstance(backup_directory, bool):
-                    backup_directory = self._derive_backup_directory(workspace_directory)
-                shutil.move(str(workspace_directory), str(backup_directory))
+        if workspace_directory.exists() and backup_directory:
+            if isinstance(backup_directory, bool):
+                backup_directory = self._derive_backup_directory(workspace_directory)
+            if SettingsFactory.settings().save.backup == 'link':
+                # Saving replaces files instead of writing into them, so hard links in the backup keep the old content
+                methods = snapshot(workspace_directory, backup_directory)
+                log.info('Backed up to %s by %s', backup_directory, ', '.join('{}: {}'.format(m, n) for m, n in methods.items()))
             else:
-                shutil.rmtree(str(workspace_directory))
+                shutil.move(str(workspace_directory), str(backup_directory))
 
-        mets_basename = mets_path.name
         workspace_directory.mkdir(parents=True, exist_ok=True)
         self._emit('document_saving', 0, None)
 
-        saved_space = Resolver().workspace_from_url(mets_url=self.workspace.mets_target, mets_basename=mets_basename,
-                                                    download=False, clobber_mets=True, dst_dir=workspace_directory)
-        saved_files = list(saved_space.mets.find_files())
-        for n, f in enumerate(saved_files):
-            f = saved_space.download_file(f)
-            self._emit('document_saving', n / len(saved_files), f)
+        previous_files = self._local_filenames(OcrdMets(filename=str(mets_path))) if mets_path.exists() else set()
+        # Local files inside the workspace get copied, remote, missing and outside ones get downloaded like ocrd does
+        copies: List[Tuple[OcrdFile, Path]] = []
+        downloads: List[OcrdFile] = []
+        for f in self.workspace.mets.find_files():
+            destination = self._within(workspace_directory, f.local_filename) if f.local_filename else None
+            if destination and self.path(f).exists():
+                copies.append((f, destination))
+            else:
+                downloads.append(f)
+        total = len(copies) + len(downloads) + 1
+        copied = 0
+        with ThreadPoolExecutor(max_workers=SettingsFactory.settings().save.workers, thread_name_prefix='save') as pool:
+            futures = {pool.submit(copy_if_changed, self.path(f), destination): f for f, destination in copies}
+            for n, future in enumerate(as_completed(futures), start=1):
+                copied += future.result()
+                self._emit('document_saving', n / total, futures[future])
+
+        replace_atomically(self.workspace.mets_target, mets_path)
+        for local_filename in previous_files - self._local_filenames(self.workspace.mets):
+            path = self._within(workspace_directory, local_filename)
+            if path is None:
+                log.warning("Not deleting '%s', it is outside of %s", local_filename, workspace_directory)
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        log.info('Copied %d of %d files', copied, len(copies))
 
+        saved_space = Resolver().workspace_from_url(str(mets_path), download=False)
+        for n, f in enumerate(downloads, start=len(copies) + 1):
+            try:
+                saved = next(iter(saved_space.mets.find_files(ID=f.ID)))
+                if not saved.url and f.local_filename and self.workspace.baseurl:
+                    # Missing here and not remote: fetch it from the workspace this one was loaded or cloned from
+                    saved.url = '%s/%s' % (self.workspace.baseurl, f.local_filename)
+                with self.io_lock:
+                    saved_space.download_file(saved)
+            except Exception as e:
+                log.warning("Could not save '%s': %s", f.ID, e)
+            self._emit('document_saving', n / total, f)
         self._emit('document_saving', 1, None)
         self._emit('document_saved', Document(saved_space, self.emitter))
         self._original_url = str(mets_path)
         self._modified = False
         log.info('Saved to %s', self._original_url)
 
+    @staticmethod
+    def _within(directory: Path, local_filename: str) -> Optional[Path]:
+        """
+        directory / local_filename, None if that is outside of directory (absolute or leaving it by ..)
+
+        Only the parent directory gets resolved, so a symlink itself counts as inside.
+        """
+        root = directory.resolve()
+        path = root / local_filename
+        parent = path.parent.resolve()
+        if parent != root and root not in parent.parents:
+            return None
+        return parent / path.name
+
+    @staticmethod
+    def _local_filenames(mets: OcrdMets) -> Set[str]:
+        return {f.local_filename for f in mets.find_files() if f.local_filename}
+
     @property
     def directory(self) -> Path:
         """
         Get workspace directory as a Path object
         """
+        summary = self._pending_summary()
+        if summary:
+            return summary.directory
         return Path(self.workspace.directory) if self.workspace else None
 
     @property
@@ -196,10 +456,26 @@ class Document:
 
         TODO: This is unsorted (or sorted in document order) use @ORDER attribute or keep document order in sync with the correct order
 
+        Built once and kept in sync by the mutation methods, so do not modify the returned list
+
         @return: List[str]
         """
-        # noinspection PyTypeChecker
-        return cast(List[str], self.workspace.mets.physical_pages if self.workspace else [])
+        if self._page_ids is None:
+            summary = self._pending_summary()
+            if summary:
+                self._page_ids = list(summary.page_ids)
+            else:
+                # noinspection PyTypeChecker
+                self._page_ids = list(cast(List[str], self.workspace.mets.physical_pages if self.workspace else []))
+        return self._page_ids
+
+    def page_position(self, page_id: str) -> Optional[int]:
+        """
+        Index of page_id in page_ids, None if there is no such page
+        """
+        if self._page_positions is None:
+            self._page_positions = {page_id: n for n, page_id in enumerate(self.page_ids)}
+        return self._page_positions.get(page_id)
 
     @property
     def file_groups(self) -> List[FileGroupHandle]:
@@ -208,15 +484,41 @@ class Document:
 
         @return: List[FileGroupHandle]
         """
-        distinct_groups: Dict[FileGroupHandle, None] = {}
-        # Using dict keys as a workaround for an ordered set
-        for el in self.xpath('mets:fileSec/mets:fileGrp[@USE]/mets:file[@MIMETYPE]'):
-            distinct_groups[FileGroupHandle(el.getparent().get('USE'), el.get('MIMETYPE'))] = None
+        return list(self.file_group_stats.keys())
 
-        return list(distinct_groups.keys())
+    @property
+    def file_group_stats(self) -> Dict[FileGroupHandle, FileGroupStats]:
+        """
+        Number of files and number of pages with files for each distinct file_group/mimetype pair, in mets:fileSec order
+
+        Built once and kept in sync by the mutation methods, groups added meanwhile come last.
+
+        Example:
+        doc.file_group_stats[FileGroupHandle('OCR-D-IMG', 'image/tiff')].pages == len(doc.page_ids)
+        """
+        summary = self._pending_summary()
+        if summary:
+            return summary.file_group_stats
+        if self._file_group_stats is None:
+            self._file_group_stats = self._build_file_group_stats()
+        return self._file_group_stats
+
+    def _build_file_group_stats(self) -> Dict[FileGroupHandle, FileGroupStats]:
+        files: Dict[FileGroupHandle, int] = {}
+        for el in self.xpath('mets:fileSec/mets:fileGrp[@USE]/mets:file[@MIMETYPE]'):
+            handle = FileGroupHandle(el.getparent().get('USE'), el.get('MIMETYPE'))
+            files[handle] = files.get(handle, 0) + 1
+        pages: Dict[FileGroupHandle, int] = {}
+        for groups in self.page_file_index.values():
+            for handle in groups:
+                pages[handle] = pages.get(handle, 0) + 1
+        return {handle: FileGroupStats(count, pages.get(handle, 0)) for handle, count in files.items()}
 
     @property
     def title(self) -> str:
+        summary = self._pending_summary()
+        if summary:
+            return summary.unique_identifier or '<unnamed>'
         return str(self.workspace.mets.unique_identifier) if self.workspace and self.workspace.mets.unique_identifier else '<unnamed>'
 
     def get_file_index(self) -> Dict[str, OcrdFile]:
@@ -234,8 +536,7 @@ class Document:
                 file.static_page_id = None
                 file_index[file.ID] = file
 
-        file_pointers: List[Element] = self.xpath(
-            'mets:structMap[@TYPE="PHYSICAL"]/mets:div[@TYPE="physSequence"]/mets:div[@TYPE="page"]/mets:fptr')
+        file_pointers: List[Element] = self.xpath(FILE_POINTER_XPATH)
         for file_pointer in file_pointers:
             file_id = file_pointer.get('FILEID')
             page_id = file_pointer.getparent().get('ID')
@@ -246,19 +547,137 @@ class Document:
 
         return file_index
 
+    @property
+    def page_file_index(self) -> PageFileIndex:
+        """
+        All OcrdFiles by page_id and FileGroupHandle(fileGrp, mimetype), built once and kept in sync by the mutation methods
+
+        Example:
+        page17_images = doc.page_file_index['PHYS_0017'][FileGroupHandle('OCR-D-IMG', 'image/tiff')]
+        """
+        # Takes over the index built in the background by Document.load(lazy=True)
+        workspace = self.workspace
+        if self._page_file_index is None:
+            self._page_file_index = self._build_page_file_index(workspace)
+        return self._page_file_index
+
+    @staticmethod
+    def _build_page_file_index(workspace: Optional[Workspace]) -> PageFileIndex:
+        """
+        Builds the page file index in one pass over mets:structMap and one pass over mets:fileSec
+        """
+        index: PageFileIndex = {}
+        if not workspace:
+            return index
+        page_ids_by_file_id: Dict[str, List[str]] = {}
+        file_pointer: Element
+        # noinspection PyProtectedMember
+        for file_pointer in workspace.mets._tree.getroot().xpath(FILE_POINTER_XPATH, namespaces=NS):
+            page_ids_by_file_id.setdefault(file_pointer.get('FILEID'), []).append(file_pointer.getparent().get('ID'))
+
+        # Iterating in mets:fileSec order keeps the order of mets.find_files(pageId=...)
+        for file in workspace.mets.find_files():
+            for page_id in page_ids_by_file_id.get(file.ID, []):
+                index.setdefault(page_id, {}).setdefault(FileGroupHandle(file.fileGrp, file.mimetype), []).append(file)
+        return index
+
+    def _invalidate_page(self, page_id: str) -> None:
+        """
+        Patches all page related caches after a modification of page_id
+        """
+        self.page_cache.discard_where(lambda key: key[0] == page_id)
+        self._reindex_page(page_id)
+        self._invalidate_page_order()
+
+    def _invalidate_all(self) -> None:
+        self.page_cache.clear()
+        self._page_file_index = None
+        self._file_group_stats = None
+        self._invalidate_page_order()
+
+    def _invalidate_page_order(self) -> None:
+        self._page_ids = None
+        self._page_positions = None
+
+    def _reindex_page(self, page_id: str) -> None:
+        """
+        Patches the page file index and the file group stats for a single page after a modification
+        """
+        if self._page_file_index is None:
+            self._file_group_stats = None
+            return
+        groups: Dict[FileGroupHandle, List[OcrdFile]] = {}
+        for file in self.workspace.mets.find_files(pageId=page_id):
+            groups.setdefault(FileGroupHandle(file.fileGrp, file.mimetype), []).append(file)
+        self._patch_file_group_stats(self._page_file_index.get(page_id, {}), groups)
+        if groups:
+            self._page_file_index[page_id] = groups
+        else:
+            self._page_file_index.pop(page_id, None)
+
+    def _patch_file_group_stats(self, old_groups: Dict[FileGroupHandle, List[OcrdFile]],
+                                new_groups: Dict[FileGroupHandle, List[OcrdFile]]) -> None:
+        """
+        Patches the file group stats with the difference between the files of a page before and after a modification
+        """
+        if self._file_group_stats is None:
+            return
+        # FileGroupHandle -> [difference of files, difference of pages]
+        changes: Dict[FileGroupHandle, List[int]] = {}
+        old_files = {(file.ID, handle): file for handle, files in old_groups.items() for file in files}
+        new_files = {(file.ID, handle) for handle, files in new_groups.items() for file in files}
+        for (file_id, handle), file in old_files.items():
+            # noinspection PyProtectedMember
+            if (file_id, handle) not in new_files and file._el.getparent() is None:
+                # Removed from mets:fileSec, not only from the page
+                changes.setdefault(handle, [0, 0])[0] -= 1
+        for file_id, handle in new_files.difference(old_files.keys()):
+            changes.setdefault(handle, [0, 0])[0] += 1
+        for handle in old_groups.keys() - new_groups.keys():
+            changes.setdefault(handle, [0, 0])[1] -= 1
+        for handle in new_groups.keys() - old_groups.keys():
+            changes.setdefault(handle, [0, 0])[1] += 1
+
+        for handle, (files, pages) in changes.items():
+            stats = self._file_group_stats.get(handle, FileGroupStats(0, 0))
+            stats = FileGroupStats(stats.files + files, stats.pages + pages)
+            if stats.files > 0:
+                self._file_group_stats[handle] = stats
+            else:
+                self._file_group_stats.pop(handle, None)
+
+    def find_page_files(self, page_id: str, file_group: str = None, mimetype: str = None) -> List[OcrdFile]:
+        """
+        Looks up the OcrdFiles of a page in the page file index (without downloading them)
+
+        file_group and mimetype follow the OcrdMets.find_files semantics: None matches all, '//' prefixes a regex
+        """
+        groups = self.page_file_index.get(page_id, {})
+        if file_group is not None and mimetype is not None and not file_group.startswith(REGEX_PREFIX) and not mimetype.startswith(REGEX_PREFIX):
+            return list(groups.get(FileGroupHandle(file_group, mimetype), []))
+        return [
+            file
+            for handle, files in groups.items() if _matches(file_group, handle.group) and _matches(mimetype, handle.mime)
+            for file in files
+        ]
+
     def get_image_paths(self, file_group: FileGroupHandle) -> Dict[str, Path]:
         """
         Builds a Dict ID->Path for all page_ids fast
 
-        More precisely:  fast = Faster than iterating over page_ids and using mets.get_physical_page_for_file for each entry
+        More precisely:  fast = One dict lookup per page in page_file_index
         """
         log = getLogger('ocrd_browser.model.document.Document.get_image_paths')
         image_paths = {}
-        file_index = self.get_file_index()
+        summary = self._pending_summary()
         for page_id in self.page_ids:
-            images = [image for image in file_index.values() if image.static_page_id == page_id and file_group.match(image)]
+            if summary:
+                images = summary.page_files.get(page_id, {}).get(file_group, [])
+            else:
+                files = self.page_file_index.get(page_id, {}).get(file_group, [])
+                images = [file.local_filename for file in files if file.local_filename]
             if len(images) > 0:
-                image_paths[page_id] = self.directory.joinpath(images[0].local_filename)
+                image_paths[page_id] = self.directory.joinpath(images[0])
             else:
                 log.warning('Found no images for PAGE %s and fileGrp %s', page_id, file_group)
                 image_paths[page_id] = None
@@ -275,10 +694,9 @@ class Document:
         @return: Tuple[str, int]
         """
         page_nr = len(self.page_ids) + 1
-        page_ids = self.page_ids
         while page_nr < 9999:
             page_id = template_page_id.format(**{'page_nr': page_nr})
-            if page_id not in page_ids:
+            if self.page_position(page_id) is None:
                 return page_id, page_nr
             page_nr += 1
 
@@ -293,32 +711,65 @@ class Document:
         """
         if not page_id:
             return []
-        try:
-            index = self.page_ids.index(page_id)
-        except ValueError:
+        index = self.page_position(page_id)
+        if index is None:
             return []
         index = index - index % page_qty
         return self.page_ids[index:index + page_qty]
 
+    def page_ids_around(self, page_id: str, before: int, after: int) -> List[str]:
+        """
+        Page_ids of up to `after` following and `before` preceding pages of page_id, nearest first and following before preceding
+        @param page_id:
+        @param before:
+        @param after:
+        @return:
+        """
+        page_ids = self.page_ids
+        index = self.page_position(page_id)
+        if index is None:
+            return []
+        return page_ids[index + 1:index + 1 + after] + page_ids[max(0, index - before):index][::-1]
+
     def page_for_id(self, page_id: str, file_group: str) -> Optional['Page']:
         if not page_id:
             return None
         return Page(self, page_id, file_group)
 
     def files_for_page_id(self, page_id: str, file_group: str = None, mimetype: str = None) -> List[OcrdFile]:
-        with pushd_popd(self.workspace.directory):
-            files: List[OcrdFile] = self.workspace.mets.find_files(fileGrp=file_group, pageId=page_id,
-                                                                   mimetype=mimetype)
-            files = [self.workspace.download_file(file) for file in files]
+        with self.io_lock, pushd_popd(self.workspace.directory):
+            files = [self.workspace.download_file(file) for file in self.find_page_files(page_id, file_group, mimetype)]
             return files
 
     def page_for_file(self, page_file: OcrdFile) -> PcGtsType:
         # cd and silence Warning: Value "ocrd-cis-word-alignment" ... does not match xsd enumeration restriction on TextDataTypeSimpleType
-        with pushd_popd(self.workspace.directory), SilencedStreams(False, True):
+        with self.io_lock, pushd_popd(self.workspace.directory), SilencedStreams(False, True):
             return page_from_file(page_file)
 
+    def cached_page_for_file(self, page_file: OcrdFile, page_id: str, file_group: Optional[str]) -> PcGtsType:
+        """
+        Like page_for_file, but shares the parsed PcGtsType of (page_id, file_group) between all callers via page_cache
+
+        The cached PcGtsType is used as long as page_file is unchanged on disk (same path and mtime)
+        """
+        path = self.path(page_file)
+        try:
+            stat = path.stat()
+            mtime: Optional[int] = stat.st_mtime_ns
+            # A PcGtsType made up for an image is tiny
+            size = PC_GTS_BYTES_PER_FILE_BYTE * stat.st_size if page_file.mimetype == MIMETYPE_PAGE else 0
+        except OSError:
+            mtime, size = None, 0
+        key = (page_id, file_group)
+        cached = self.page_cache.get(key)
+        if cached and cached.path == path and cached.mtime == mtime and mtime is not None:
+            return cached.pc_gts
+        pc_gts = self.page_for_file(page_file)
+        self.page_cache.put(key, CachedPcGts(path, mtime, pc_gts, size))
+        return pc_gts
+
     def resolve_image(self, image_file: OcrdFile) -> Image:
-        with pushd_popd(self.workspace.directory):
+        with self.io_lock, pushd_popd(self.workspace.directory):
             pil_image = Image.open(self.workspace.download_file(image_file).local_filename)
             # pil_image.load()
             return pil_image
@@ -337,23 +788,30 @@ class Document:
                 set(ordered_page_ids).difference(set(old_page_ids)),
                 set(self.page_ids).difference(set(ordered_page_ids))
             ))
+        if len(ordered_page_ids) != len(set(ordered_page_ids)):
+            raise ValueError('page_ids not unique: {}'.format(ordered_page_ids))
         log.info('Reordering %s to %s', old_page_ids, ordered_page_ids)
         page_sequence: Element = self.xpath('mets:structMap[@TYPE="PHYSICAL"]/mets:div[@TYPE="physSequence"]')[0]
 
-        ordered_divs = []
-        for page_id in ordered_page_ids:
-            divs = page_sequence.xpath('mets:div[@TYPE="page"][@ID="%s"]' % page_id, namespaces=NS)
-            if divs:
-                ordered_divs.append(divs[0])
-                page_sequence.remove(divs[0])
-
-        if len(page_sequence) > 0:
-            raise RuntimeError('page_sequence not empty, still has: {}'.format(page_sequence.getchildren()))
-
-        for div in ordered_divs:
-            page_sequence.append(div)
-
-        old_to_new = dict(zip(old_page_ids, self.page_ids))
+        divs: Dict[str, Element] = {}
+        others = []
+        for child in page_sequence:
+            if child.tag == '{%s}div' % NS['mets'] and child.get('TYPE') == 'page':
+                divs[child.get('ID')] = child
+            else:
+                others.append(child)
+        ordered_divs = [divs.pop(page_id) for page_id in ordered_page_ids if page_id in divs]
+        if others or divs:
+            raise RuntimeError('page_sequence not empty, still has: {}'.format(others + list(divs.values())))
+
+        # Moves the elements in one pass, including the whitespace after them
+        page_sequence[:] = ordered_divs
+
+        old_to_new = dict(zip(old_page_ids, ordered_page_ids))
+        self._page_ids = list(ordered_page_ids)
+        self._page_positions = {page_id: n for n, page_id in enumerate(self._page_ids)}
+        # With METS caching (OCRD_METS_CACHING) OcrdMets.physical_pages keeps the old order, refresh_caches is the only
+        # public way to update it. It rebuilds all caches, but does nothing if caching is disabled, the default.
         self.workspace.mets.refresh_caches()
         self.save_mets()
         self._emit('document_changed', 'reordered', old_to_new)
@@ -366,6 +824,7 @@ class Document:
         for image_file in image_files:
             self.workspace.remove_file(image_file, force=True, keep_file=False, page_recursive=True,
                                        page_same_group=True)
+        self._invalidate_page(page_id)
         self.save_mets()
         self._emit('document_changed', 'page_changed', [page_id])
         return image_files
@@ -373,15 +832,66 @@ class Document:
     def save_mets(self) -> None:
         if not self._editable:
             raise PermissionError('Can not modify Document with _editable == False')
+        if self._batch_depth:
+            self._batch_unsaved = True
+            return
         self.workspace.save_mets()
         self._modified = True
 
+    @contextmanager
+    def batch(self) -> Iterator[Document]:
+        """
+        Groups modifications, so the mets.xml gets written once and the UI gets updated once at the end
+
+        Consecutive document_changed events of the same subtype get merged into one with all affected page ids.
+        Batches nest, only the outermost one saves and emits. There is no rollback: if the block raises, the
+        modifications made so far still get saved and emitted, so mets.xml, UI and Document stay in sync.
+
+        Example:
+        with doc.batch():
+            for page_id in page_ids:
+                doc.delete_page(page_id)
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self._commit_batch()
+
+    def _commit_batch(self) -> None:
+        changes, self._batch_changes = self._batch_changes, []
+        if self._batch_unsaved:
+            self._batch_unsaved = False
+            self.save_mets()
+        for subtype, page_changes in changes:
+            if isinstance(page_changes, list):
+                page_changes = list(dict.fromkeys(page_changes))
+            self._emit('document_changed', subtype, page_changes)
+
+    def _defer_change(self, subtype: str, page_changes: PageChanges) -> None:
+        """
+        Merges the change into the last deferred one of the same subtype, keeps the order of different subtypes
+        """
+        if self._batch_changes and self._batch_changes[-1][0] == subtype:
+            previous = self._batch_changes[-1][1]
+            if isinstance(previous, dict) and isinstance(page_changes, dict):
+                # Two reorders: where did the page at each position end up after both?
+                previous.update({old: page_changes.get(new, new) for old, new in previous.items()})
+            elif isinstance(previous, list) and isinstance(page_changes, list):
+                # Duplicates get removed in _commit_batch
+                previous.extend(page_changes)
+            return
+        self._batch_changes.append((subtype, copy(page_changes)))
+
     @check_editable
     def delete_page(self, page_id: str) -> None:
         files = self.workspace.mets.find_files(pageId=page_id, local_only=True)
         for file in files:
             self.workspace.remove_file(file, force=False, keep_file=False)
         self.workspace.mets.remove_physical_page(page_id)
+        self._invalidate_page(page_id)
         self.save_mets()
         self._emit('document_changed', 'page_deleted', [page_id])
 
@@ -395,6 +905,7 @@ class Document:
         current_file = self.workspace.add_file(file_group, ID=file_id, mimetype=mimetype, force=True,
                                                content=image_bytes,
                                                local_filename=str(local_filename), pageId=page_id)
+        self._invalidate_page(page_id)
         self._empty = False
         self.save_mets()
         self._emit('document_changed', 'page_added', [page_id])
@@ -426,11 +937,15 @@ class Document:
                 self.workspace = Resolver().workspace_from_nothing(directory=None, mets_basename='mets.xml')
         else:
             self.workspace = Resolver().workspace_from_url(self.baseurl_mets)
+        self._invalidate_all()
         self._editable = editable
         # self._empty = False
         # self._modified = False
 
     def _emit(self, event: str, *args: Any) -> None:
+        if self._batch_depth and event == 'document_changed':
+            self._defer_change(*args)
+            return
         if self.emitter is not None:
             self.emitter(event, *args)
 
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import unquote
+
+from lxml.etree import XMLParser, parse
+from ocrd_models.constants import IDENTIFIER_PRIORITY, NAMESPACES as NS
+
+from ocrd_browser.util.file_groups import FileGroupHandle, FileGroupStats
+
+__all__ = ['MetsSummary']
+
+METS = '{%s}' % NS['mets']
+HREF = '{%s}href' % NS['xlink']
+IDENTIFIER = '{%s}identifier' % NS['mods']
+FILE_GRP = METS + 'fileGrp'
+FILE = METS + 'file'
+FLOCAT = METS + 'FLocat'
+STRUCT_MAP = METS + 'structMap'
+DIV = METS + 'div'
+FPTR = METS + 'fptr'
+
+# page_id -> FileGroupHandle -> local filenames
+PageFiles = Dict[str, Dict[FileGroupHandle, List[str]]]
+
+
+class MetsSummary(NamedTuple):
+    """
+    What the window and the page list need from a mets.xml: identifier, page order, file groups and files per page
+
+    Gets parsed in one streaming pass without building a tree of the document, so it is available long before
+    ocrd's Workspace for huge METS files.
+    """
+    directory: Path
+    page_ids: List[str]
+    # In mets:fileSec order, like Document.file_group_stats
+    file_group_stats: Dict[FileGroupHandle, FileGroupStats]
+    page_files: PageFiles
+    unique_identifier: Optional[str]
+
+    @property
+    def file_groups(self) -> List[FileGroupHandle]:
+        return list(self.file_group_stats.keys())
+
+    @classmethod
+    def parse(cls, mets_path: Union[Path, str]) -> MetsSummary:
+        target = parse(str(mets_path), XMLParser(target=_SummaryTarget(), huge_tree=True))
+        page_files: PageFiles = {}
+        pages: Dict[FileGroupHandle, int] = {}
+        for page_id, file_ids in target.file_ids_by_page.items():
+            groups = page_files.setdefault(page_id, {})
+            files = sorted(target.files[file_id] for file_id in file_ids if file_id in target.files)
+            # In mets:fileSec order, like Document.page_file_index
+            for _position, handle, local_filename in files:
+                if local_filename:
+                    groups.setdefault(handle, []).append(local_filename)
+            for handle in {handle for _position, handle, _local_filename in files}:
+                pages[handle] = pages.get(handle, 0) + 1
+        file_group_stats = {handle: FileGroupStats(count, pages.get(handle, 0)) for handle, count in target.file_counts.items()}
+        identifiers = target.identifiers
+        unique_identifier = next((identifiers[t] for t in IDENTIFIER_PRIORITY if t in identifiers), None)
+        # Resolved like ocrd resolves Workspace.directory
+        directory = Path(mets_path).resolve().parent
+        return cls(directory, target.page_ids, file_group_stats, page_files, unique_identifier)
+
+
+class _SummaryTarget:
+    """
+    lxml parser target collecting the parts of a MetsSummary
+
+    Only gets start and end tags (and the text of mods:identifier), so no elements get created at all.
+    """
+
+    def __init__(self) -> None:
+        # file ID -> (position in mets:fileSec, FileGroupHandle, local filename)
+        self.files: Dict[str, Tuple[int, FileGroupHandle, Optional[str]]] = {}
+        # Number of files per file group, in mets:fileSec order
+        self.file_counts: Dict[FileGroupHandle, int] = {}
+        self.page_ids: List[str] = []
+        self.file_ids_by_page: Dict[str, List[str]] = {}
+        # First mods:identifier per type, like OcrdMets.unique_identifier
+        self.identifiers: Dict[str, str] = {}
+        # One handle per (USE, MIMETYPE) instead of one per file
+        self._handles: Dict[Tuple[str, str], FileGroupHandle] = {}
+        self._groups: List[str] = []
+        # ID, MIMETYPE, local copy and first local URL of the open mets:file
+        self._file: Optional[List[Any]] = None
+        # (tag, TYPE) of the open mets:structMap and mets:div elements
+        self._structure: List[Tuple[str, Optional[str]]] = []
+        # The open page mets:div: depth in _structure and its file IDs
+        self._page: Optional[Tuple[int, List[str]]] = None
+        self._identifier: Optional[Tuple[str, List[str]]] = None
+
+    def start(self, tag: str, attributes: Dict[str, str]) -> None:
+        if tag == FLOCAT:
+            if self._file is not None:
+                self._location(self._file, attributes)
+        elif tag == FPTR:
+            if self._page is not None:
+                self._page[1].append(attributes.get('FILEID'))
+        elif tag == FILE:
+            self._file = [attributes.get('ID'), attributes.get('MIMETYPE'), None, None]
+        elif tag == DIV or tag == STRUCT_MAP:
+            type_ = attributes.get('TYPE')
+            if tag == DIV and type_ == 'page' and self._structure[-2:] == [(STRUCT_MAP, 'PHYSICAL'), (DIV, 'physSequence')]:
+                page_id = attributes.get('ID')
+                self.page_ids.append(page_id)
+                self._page = (len(self._structure), self.file_ids_by_page.setdefault(page_id, []))
+            self._structure.append((tag, type_))
+        elif tag == FILE_GRP:
+            self._groups.append(attributes.get('USE'))
+        elif tag == IDENTIFIER:
+            self._identifier = (attributes.get('type'), [])
+
+    def end(self, tag: str) -> None:
+        if tag == FILE:
+            self._end_file()
+        elif tag == DIV or tag == STRUCT_MAP:
+            self._structure.pop()
+            if self._page is not None and self._page[0] == len(self._structure):
+                self._page = None
+        elif tag == FILE_GRP:
+            self._groups.pop()
+        elif tag == IDENTIFIER and self._identifier is not None:
+            type_, text = self._identifier
+            self.identifiers.setdefault(type_, ''.join(text))
+            self._identifier = None
+
+    def data(self, data: str) -> None:
+        if self._identifier is not None:
+            self._identifier[1].append(data)
+
+    def close(self) -> _SummaryTarget:
+        return self
+
+    @staticmethod
+    def _location(file: List[Any], attributes: Dict[str, str]) -> None:
+        """
+        Prefers the local copy (LOCTYPE="OTHER" OTHERLOCTYPE="FILE") like ocrd, falls back to a local URL like older ocrd
+        """
+        href = attributes.get(HREF)
+        if attributes.get('LOCTYPE') == 'OTHER' and attributes.get('OTHERLOCTYPE') == 'FILE':
+            if file[2] is None:
+                file[2] = href or ''
+        # Cheaper than urlparse, which adds up for hundreds of thousands of files
+        elif file[3] is None and href and (href.startswith('file://') or ':' not in href.split('/', 1)[0]):
+            file[3] = unquote(href[7:]) if href.startswith('file://') else href
+
+    def _end_file(self) -> None:
+        file_id, mimetype, local_copy, url = self._file or [None] * 4
+        self._file = None
+        group = self._groups[-1] if self._groups else None
+        if not group or not mimetype:
+            return
+        handle = self._handles.get((group, mimetype))
+        if handle is None:
+            handle = self._handles[(group, mimetype)] = FileGroupHandle(group, mimetype)
+        self.file_counts[handle] = self.file_counts.get(handle, 0) + 1
+        self.files[file_id] = (len(self.files), handle, local_copy if local_copy is not None else url)
@@ -4,6 +4,8 @@ from typing import List, Optional, Any, Tuple, Dict, Union, cast, Set, TYPE_CHEC
 from PIL.Image import Image
 from lxml.etree import ElementBase as Element
 from inspect import signature
+from itertools import count
+from weakref import finalize
 from deprecated import deprecated
 
 from ocrd import Workspace, OcrdFile, OcrdExif
@@ -11,6 +13,9 @@ from ocrd_utils import MIMETYPE_PAGE, getLogger, pushd_popd, VERSION as OCRD_VER
 from ocrd_models.ocrd_page import PcGtsType, PageType, MetadataType
 from ocrd_models.constants import NAMESPACES
 
+from ocrd_browser.util.cache import LruCacheView
+from ocrd_browser.util.image import ImagePyramid
+
 if TYPE_CHECKING:
     from ocrd_browser.model import Document
 
@@ -18,20 +23,42 @@ IMAGE_FROM_PAGE_FILENAME_SUPPORT = 'filename' in signature(Workspace.image_from_
 
 
 class Page:
+    """
+    The files of a page in a file group, images and PAGE-XML get loaded on first access
+
+    Decoded images live in the shared memory_cache() ([Cache] memory) only, least recently used ones get dropped and
+    are loaded again on the next access, so do not hold on to images or pyramids longer than needed.
+    The parsed PAGE-XML comes from Document.page_cache, which shares that budget, and is kept by the Page.
+    """
+    # ImagePyramids of the images of all pages by Page._key
+    _pyramids: LruCacheView[int, List[ImagePyramid]] = LruCacheView(lambda pyramids: sum(p.nbytes for p in pyramids))
+    _keys = count()
+
     def __init__(self, document: Document, id_: str, file_group: str):
         self.document = document
         self._id = id_
         self.file_group = file_group
-        self._pc_gts: Optional[PcGtsType] = None
-        self._images: Optional[List[Image]] = None
         self._image_files: Optional[List[OcrdFile]] = None
         self._page_file: Optional[OcrdFile] = None
+        self._pc_gts: Optional[PcGtsType] = None
+        # Unique for the lifetime of the process, unlike id(self)
+        self._key = next(self._keys)
+        finalize(self, Page._pyramids.discard, self._key)
 
     @property
     def images(self) -> List[Image]:
-        if self._images is None:
-            self._images = [self.document.resolve_image(f) for f in self.image_files]
-        return self._images
+        return [pyramid.image for pyramid in self.pyramids]
+
+    @property
+    def pyramids(self) -> List[ImagePyramid]:
+        """
+        An ImagePyramid for each of the images, for scaling them repeatedly
+        """
+        pyramids = self._pyramids.get(self._key)
+        if pyramids is None:
+            pyramids = [ImagePyramid(self.document.resolve_image(f)) for f in self.image_files]
+            self._pyramids.put(self._key, pyramids)
+        return pyramids
 
     @property
     def image_files(self) -> List[OcrdFile]:
@@ -73,15 +100,19 @@ class Page:
 
     @property
     def pc_gts(self) -> Optional[PcGtsType]:
+        """
+        The parsed PAGE-XML, taken from Document.page_cache on first access and kept as long as the Page is in use
+
+        Keeping it means changes made through it are never lost to an eviction and the file is not checked for
+        modifications on every access. The views get a new Page on page_changed / document_changed.
+        """
         if self._pc_gts is None:
             if self.page_file:
-                self._pc_gts = self.document.page_for_file(self.page_file)
+                self._pc_gts = self.document.cached_page_for_file(self.page_file, self.id, self.file_group)
             else:
                 image_files = self.image_files
                 if len(image_files) > 0:
-                    self._pc_gts = self.document.page_for_file(image_files[0])
-            if self._pc_gts is None:
-                self._pc_gts = False
+                    self._pc_gts = self.document.cached_page_for_file(image_files[0], self.id, self.file_group)
         return self._pc_gts or None
 
     def get_image(self, feature_selector: Union[str, Set[str]] = '', feature_filter: Union[str, Set[str]] = '', filename: str = '') -> Tuple[Image, Dict[str, Any], OcrdExif]:
@@ -100,7 +131,7 @@ class Page:
                 raise RuntimeError('Parameter filename not supported in ocrd version {}, at least 2.33.0 needed'.format(OCRD_VERSION))
 
         try:
-            with pushd_popd(ws.directory):
+            with self.document.io_lock, pushd_popd(ws.directory):
                 page_image, page_coords, page_image_info = ws.image_from_page(self.page, self.id, **kwargs)
         except Exception as e:
             log.exception(e)
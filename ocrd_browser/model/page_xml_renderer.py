@@ -20,10 +20,17 @@ from ocrd_models.ocrd_page import PcGtsType, PageType, BorderType, PrintSpaceTyp
 from ocrd_utils import coordinates_of_segment, getLogger, polygon_from_points, transform_coordinates
 
 from shapely.geometry import Polygon, Point, LineString
+from shapely.strtree import STRtree
 from shapely.validation import explain_validity
-from shapely import prepared
+from shapely import prepared, __version__ as shapely_version
+
+# Shapely 2 STRtree.query returns indices, Shapely 1.8 the geometries
+STRTREE_RETURNS_INDICES = int(shapely_version.split('.')[0]) >= 2
 
 RegionWithCoords = Union[RegionType, TextLineType, WordType, GlyphType, GraphemeType, PrintSpaceType, BorderType]
+Bounds = Tuple[float, float, float, float]
+Box = Tuple[int, int, int, int]
+Offset = Tuple[int, int]
 __all__ = ['PageXmlRenderer', 'RegionMap', 'Feature', 'Region']
 
 CLASSES = {
@@ -258,6 +265,7 @@ class RegionMap(RegionBase):
         super().__init__()
         self.nodes_by_region: Dict[Region, RegionNode] = {}
         self.region_by_id: Dict[str, Region] = {}
+        self._index: Optional[RegionIndex] = None
 
     def refetch(self, r: Region) -> Optional[Region]:
         return self.get(r.id) if r else None
@@ -280,6 +288,60 @@ class RegionMap(RegionBase):
             parent_region.append(node)
         else:
             self.children.append(node)
+        self._index = None
+
+    def build_index(self) -> None:
+        """
+        Builds the spatial index for find_regions, called when all regions are appended
+        """
+        self._index = RegionIndex(self)
+
+    def find_regions(self, p: Point) -> List[Region]:
+        """
+        Same result as RegionBase.find_regions, but looks up candidates in a spatial index
+        """
+        if self._index is None:
+            self.build_index()
+        return self._index.find_regions(p)
+
+
+class RegionIndex:
+    """
+    Bounding box index (STRtree) over all nodes of a region tree
+
+    Nodes are numbered in the pre-order RegionBase.find_regions walks them, so sorting by number restores that order.
+    """
+    def __init__(self, root: RegionBase):
+        self.nodes: List[RegionNode] = []
+        self.parents: List[int] = []
+        stack: List[Tuple[RegionNode, int]] = [(child, -1) for child in reversed(root.children)]
+        while stack:
+            node, parent = stack.pop()
+            self.nodes.append(node)
+            self.parents.append(parent)
+            stack.extend((child, len(self.nodes) - 1) for child in reversed(node.children))
+        # STRtree indexes the bounding boxes of the polygons
+        polys = [node.region.poly for node in self.nodes]
+        self.tree = STRtree(polys) if polys else None
+        self.number_by_poly = {} if STRTREE_RETURNS_INDICES else {id(poly): i for i, poly in enumerate(polys)}
+
+    def candidates(self, p: Point) -> List[int]:
+        if self.tree is None:
+            return []
+        if STRTREE_RETURNS_INDICES:
+            return sorted(int(i) for i in self.tree.query(p))
+        return sorted(self.number_by_poly[id(poly)] for poly in self.tree.query(p))
+
+    def find_regions(self, p: Point) -> List[Region]:
+        found = set()
+        regions = []
+        for number in self.candidates(p):
+            parent = self.parents[number]
+            # RegionBase.find_regions only descends into regions containing p
+            if (parent == -1 or parent in found) and self.nodes[number].region.contains(p):
+                found.add(number)
+                regions.append(self.nodes[number].region)
+        return regions
 
 
 class Operation:
@@ -291,10 +353,38 @@ class Operation:
         self.color = color
         self.depth = depth
 
-    def paint(self, draw: ImageDraw.Draw, regions: RegionMap) -> None:
+    def bounds(self, scale: float = 1.0) -> Bounds:
+        """
+        (left, top, right, bottom) of all pixels paint() might touch when painting with scale
+        """
+        return -inf, -inf, inf, inf
+
+    def paint(self, draw: ImageDraw.Draw, regions: RegionMap, offset: Offset = (0, 0), scale: float = 1.0) -> None:
+        """
+        Paints the operation with all coordinates scaled by scale and shifted by -offset, for painting on a layer that starts at offset
+
+        Regions are added to the RegionMap unscaled
+        """
         pass
 
 
+def padded(bounds: Bounds, padding: float) -> Bounds:
+    return bounds[0] - padding, bounds[1] - padding, bounds[2] + padding, bounds[3] + padding
+
+
+def scaled(bounds: Bounds, scale: float) -> Bounds:
+    return bounds[0] * scale, bounds[1] * scale, bounds[2] * scale, bounds[3] * scale
+
+
+def scaled_width(width: int, scale: float) -> int:
+    return max(1, int(round(width * scale)))
+
+
+def shifted(xy: List[Tuple[float, float]], offset: Offset, scale: float = 1.0) -> List[Tuple[float, float]]:
+    ox, oy = offset
+    return [(x * scale - ox, y * scale - oy) for x, y in xy]
+
+
 class PolygonOperation(Operation):
 
     def __init__(self, region: Region, fill: str, outline: str):
@@ -302,8 +392,11 @@ class PolygonOperation(Operation):
         self.region = region
         self.fill = fill
 
-    def paint(self, draw: ImageDraw.Draw, regions: RegionMap) -> None:
-        xy = list(map(tuple, self.region.poly.exterior.coords[:-1]))
+    def bounds(self, scale: float = 1.0) -> Bounds:
+        return padded(scaled(self.region.poly.bounds, scale), 2)
+
+    def paint(self, draw: ImageDraw.Draw, regions: RegionMap, offset: Offset = (0, 0), scale: float = 1.0) -> None:
+        xy = shifted(self.region.poly.exterior.coords[:-1], offset, scale)
         draw.polygon(xy, self.fill, self.color)
         regions.append(RegionNode(self.region))
 
@@ -314,9 +407,12 @@ class LineStringOperation(Operation):
         self.linestring = linestring
         self.width = width
 
-    def paint(self, draw: ImageDraw.Draw, regions: RegionMap) -> None:
-        xy = list(map(tuple, self.linestring.coords))
-        draw.line(xy, self.color, self.width)
+    def bounds(self, scale: float = 1.0) -> Bounds:
+        return padded(scaled(self.linestring.bounds, scale), scaled_width(self.width, scale) + 2)
+
+    def paint(self, draw: ImageDraw.Draw, regions: RegionMap, offset: Offset = (0, 0), scale: float = 1.0) -> None:
+        xy = shifted(self.linestring.coords, offset, scale)
+        draw.line(xy, self.color, scaled_width(self.width, scale))
 
 
 class ArrowOperation(Operation):
@@ -327,22 +423,29 @@ class ArrowOperation(Operation):
         self.size = size
         self.width = width
 
-    def paint(self, draw: ImageDraw.Draw, regions: RegionMap) -> None:
+    def bounds(self, scale: float = 1.0) -> Bounds:
+        # The wings are at most size long, the dot has a radius of 5
+        xs, ys = (self.p0[0], self.p1[0]), (self.p0[1], self.p1[1])
+        return padded(scaled((min(xs), min(ys), max(xs), max(ys)), scale), max(self.size, 5) * scale + scaled_width(self.width, scale) + 2)
+
+    def paint(self, draw: ImageDraw.Draw, regions: RegionMap, offset: Offset = (0, 0), scale: float = 1.0) -> None:
         angle = radians(180.0 - 30)  # 30 degrees
         c, s = cos(angle), sin(angle)
-        d = self.p1[0] - self.p0[0], self.p1[1] - self.p0[1]
+        p0, p1 = shifted([self.p0, self.p1], offset, scale)
+        d = p1[0] - p0[0], p1[1] - p0[1]
         left = d[0] * c - d[1] * s, d[0] * s + d[1] * c
         right = d[0] * c + d[1] * s, -d[0] * s + d[1] * c
-        lf = self.size / (d[0] ** 2 + d[1] ** 2) ** 0.5
+        lf = self.size * scale / (d[0] ** 2 + d[1] ** 2) ** 0.5
+        width, radius = scaled_width(self.width, scale), 5 * scale
 
         # Draw arrow shaft
-        draw.line([self.p0, self.p1], fill=self.color, width=self.width)
+        draw.line([p0, p1], fill=self.color, width=width)
         # Draw dot
-        draw.ellipse((self.p1[0] - 5, self.p1[1] - 5, self.p1[0] + 5, self.p1[1] + 5), fill=self.color)
+        draw.ellipse((p1[0] - radius, p1[1] - radius, p1[0] + radius, p1[1] + radius), fill=self.color)
         # Draw left arrow wing
-        draw.line([(self.p1[0] + lf * left[0], self.p1[1] + lf * left[1]), self.p1], fill=self.color, width=self.width)
+        draw.line([(p1[0] + lf * left[0], p1[1] + lf * left[1]), p1], fill=self.color, width=width)
         # Draw right arrow wing
-        draw.line([(self.p1[0] + lf * right[0], self.p1[1] + lf * right[1]), self.p1], fill=self.color, width=self.width)
+        draw.line([(p1[0] + lf * right[0], p1[1] + lf * right[1]), p1], fill=self.color, width=width)
 
 
 class TextOperation(Operation):
@@ -359,8 +462,8 @@ class TextOperation(Operation):
         super().__init__(color, 55)  # Depth 45 is between 40(TextLine) and 50(Word)
         self.region = region
 
-    def paint(self, draw: ImageDraw.Draw, regions: RegionMap) -> None:
-        sx, sy, ex, ey = self.region.poly.bounds
+    def paint(self, draw: ImageDraw.Draw, regions: RegionMap, offset: Offset = (0, 0), scale: float = 1.0) -> None:
+        sx, sy, ex, ey = scaled(self.region.poly.bounds, scale)
         font_size = 30
         factor = 0
         tries = 0
@@ -370,10 +473,10 @@ class TextOperation(Operation):
             w, h = draw.textsize(self.region.text, font=font)
             # TODO super random compromise between fit to width and fit to height
             factor = 0.7 * (ex - sx) / w + 0.3 * (ey - sy) / h
-            font_size = int(font_size * factor)
+            font_size = max(1, int(font_size * factor))
             tries += 1
 
-        draw.text((sx, sy), self.region.text, fill=self.color, font=font, anchor="lt")
+        draw.text((sx - offset[0], sy - offset[1]), self.region.text, fill=self.color, font=font, anchor="lt")
 
 
 class Operations:
@@ -382,8 +485,14 @@ class Operations:
 
     Each depth can be plotted on its own image-layer and will be blended with Image.alpha_composite, so
     Image.alpha_composite will only be called once per layer instead of once per operation
+
+    A layer is not allocated for the whole canvas, but only for the bounding box of each cluster of overlapping
+    operations. Operations in different clusters never touch the same pixels, so blending cluster by cluster
+    gives the same result as blending the whole layer at once.
     """
 
+    TILE_SIZE = 256
+
     def __init__(self) -> None:
         self.operations: Dict[int, List[Operation]] = defaultdict(list)
 
@@ -394,20 +503,95 @@ class Operations:
         for layer in sorted(self.operations, reverse=False):
             yield layer, self.operations[layer]
 
-    def paint(self, canvas: Image.Image) -> Tuple[Image.Image, RegionMap]:
+    def paint(self, canvas: Image.Image, scale: float = 1.0) -> Tuple[Image.Image, RegionMap]:
         """
         Paints the operations on canvas and fills the RegionMap accordingly
+
+        With a scale != 1.0 canvas is expected to be scaled already, the RegionMap stays unscaled.
         """
         regions = RegionMap()
         for depth, operations in self.layers():
-            layer = Image.new(mode='RGBA', size=canvas.size, color='#FFFFFF00')
-            draw = ImageDraw.Draw(layer)
-            for operation in operations:
-                operation.paint(draw, regions)
-            canvas.alpha_composite(layer)
+            for (left, top, right, bottom), cluster in self.clusters(operations, canvas.size, scale):
+                layer = Image.new(mode='RGBA', size=(right - left, bottom - top), color='#FFFFFF00')
+                draw = ImageDraw.Draw(layer)
+                for operation in cluster:
+                    operation.paint(draw, regions, (left, top), scale)
+                self.blend(canvas, layer, (left, top))
         self.operations.clear()
+        regions.build_index()
         return canvas, regions
 
+    @classmethod
+    def blend(cls, canvas: Image.Image, layer: Image.Image, offset: Offset) -> None:
+        """
+        Alpha composites layer onto canvas at offset, large layers tile by tile skipping fully transparent tiles
+        """
+        if layer.width * layer.height <= 4 * cls.TILE_SIZE ** 2:
+            canvas.alpha_composite(layer, offset)
+            return
+        alpha = layer.getchannel('A')
+        for y in range(0, layer.height, cls.TILE_SIZE):
+            for x in range(0, layer.width, cls.TILE_SIZE):
+                box = (x, y, min(x + cls.TILE_SIZE, layer.width), min(y + cls.TILE_SIZE, layer.height))
+                if alpha.crop(box).getbbox():
+                    canvas.alpha_composite(layer, (offset[0] + x, offset[1] + y), box)
+
+    @staticmethod
+    def clusters(operations: List[Operation], size: Tuple[int, int], scale: float = 1.0) -> List[Tuple[Box, List[Operation]]]:
+        """
+        Groups operations with overlapping bounds at scale, every group comes with its bounding box clipped to size
+
+        Operations keep their order within a group, groups are ordered by their first operation.
+        Operations completely outside of size still get painted (they might register regions) but on a 1x1 layer.
+        """
+        # Sweep from top to bottom, a cluster is done as soon as it ends above the current operation
+        active: List[OperationCluster] = []
+        done: List[OperationCluster] = []
+        bounded = [(operation.bounds(scale), index, operation) for index, operation in enumerate(operations)]
+        for bounds, index, operation in sorted(bounded, key=lambda bio: bio[0][1]):
+            merged = OperationCluster(bounds, index, operation)
+            still_active = []
+            for cluster in active:
+                if cluster.bottom < merged.top:
+                    done.append(cluster)
+                elif cluster.left <= bounds[2] and bounds[0] <= cluster.right:
+                    merged.merge(cluster)
+                else:
+                    still_active.append(cluster)
+            active = still_active + [merged]
+        return [(cluster.box(size), cluster.sorted_operations()) for cluster in sorted(done + active, key=lambda c: c.first_index)]
+
+
+class OperationCluster:
+    """
+    Operations of one layer with overlapping bounds
+    """
+    def __init__(self, bounds: Bounds, index: int, operation: Operation):
+        self.left, self.top, self.right, self.bottom = bounds
+        self.first_index = index
+        self.operations: List[Tuple[int, Operation]] = [(index, operation)]
+
+    def merge(self, other: OperationCluster) -> None:
+        self.left, self.top = min(self.left, other.left), min(self.top, other.top)
+        self.right, self.bottom = max(self.right, other.right), max(self.bottom, other.bottom)
+        self.first_index = min(self.first_index, other.first_index)
+        self.operations.extend(other.operations)
+
+    def sorted_operations(self) -> List[Operation]:
+        return [operation for _index, operation in sorted(self.operations, key=lambda io: io[0])]
+
+    def box(self, size: Tuple[int, int]) -> Box:
+        width, height = size
+        box = (
+            int(clamp(self.left, 0, width)), int(clamp(self.top, 0, height)),
+            int(clamp(self.right + 1, 0, width)), int(clamp(self.bottom + 1, 0, height))
+        )
+        return box if box[0] < box[2] and box[1] < box[3] else (0, 0, 1, 1)
+
+
+def clamp(x: float, lower: float, upper: float) -> float:
+    return lower if x < lower else upper if x > upper else x
+
 
 class RegionFactory:
     def __init__(self, coords: Dict[str, Any], page_id: str = '<unknown>', logger: Logger = None):
@@ -496,15 +680,31 @@ class RegionFactory:
 
 
 class PageXmlRenderer:
+    """
+    Renders the regions of a PAGE-XML document onto its image
+
+    With scale < 1.0 the image gets scaled down first and the region polygons get rasterized at that scale,
+    which is much cheaper than rendering at full resolution and scaling down the result.
+    The RegionMap always stays in the coordinates of the unscaled image.
+    """
 
     def __init__(self, canvas: Image.Image, coords: Dict[str, Any], page_id: str = '<unknown>',
-                 features: Optional[Feature] = None, colors: Optional[Dict[str, str]] = None, logger: Logger = None):
+                 features: Optional[Feature] = None, colors: Optional[Dict[str, str]] = None, logger: Logger = None,
+                 scale: float = 1.0):
         self.features = features or Feature.DEFAULT
+        self.size = canvas.size
+        self.scale = scale
+        size = (max(1, int(round(canvas.width * scale))), max(1, int(round(canvas.height * scale)))) if scale != 1.0 else canvas.size
 
         if self.features & Feature.IMAGE:
+            if size != canvas.size:
+                # resize() would fall back to nearest neighbour for bilevel and palette images
+                if canvas.mode in ('1', 'P'):
+                    canvas = canvas.convert('L' if canvas.mode == '1' else 'RGBA')
+                canvas = canvas.resize(size)
             self.canvas = canvas.convert('RGBA')
         else:
-            self.canvas = Image.new(mode='RGBA', size=canvas.size, color='#FFFFFFFF')
+            self.canvas = Image.new(mode='RGBA', size=size, color='#FFFFFFFF')
 
         self.region_factory = RegionFactory(coords, page_id, logger)
 
@@ -545,7 +745,7 @@ class PageXmlRenderer:
                 last_point = new_point
 
     def get_result(self) -> Tuple[Image.Image, RegionMap]:
-        canvas, regions = self.operations.paint(self.canvas.copy())
+        canvas, regions = self.operations.paint(self.canvas.copy(), self.scale)
         return canvas, regions
 
     def render_type(self, region_ds: RegionWithCoords) -> None:
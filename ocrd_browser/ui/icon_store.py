@@ -1,54 +1,156 @@
+import os
+
 from gi.repository import Gtk, GLib
 
-from typing import Callable, Sequence, Dict, Optional, Any, Iterator
-from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Sequence, Dict, Optional, Any, List, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from heapq import heapify, heappop, heappush
+from itertools import count
+from threading import Lock
 
 RowInitCallback = Callable[[Gtk.TreeModelRow], None]
 RowLoadCallback = Callable[[Gtk.TreeModelRow], Gtk.TreeModelRow]
 RowHashCallback = Callable[[Gtk.TreeModelRow], str]
+# Loaded row data and its hash, None if the hash did not change
+LoadResult = Optional[Tuple[Gtk.TreeModelRow, str]]
+
+# (priority, position, sequence number, row reference)
+QueueEntry = Tuple[int, int, int, Gtk.TreeRowReference]
 
 
 class LazyLoadingListStore(Gtk.ListStore):
+    """
+    ListStore that loads the data of its rows in background threads
+
+    Rows get loaded in order of their distance to the visible rows (see set_visible_range), at most max_workers at a time.
+    All other rows wait in a priority queue, so scrolling re-prioritises them and rows that got removed or changed
+    meanwhile are dropped from the queue instead of being loaded.
+    All rows get loaded by one thread pool, that lives from start_loading until shutdown.
+    Finished rows get collected in batches on the main loop, which is never woken up while nothing is loading.
+
+    hash_row gets called in the loading thread right before load_row, load_row only gets called if the hash of the row
+    changed since it was loaded last. So hash_row may access the file system, call reload to check a row again.
+    """
 
     def __init__(self, *column_types: type, init_row: RowInitCallback, load_row: RowLoadCallback,
-                 hash_row: RowHashCallback):
+                 hash_row: RowHashCallback, max_workers: Optional[int] = None):
         column_type_list = list(column_types)
         column_type_list.append(str)
         super().__init__(*column_type_list)
         self.init_row = init_row
         self.load_row = load_row
         self.hash_row = hash_row
-        self.futures: Optional[Dict[Future[Gtk.TreeModelRow], Gtk.TreeModelRow]] = None
+        # Same default as ThreadPoolExecutor
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.pool: Optional[ThreadPoolExecutor] = None
+        # Loading rows and the row data they got submitted with
+        self.futures: Optional[Dict[Future[LoadResult], Tuple[Gtk.TreeRowReference, List[Any]]]] = None
+        self.queue: List[QueueEntry] = []
+        self.visible_range: Tuple[int, int] = (0, 0)
+        self._sequence = count()
+        self._done: List[Future[LoadResult]] = []
+        self._done_lock = Lock()
+        self._shut_down = False
         self.row_inserted_handler = self.connect('row-inserted', self._on_row_inserted)
         self.row_changed_handler = self.connect('row-changed', self._on_row_changed)
 
-    def start_loading(self) -> None:
+    def start_loading(self) -> bool:
+        """
+        Starts the thread pool and loads all rows, does nothing once shut down
+
+        @return: False, so it can be scheduled as a one-shot GLib timeout that might fire after shutdown
+        """
+        if self._shut_down or self.pool is not None:
+            return False
         self.futures = {}
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='lazy-loading')
         self.submit_all()
-        GLib.timeout_add(10, self._collect_workers().__next__, priority=GLib.PRIORITY_LOW)
+        return False
+
+    def shutdown(self) -> None:
+        """
+        Stops loading for good, queued rows get dropped, rows that are loading finish but their results get dropped
+        """
+        self._shut_down = True
+        self.queue.clear()
+        for future in (self.futures or {}):
+            future.cancel()
+        self.futures = None
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+
+    def reload(self, row: Gtk.TreeModelRow) -> None:
+        """
+        Queues row for loading, if its hash changed
+        """
+        self._submit_future(row)
 
     def submit_all(self) -> bool:
-        pool = ThreadPoolExecutor()
         for row in self:
-            self._submit_future(row, pool)
-        pool.shutdown(wait=False)
+            self._queue(row)
+        self._dispatch()
         return True
 
-    def _submit_future(self, row: Gtk.TreeModelRow, pool: Optional[ThreadPoolExecutor] = None) -> None:
-        if self.futures is None:
+    def set_visible_range(self, first: int, last: int) -> None:
+        """
+        Re-prioritises the queued rows, rows first to last (inclusive) get loaded first, then their neighbours
+        """
+        if (first, last) == self.visible_range:
             return
-        own_pool = pool is None
-        if own_pool:
-            pool = ThreadPoolExecutor()
+        self.visible_range = (first, last)
+        entries: Dict[int, QueueEntry] = {}
+        for _priority, _position, sequence, reference in self.queue:
+            if reference.valid():
+                position = reference.get_path().get_indices()[0]
+                # Only one entry per row
+                entries[position] = (self._priority(position), position, sequence, reference)
+        self.queue = [entry for entry in entries.values()]
+        heapify(self.queue)
 
-        row_hash = self.hash_row(row)
+    def _priority(self, position: int) -> int:
+        first, last = self.visible_range
+        return first - position if position < first else max(0, position - last)
 
-        if row[-1] != row_hash and row not in self.futures.values():
-            future = pool.submit(self.load_row, row[:])
-            self.futures[future] = row
+    def _submit_future(self, row: Gtk.TreeModelRow) -> None:
+        self._queue(row)
+        self._dispatch()
 
-        if own_pool:
-            pool.shutdown(wait=False)
+    def _queue(self, row: Gtk.TreeModelRow) -> None:
+        if self.futures is None:
+            return
+        position = row.path.get_indices()[0]
+        reference = Gtk.TreeRowReference.new(self, row.path)
+        heappush(self.queue, (self._priority(position), position, next(self._sequence), reference))
+
+    def _dispatch(self) -> None:
+        """
+        Starts loading the queued rows with the highest priority until all workers are busy
+        """
+        if self.futures is None or self.pool is None:
+            return
+        while self.queue and len(self.futures) < self.max_workers:
+            *_, reference = heappop(self.queue)
+            if not reference.valid():
+                # Row got removed
+                continue
+            path = reference.get_path()
+            if any(loading.get_path() == path for loading, _ in self.futures.values() if loading.valid()):
+                # Already loading, gets queued again if it changed until then
+                continue
+            row_data = self[path][:]
+            future = self.pool.submit(self._load, row_data[:])
+            self.futures[future] = (reference, row_data)
+            future.add_done_callback(self._on_done)
+
+    def _load(self, row_data: List[Any]) -> LoadResult:
+        """
+        Called from the loading thread
+        """
+        row_hash = self.hash_row(row_data)
+        if row_data[-1] == row_hash:
+            return None
+        return self.load_row(row_data), row_hash
 
     def _do_insert(self, position: int, row: Sequence[Any]) -> None:
         if row is not None:
@@ -65,20 +167,44 @@ class LazyLoadingListStore(Gtk.ListStore):
         row = list_store[it]
         self._submit_future(row)
 
-    def _collect_workers(self) -> Iterator[bool]:
-        for future in as_completed(self.futures):
-            row = self.futures.pop(future)
+    def _on_done(self, future: Future[LoadResult]) -> None:
+        """
+        Called from the loading thread, schedules collecting on the main loop unless it is scheduled already
+        """
+        with self._done_lock:
+            self._done.append(future)
+            scheduled = len(self._done) > 1
+        if not scheduled:
+            GLib.idle_add(self._collect_workers, priority=GLib.PRIORITY_LOW)
+
+    def _collect_workers(self) -> bool:
+        with self._done_lock:
+            done, self._done = self._done, []
+        for future in done:
+            if self.futures is None or future not in self.futures:
+                # Shut down meanwhile
+                continue
+            reference, row_data = self.futures.pop(future)
+            if not reference.valid():
+                # Row got removed while loading
+                continue
+            row = self[reference.get_path()]
             try:
-                new_row_data = future.result()
+                result = future.result()
             except Exception as exc:
                 print('{} generated an exception: {}'.format(row[0], exc))
-            else:
-                with self.handler_block(self.row_changed_handler):
-                    for i, (old, new) in enumerate(zip(row[:], new_row_data)):
-                        if old != new:
-                            row[i] = new_row_data[i]
-                    row[-1] = self.hash_row(row)
-                yield True
-        # Futures are finished for now, check back every 50ms if there is something new
-        GLib.timeout_add(50, self._collect_workers().__next__, priority=GLib.PRIORITY_LOW)
-        yield False
+                continue
+            if row[:] != row_data:
+                # Row changed while loading, the result is outdated
+                self._submit_future(row)
+                continue
+            if result is None:
+                continue
+            new_row_data, row_hash = result
+            with self.handler_block(self.row_changed_handler):
+                for i, (old, new) in enumerate(zip(row[:], new_row_data)):
+                    if old != new:
+                        row[i] = new_row_data[i]
+                row[-1] = row_hash
+        self._dispatch()
+        return False
@@ -2,7 +2,7 @@ from gi.repository import Gtk, Gdk, Pango, Gio, GObject
 
 from typing import List, Callable, Optional, Any, cast
 
-from ocrd_browser.util.gtk import resource_string
+from ocrd_browser.util.gtk import resource_string, WhenIdle
 from ocrd_browser.model import Document
 from .page_store import PageListStore, ChangeList
 
@@ -35,6 +35,7 @@ class PagePreviewList(Gtk.IconView):
         self.context_menu.show_all()
 
     def set_document(self, document: Document) -> None:
+        self.model.shutdown()
         self.document = document
         self.model = PageListStore(self.document)
         self.set_model(self.model)
@@ -52,6 +53,23 @@ class PagePreviewList(Gtk.IconView):
         text_renderer: Gtk.CellRendererText = text_renderers[0]
         text_renderer.props.ellipsize = Pango.EllipsizeMode.MIDDLE
         self.connect('button-press-event', self.button_pressed)
+        self.connect('destroy', lambda *_: self.model.shutdown())
+        self.connect('size-allocate', lambda *_: WhenIdle.call(self.update_visible_range))
+        self.connect('notify::vadjustment', self.vadjustment_changed)
+
+    def vadjustment_changed(self, *_: Any) -> None:
+        adjustment = self.get_vadjustment()
+        if adjustment:
+            adjustment.connect('value-changed', lambda *_: WhenIdle.call(self.update_visible_range))
+
+    def update_visible_range(self) -> None:
+        """
+        Lets the model load the thumbnails of the visible pages first
+        """
+        visible_range = self.get_visible_range()
+        if visible_range:
+            start, end = visible_range
+            self.model.set_visible_range(start.get_indices()[0], end.get_indices()[0])
 
     def button_pressed(self, _sender: Gtk.Widget, event: Gdk.EventButton) -> None:
         if event.button == Gdk.BUTTON_SECONDARY and event.type == Gdk.EventType.BUTTON_PRESS:
@@ -1,14 +1,14 @@
-from gi.repository import Gtk, GLib, GdkPixbuf
+from gi.repository import Gtk, GLib, GdkPixbuf, Gio
 
-from typing import Tuple, Optional, Dict, List, Union, NewType, Callable, Any
+from typing import Tuple, Optional, Dict, List, Union, NewType, Callable, Any, Set
 from itertools import count
 
-from ocrd_browser.util.image import cv_to_pixbuf, cv_scale
+from ocrd_browser.util.image import pil_to_pixbuf, pil_scale
 from ocrd_browser.model import Document
 from .icon_store import LazyLoadingListStore
 from ..util.config import SettingsFactory
+from ..util.thumbnails import ThumbnailCache, load_thumbnail
 
-import cv2
 import os
 
 RowResult = Tuple[Optional[int], Optional[Gtk.TreeModelRow]]
@@ -22,6 +22,8 @@ class PageListStore(LazyLoadingListStore):
 
     It utilizes LazyLoadingListStore for lazy thumbnail generation and
     contains the domain specific logic for handling Document events
+
+    With [Thumbnails] watch, the directories of the images get monitored and thumbnails of changed images reloaded
     """
     COLUMN_PAGE_ID = Column(0)
     COLUMN_TOOLTIP = Column(1)
@@ -44,8 +46,19 @@ class PageListStore(LazyLoadingListStore):
             self.COLUMN_ORDER: int
             # self.COLUMN_HASH: str file hash = filename + modified_time (gets added by LazyLoadingListStore)
         }
-        super().__init__(*(columns.values()), init_row=self._init_row, load_row=self._load_row, hash_row=self._hash_row)
+        settings = SettingsFactory.settings().thumbnails
+        super().__init__(*(columns.values()), init_row=self._init_row, load_row=self._load_row, hash_row=self._hash_row,
+                         max_workers=settings.workers)
         self.document = document
+        self.thumbnails = ThumbnailCache.from_settings(settings, document.directory)
+        self.monitors: Optional[Dict[str, Gio.FileMonitor]] = {} if settings.watch else None
+        # page_id -> row index, None while it needs to be rebuilt
+        self.positions: Optional[Dict[str, int]] = {}
+        # absolute filename -> page_ids showing it, None while it needs to be rebuilt
+        self.page_ids_by_file: Optional[Dict[str, Set[str]]] = None
+        self.connect('row-inserted', self._on_position_inserted)
+        self.connect('row-deleted', self._invalidate_positions)
+        self.connect('rows-reordered', self._invalidate_positions)
         self.pixbufs: Dict[str, GdkPixbuf.Pixbuf] = {
             icon_name: GdkPixbuf.Pixbuf.new_from_resource(
                 '/org/readmachine/ocrd-browser/icons/{}.png'.format(icon_name)
@@ -62,11 +75,78 @@ class PageListStore(LazyLoadingListStore):
 
         GLib.timeout_add(10, self.start_loading)
 
+    def shutdown(self) -> None:
+        super().shutdown()
+        for monitor in (self.monitors or {}).values():
+            monitor.cancel()
+        self.monitors = None
+
+    def _watch(self, filename: Optional[str]) -> None:
+        """
+        Starts monitoring the directory of filename, if watching is enabled
+        """
+        if self.monitors is None or filename is None:
+            return
+        directory = os.path.dirname(os.path.abspath(filename))
+        if directory not in self.monitors:
+            try:
+                monitor = Gio.File.new_for_path(directory).monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+            except GLib.Error:
+                return
+            monitor.connect('changed', self._on_file_changed)
+            self.monitors[directory] = monitor
+
+    def _on_file_changed(self, _monitor: Gio.FileMonitor, file: Gio.File, other_file: Optional[Gio.File],
+                         event: Gio.FileMonitorEvent) -> None:
+        if event not in (Gio.FileMonitorEvent.CHANGES_DONE_HINT, Gio.FileMonitorEvent.CREATED,
+                         Gio.FileMonitorEvent.DELETED, Gio.FileMonitorEvent.MOVED_IN, Gio.FileMonitorEvent.RENAMED):
+            return
+        page_ids_by_file = self.get_page_ids_by_file()
+        for changed in (f.get_path() for f in (file, other_file) if f is not None):
+            for page_id in page_ids_by_file.get(changed, ()):
+                _n, row = self.get_row_by_page_id(page_id)
+                if row is not None:
+                    self.reload(row)
+
+    def get_page_ids_by_file(self) -> Dict[str, Set[str]]:
+        """
+        The page_ids of the rows for each absolute filename
+        """
+        if self.page_ids_by_file is None:
+            self.page_ids_by_file = {}
+            for row in self:
+                if row[self.COLUMN_FILENAME] is not None:
+                    filename = os.path.abspath(row[self.COLUMN_FILENAME])
+                    self.page_ids_by_file.setdefault(filename, set()).add(row[self.COLUMN_PAGE_ID])
+        return self.page_ids_by_file
+
     def get_row_by_page_id(self, page_id: str) -> RowResult:
         """
         Find index and row by page_id
         """
-        return self.get_row_by_column_value(self.COLUMN_PAGE_ID, page_id)
+        n = self.get_positions().get(page_id)
+        return (n, self[n]) if n is not None else (None, None)
+
+    def get_positions(self) -> Dict[str, int]:
+        """
+        Index of the row for each page_id
+        """
+        if self.positions is None:
+            self.positions = {row[self.COLUMN_PAGE_ID]: n for n, row in enumerate(self)}
+        return self.positions
+
+    def _on_position_inserted(self, _list_store: Gtk.ListStore, path: Gtk.TreePath, it: Gtk.TreeIter) -> None:
+        self.page_ids_by_file = None
+        n = path.get_indices()[0]
+        if self.positions is not None and n == len(self) - 1:
+            # Appending is the common case and keeps all other positions
+            self.positions[self[it][self.COLUMN_PAGE_ID]] = n
+        else:
+            self.positions = None
+
+    def _invalidate_positions(self, *_: Any) -> None:
+        self.positions = None
+        self.page_ids_by_file = None
 
     def get_row_by_column_value(self, column: int, value: str) -> RowResult:
         """
@@ -102,31 +182,32 @@ class PageListStore(LazyLoadingListStore):
         def _page_added(page_ids: List[str]) -> None:
             for page_id in page_ids:
                 try:
-                    file = next(iter(self.document.workspace.mets.find_files(pageId=page_id, fileGrp=self.file_group.group, mimetype=self.file_group.mime)))
+                    file = next(iter(self.document.find_page_files(page_id, self.file_group.group, self.file_group.mime)))
                     file_name = str(self.document.path(file))
                     self.append((page_id, '', file_name, None, len(self)))
                 except StopIteration as e:
                     raise ValueError('Page {} in group {}  not in workspace'.format(page_id, self.file_group)) from e
 
         def _page_deleted(page_ids: List[str]) -> None:
-            for delete_page_id in reversed(page_ids):
-                n, row = self.get_row_by_page_id(delete_page_id)
+            positions = self.get_positions()
+            # Back to front, so the positions of the remaining rows stay valid
+            for n in sorted((positions[page_id] for page_id in page_ids), reverse=True):
                 self.remove(self.get_iter(Gtk.TreePath(n)))
 
         def _page_changed(page_ids: List[str]) -> None:
             for page_id in page_ids:
                 n, row = self.get_row_by_page_id(page_id)
                 try:
-                    file = next(iter(self.document.workspace.mets.find_files(pageId=page_id, fileGrp=self.file_group.group, mimetype=self.file_group.mime)))
+                    file = next(iter(self.document.find_page_files(page_id, self.file_group.group, self.file_group.mime)))
                     file_name = str(self.document.path(file))
+                    self._watch(file_name)
                     row[self.COLUMN_FILENAME] = file_name
+                    self.page_ids_by_file = None
                 except StopIteration:
                     pass
 
         def _reordered(old_to_new_ids: Dict[str, str]) -> None:
-            id_to_position: Dict[str, int] = {}
-            for n, row in enumerate(self):
-                id_to_position[row[self.COLUMN_PAGE_ID]] = n
+            id_to_position = self.get_positions()
 
             positions: List[int] = list(range(0, len(old_to_new_ids)))
             for old, new in old_to_new_ids.items():
@@ -149,6 +230,7 @@ class PageListStore(LazyLoadingListStore):
         handler[subtype](changes)
 
     def _init_row(self, row: Gtk.TreeModelRow) -> None:
+        self._watch(row[self.COLUMN_FILENAME])
         if row[self.COLUMN_FILENAME] is not None:
             row[1] = 'Loading {}'.format(row[self.COLUMN_FILENAME])
             row[3] = self.pixbufs['page-loading']
@@ -156,17 +238,23 @@ class PageListStore(LazyLoadingListStore):
             row[1] = 'No image for {}'.format(row[self.COLUMN_PAGE_ID])
             row[3] = self.pixbufs['page-missing']
 
-    @staticmethod
-    def _load_row(row: Gtk.TreeModelRow) -> Gtk.TreeModelRow:
+    def _load_row(self, row: Gtk.TreeModelRow) -> Gtk.TreeModelRow:
         filename = row[PageListStore.COLUMN_FILENAME]
         if filename is not None:
-            image = cv2.imread(filename)
-            row[1] = '{} ({}x{})'.format(filename, image.shape[1], image.shape[0])
-            row[3] = cv_to_pixbuf(cv_scale(image, 100, None))
+            thumbnail = self.thumbnails.get(filename) if self.thumbnails else None
+            if not thumbnail:
+                thumbnail = load_thumbnail(filename, ThumbnailCache.SIZE)
+                if self.thumbnails:
+                    self.thumbnails.put(filename, thumbnail.image, (thumbnail.width, thumbnail.height))
+            row[1] = '{} ({}x{})'.format(filename, thumbnail.width, thumbnail.height)
+            row[3] = pil_to_pixbuf(pil_scale(thumbnail.image, 100, None))
         return row
 
     @staticmethod
     def _hash_row(row: Gtk.TreeModelRow) -> str:
+        """
+        Called from the loading thread, as stat() can take a while on network file systems
+        """
         file = row[PageListStore.COLUMN_FILENAME]
         if file is not None:
             modified_time = os.path.getmtime(file)
@@ -97,8 +97,9 @@ class MainWindow(Gtk.ApplicationWindow):
         self._restricted = restricted
 
     def on_page_remove(self, _a: Gio.SimpleAction, _p: None) -> None:
-        for page_id in self.page_list.get_selected_ids():
-            self.document.delete_page(page_id)
+        with self.document.batch():
+            for page_id in self.page_list.get_selected_ids():
+                self.document.delete_page(page_id)
 
     def on_page_properties(self, _a: Gio.SimpleAction, _p: None) -> None:
         pass
@@ -119,14 +120,26 @@ class MainWindow(Gtk.ApplicationWindow):
 
     def _open(self, uri: str) -> None:
         # noinspection PyTypeChecker
-        self.document = Document.load(uri, emitter=self.emit)
+        self.document = Document.load(uri, emitter=self.emit, lazy=True)
         self.page_list.set_document(self.document)
 
         self.view_manager.set_document(self.document)
         self.update_ui()
 
-        if len(self.document.page_ids):
+        # The views need the Workspace, the page list only needs what Document.load read already
+        document = self.document
+        document.when_loaded(lambda _loaded: GLib.idle_add(self._document_loaded, document))
+
+    def _document_loaded(self, document: Document) -> bool:
+        if document is not self.document:
+            # Another document got opened meanwhile
+            return False
+        self.update_ui()
+        # Unless a page of this document got activated meanwhile
+        current = self.document.page_position(self.current_page_id) if self.current_page_id else None
+        if current is None and len(self.document.page_ids):
             self.on_page_activated(None, self.document.page_ids[0])
+        return False
 
     @property
     def view_registry(self) -> ViewRegistry:
@@ -139,7 +152,7 @@ class MainWindow(Gtk.ApplicationWindow):
 
     @GObject.Signal(arg_types=[str])
     def page_activated(self, page_id: str) -> None:
-        index = self.document.page_ids.index(page_id)
+        index = self.document.page_position(page_id) or 0
         self.current_page_label.set_text('{}/{}'.format(index + 1, len(self.document.page_ids)))
         self.update_ui()
 
@@ -171,8 +184,8 @@ class MainWindow(Gtk.ApplicationWindow):
 
         can_go_back = False
         can_go_forward = False
-        if self.current_page_id and self.current_page_id in self.document.page_ids:
-            index = self.document.page_ids.index(self.current_page_id)
+        index = self.document.page_position(self.current_page_id) if self.current_page_id else None
+        if index is not None:
             last_page = len(self.document.page_ids) - 1
             can_go_back = index > 0
             can_go_forward = index < last_page
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from threading import Lock, RLock
+from typing import Any, Callable, Generic, Hashable, NamedTuple, Optional, Tuple, TypeVar, List, cast
+
+from .config import SettingsFactory
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+__all__ = ['LruCache', 'LruCacheView', 'Weighed', 'memory_cache']
+
+
+class LruCache(Generic[K, V]):
+    """
+    Thread safe least-recently-used cache with a budget of max_weight
+
+    Every entry weighs 1 by default, so max_weight is the maximum number of entries.
+    With a weigher (e.g. returning the number of bytes of a value) max_weight becomes a memory budget.
+
+    Usage:
+    > cache = LruCache(32)
+    > cache.put(('PHYS_0017', 'OCR-D-GT-PAGE'), pc_gts)
+    > cache.get(('PHYS_0017', 'OCR-D-GT-PAGE'))
+    """
+
+    def __init__(self, max_weight: int, weigher: Optional[Callable[[V], int]] = None):
+        self.max_weight = max_weight
+        self.weigher: Callable[[V], int] = weigher or (lambda _value: 1)
+        self._entries: OrderedDict[K, Tuple[V, int]] = OrderedDict()
+        self._weight = 0
+        self._lock = RLock()
+
+    @property
+    def weight(self) -> int:
+        return self._weight
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key: K, value: V) -> None:
+        """
+        Adds or replaces the value for key and evicts the least recently used entries until the budget fits again
+        """
+        weight = self.weigher(value)
+        with self._lock:
+            self.discard(key)
+            self._entries[key] = (value, weight)
+            self._weight += weight
+            while self._weight > self.max_weight and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def discard(self, key: K) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def discard_where(self, predicate: Callable[[K], bool]) -> None:
+        """
+        Discards all entries whose key satisfies predicate
+        """
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._weight = 0
+
+    def keys(self) -> List[K]:
+        with self._lock:
+            return list(self._entries.keys())
+
+    def _remove(self, key: K) -> None:
+        _value, weight = self._entries.pop(key)
+        self._weight -= weight
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class Weighed(NamedTuple):
+    value: Any
+    # Estimated memory footprint in bytes
+    size: int
+
+
+_memory_cache: Optional[LruCache[Hashable, Weighed]] = None
+_memory_cache_lock = Lock()
+
+
+def memory_cache() -> LruCache[Hashable, Weighed]:
+    """
+    The process wide cache of decoded images, parsed PAGE-XML and renderings, bounded by [Cache] memory in MiB
+
+    Use it through an LruCacheView, which weighs the values and keeps the keys of different owners apart.
+    """
+    global _memory_cache
+    with _memory_cache_lock:
+        if _memory_cache is None:
+            budget = SettingsFactory.settings().cache.memory * 1024 * 1024
+            _memory_cache = LruCache(budget, weigher=lambda weighed: weighed.size)
+        return _memory_cache
+
+
+class LruCacheView(Generic[K, V]):
+    """
+    The entries of one owner in a shared LruCache of Weighed values, so all owners share one budget
+
+    Values get weighed by weigher when put. The shared cache evicts them like everyone else's least recently used
+    entries, max_entries additionally limits the number of entries of this owner.
+
+    Usage:
+    > tiles = LruCacheView(weigher=lambda pixbuf: pixbuf.get_byte_length(), max_entries=256)
+    > tiles.put((0, 0), pixbuf)
+    """
+
+    def __init__(self, weigher: Callable[[V], int], max_entries: Optional[int] = None,
+                 shared: Optional[LruCache[Hashable, Weighed]] = None):
+        """
+        :param shared: The cache to share, memory_cache() by default
+        """
+        self.weigher = weigher
+        self.max_entries = max_entries
+        self._shared = shared
+        # Keys of the shared cache are (owner, key), a plain object does not keep this view alive
+        self._owner = object()
+        # Own keys in least recently used order, might still contain keys the shared cache evicted meanwhile
+        self._keys: OrderedDict[K, None] = OrderedDict()
+        self._lock = RLock()
+
+    @property
+    def shared(self) -> LruCache[Hashable, Weighed]:
+        return self._shared if self._shared is not None else memory_cache()
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        with self._lock:
+            weighed = self.shared.get((self._owner, key))
+            if weighed is None:
+                self._keys.pop(key, None)
+                return default
+            self._keys.move_to_end(key)
+            return cast(V, weighed.value)
+
+    def put(self, key: K, value: V) -> None:
+        weighed = Weighed(value, self.weigher(value))
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            self.shared.put((self._owner, key), weighed)
+            if self.max_entries is not None and len(self._keys) > self.max_entries:
+                self._keys = OrderedDict((k, None) for k in self._keys if (self._owner, k) in self.shared)
+                while len(self._keys) > self.max_entries:
+                    self.shared.discard((self._owner, self._keys.popitem(last=False)[0]))
+
+    def discard(self, key: K) -> None:
+        with self._lock:
+            self._keys.pop(key, None)
+            self.shared.discard((self._owner, key))
+
+    def discard_where(self, predicate: Callable[[K], bool]) -> None:
+        with self._lock:
+            for key in [key for key in self._keys if predicate(key)]:
+                self.discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in self._keys:
+                self.shared.discard((self._owner, key))
+            self._keys.clear()
+
+    def keys(self) -> List[K]:
+        with self._lock:
+            return [key for key in self._keys if (self._owner, key) in self.shared]
+
+    def __contains__(self, key: object) -> bool:
+        return (self._owner, key) in self.shared
+
+    def __len__(self) -> int:
+        return len(self.keys())
@@ -84,6 +84,42 @@ class FileGroups(BaseModel):
     split_preferred_images = validator('preferred_images', pre=True, allow_reuse=True)(_split_regexes)
 
 
+class Cache(BaseModel):
+    page_xml: int = Field(default=32, ge=0)
+    memory: int = Field(default=2048, ge=1)
+
+
+class Prefetch(BaseModel):
+    next: int = Field(default=2, ge=0)
+    previous: int = Field(default=1, ge=0)
+    workers: int = Field(default=2, ge=1)
+
+
+class Thumbnails(BaseModel):
+    directory: Optional[str] = None
+    max_size: int = Field(default=512, ge=0)
+    eviction: str = 'lru'
+    workers: int = Field(default=4, ge=1)
+    watch: bool = False
+
+    @validator('eviction')
+    def check_eviction(cls, v: str) -> str:
+        if v not in ('lru', 'fifo'):
+            raise ValueError(f'Unknown eviction policy "{v}", use "lru" or "fifo"')
+        return v
+
+
+class Save(BaseModel):
+    workers: int = Field(default=4, ge=1)
+    backup: str = 'link'
+
+    @validator('backup')
+    def check_backup(cls, v: str) -> str:
+        if v not in ('link', 'move'):
+            raise ValueError(f'Unknown backup strategy "{v}", use "link" or "move"')
+        return v
+
+
 class Tool(BaseModel):
     commandline: str
     shortcut: Optional[str]
@@ -100,6 +136,10 @@ class Tool(BaseModel):
 
 class Settings(BaseSettings):
     file_groups: FileGroups = FileGroups(preferred_images='OCR-D-IMG,OCR-D-IMG.*')
+    cache: Cache = Cache()
+    prefetch: Prefetch = Prefetch()
+    thumbnails: Thumbnails = Thumbnails()
+    save: Save = Save()
     tool: Dict[str, Tool] = Field({})
 
     @validator('tool')
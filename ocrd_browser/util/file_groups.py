@@ -31,6 +31,13 @@ class FileGroupHandle(NamedTuple):
             return cls._make(tpl)
 
 
+class FileGroupStats(NamedTuple):
+    # Number of files in the fileGrp with this mimetype
+    files: int
+    # Number of pages with at least one of these files
+    pages: int
+
+
 def weight_match(s: str, preferred: PatternList = None) -> float:
     """
     Weights how good a string matches a list of regular expressions
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import os
+import shutil
+import sys
+
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Dict, Union
+
+__all__ = ['reflink', 'reflink_or_copy', 'link_or_copy', 'copy_if_changed', 'replace_atomically', 'snapshot']
+
+# ioctl request number of FICLONE from linux/fs.h
+FICLONE = 0x40049409
+
+
+def reflink(source: Union[Path, str], destination: Union[Path, str]) -> bool:
+    """
+    Creates destination as a copy-on-write clone of source (btrfs, XFS, ...), False if the file system can not do that
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl
+    try:
+        with open(source, 'rb') as src, open(destination, 'xb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return True
+            except OSError:
+                pass
+        os.remove(destination)
+    except OSError:
+        pass
+    return False
+
+
+def reflink_or_copy(source: Union[Path, str], destination: Union[Path, str]) -> str:
+    """
+    Copies source to destination (with metadata), as a reflink if the file system allows
+
+    Unlike a hard link, both are independent files, writing to one never changes the other.
+
+    @return: str the method used: 'reflink' or 'copy'
+    """
+    if reflink(source, destination):
+        # Keep the modification time, like copy2 does
+        shutil.copystat(source, destination)
+        return 'reflink'
+    shutil.copy2(source, destination)
+    return 'copy'
+
+
+def link_or_copy(source: Union[Path, str], destination: Union[Path, str]) -> str:
+    """
+    Makes the content of source available at destination as cheap as the file system allows
+
+    Tries a reflink first, then a hard link and copies source as a last resort.
+    Hard linked files share their content with source, writing to one in place changes the other.
+
+    @return: str the method used: 'reflink', 'hardlink' or 'copy'
+    """
+    if reflink(source, destination):
+        # Keep the modification time, like copy2 and hard links do
+        shutil.copystat(source, destination)
+        return 'reflink'
+    try:
+        os.link(source, destination)
+        return 'hardlink'
+    except OSError:
+        shutil.copy2(source, destination)
+        return 'copy'
+
+
+def snapshot(source: Union[Path, str], destination: Union[Path, str]) -> Dict[str, int]:
+    """
+    Recreates the directory tree source at destination with link_or_copy
+
+    Only copies if destination is on another file system (or the file system does not support links).
+    Hard linked files in the snapshot change with the files in source, unless they get replaced instead of modified in place.
+
+    @return: Dict[str, int] the number of files per method, see link_or_copy
+    """
+    methods: Dict[str, int] = {}
+    for directory, _subdirectories, filenames in os.walk(source):
+        target = Path(destination) / Path(directory).relative_to(source)
+        target.mkdir(parents=True, exist_ok=True)
+        shutil.copystat(directory, target)
+        for filename in filenames:
+            method = link_or_copy(Path(directory) / filename, target / filename)
+            methods[method] = methods.get(method, 0) + 1
+    return methods
+
+
+def replace_atomically(source: Union[Path, str], destination: Union[Path, str]) -> None:
+    """
+    Copies source to destination (with metadata), readers of destination see either the old or the new content
+    """
+    destination = Path(destination)
+    with NamedTemporaryFile(dir=destination.parent, prefix='.' + destination.name + '.', delete=False) as file:
+        pass
+    try:
+        shutil.copy2(source, file.name)
+        os.replace(file.name, destination)
+    except BaseException:
+        os.remove(file.name)
+        raise
+
+
+def copy_if_changed(source: Union[Path, str], destination: Union[Path, str]) -> bool:
+    """
+    Copies source to destination, unless destination has the same size and modification time (to the second) already
+
+    @return: bool whether source got copied
+    """
+    try:
+        source_stat, destination_stat = os.stat(source), os.stat(destination)
+        if source_stat.st_size == destination_stat.st_size and int(source_stat.st_mtime) == int(destination_stat.st_mtime):
+            return False
+    except FileNotFoundError:
+        pass
+    Path(destination).parent.mkdir(parents=True, exist_ok=True)
+    replace_atomically(source, destination)
+    return True
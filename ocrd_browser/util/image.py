@@ -2,7 +2,7 @@ import cv2
 import struct
 import zlib
 
-from typing import Tuple, Union, Any, cast
+from typing import Dict, Optional, Tuple, Union, Any, cast
 from PIL.Image import Image, fromarray
 from numpy import (
     array as np_array,
@@ -19,7 +19,7 @@ try:
 except ImportError:
     from numpy import ndarray as numpy_array
 
-__all__ = ['cv_scale', 'cv_to_pixbuf', 'pil_to_pixbuf', 'pil_scale', 'add_dpi_to_png_buffer']
+__all__ = ['cv_scale', 'cv_to_pixbuf', 'pil_to_pixbuf', 'pil_scale', 'add_dpi_to_png_buffer', 'ImagePyramid']
 
 
 def cv_to_pixbuf(z: numpy_array) -> GdkPixbuf.Pixbuf:
@@ -103,6 +103,90 @@ def pil_scale(orig: Image, w: int = None, h: int = None) -> Image:
     return thumb
 
 
+def decoded_size(image: Image) -> int:
+    """
+    Size of the decoded pixels of image in bytes, even if PIL did not decode them yet
+    """
+    bytes_per_band = 4 if image.mode in ('I', 'F') else 2 if image.mode.startswith('I;16') else 1
+    return int(image.width * image.height * len(image.getbands()) * bytes_per_band)
+
+
+class ImagePyramid:
+    """
+    Lazily built power-of-two downsamples (mip-maps) of an image for fast scaling to arbitrary sizes
+
+    Level n is the image reduced by 2**n, scale() resamples from the smallest level that is still at least as large as requested.
+
+    Usage:
+    > pyramid = ImagePyramid(page_image)
+    > pixbuf = pil_to_pixbuf(pyramid.scale(None, 1000))
+    """
+    # Modes Image.reduce can handle, others get resized like pil_scale does
+    REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA')
+
+    def __init__(self, image: Image):
+        self.image = image
+        self.levels: Dict[int, Image] = {0: image}
+
+    def level(self, n: int) -> Image:
+        if n not in self.levels:
+            larger = self.level(n - 1)
+            if larger.mode == '1':
+                # Grayscale gives smoother downsamples than nearest neighbour for bilevel images
+                larger = larger.convert('L')
+            if larger.mode in self.REDUCIBLE_MODES:
+                self.levels[n] = larger.reduce(2)
+            else:
+                self.levels[n] = pil_scale(larger, max(1, larger.width // 2))
+        return self.levels[n]
+
+    def level_for(self, w: Optional[int] = None, h: Optional[int] = None) -> int:
+        """
+        The highest level that is not smaller than the requested size
+        """
+        new_width, new_height = self.scaled_size(w, h)
+        n = 0
+        while (self.image.width >> (n + 1)) >= max(1, new_width) and (self.image.height >> (n + 1)) >= max(1, new_height):
+            n += 1
+        return n
+
+    def scale(self, w: Optional[int] = None, h: Optional[int] = None) -> Image:
+        """
+        Like pil_scale(image, w, h), but resampled from the nearest larger level
+        """
+        n = self.level_for(w, h)
+        if n == 0:
+            return pil_scale(self.image, w, h)
+        return self.level(n).resize(self.scaled_size(w, h))
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Estimated memory footprint in bytes once all levels are built, they add up to a third of the image
+        """
+        return decoded_size(self.image) * 4 // 3
+
+    def scaled_size(self, w: Optional[int] = None, h: Optional[int] = None) -> Tuple[int, int]:
+        return _calculate_scale(self.image.width, self.image.height, w, h)
+
+    def region(self, h: int, box: Tuple[int, int, int, int]) -> Image:
+        """
+        Like scale(None, h).crop(box), but only resamples the part of the image within box
+
+        :param h: Height of the scaled image
+        :param box: (left, upper, right, lower) in coordinates of the scaled image
+        """
+        width, height = self.scaled_size(None, h)
+        n = self.level_for(None, h)
+        level = self.level(n)
+        if n == 0 and level.mode.startswith('I'):
+            # Convert once like pil_scale does, instead of for every region
+            level = self.levels[0] = pil_scale(level)
+        fx, fy = level.width / max(1, width), level.height / max(1, height)
+        left, upper, right, lower = box
+        return level.resize((right - left, lower - upper), box=(left * fx, upper * fy, right * fx, lower * fy))
+
+
 def add_dpi_to_png_buffer(image_bytes: bytes, dpi: Union[int, Tuple[int, int]] = 300) -> bytes:
     """
     adds dpi information to a png image
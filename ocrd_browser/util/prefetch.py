@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from functools import partial
+from threading import RLock
+from typing import Callable, Dict, Generic, Hashable, Iterable, List, Optional, TypeVar, Union
+
+from ocrd_utils import getLogger
+
+from .cache import LruCache, LruCacheView
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+ReadyCallback = Callable[[K, Optional[V]], None]
+
+__all__ = ['Prefetcher']
+
+
+class Prefetcher(Generic[K, V]):
+    """
+    Loads values for keys ahead of time in a background thread pool and keeps the most recent results
+
+    Usage:
+    > prefetcher = Prefetcher(render_page, max_workers=2, max_results=4)
+    > prefetcher.prefetch(['PHYS_0018', 'PHYS_0016'])  # queues loading, cancels queued loading of other keys
+    > prefetcher.get('PHYS_0018')  # the loaded value if already finished, else None
+    > prefetcher.when_ready('PHYS_0016', callback)  # calls callback('PHYS_0016', value) from the loading thread
+
+    With a weigher (returning the number of bytes of a value) the results count against the shared memory budget
+    ([Cache] memory) and might get evicted before max_results is reached.
+    """
+
+    def __init__(self, load: Callable[[K], V], max_workers: int = 2, max_results: int = 4,
+                 weigher: Optional[Callable[[V], int]] = None):
+        self.load = load
+        self.results: Union[LruCache[K, V], LruCacheView[K, V]]
+        self.results = LruCacheView(weigher, max_entries=max_results) if weigher else LruCache(max_results)
+        self.futures: Dict[K, Future[V]] = {}
+        self._callbacks: Dict[K, List[ReadyCallback[K, V]]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='prefetch')
+        self._lock = RLock()
+
+    def prefetch(self, keys: Iterable[K]) -> None:
+        """
+        Queues loading of keys in the given order, queued but not yet started loading of other keys gets cancelled
+
+        Keys that are still queued from an earlier call get queued again, so the order of keys is the order of loading.
+        """
+        keys = list(keys)
+        with self._lock:
+            for key, future in list(self.futures.items()):
+                if future.cancel():
+                    self.futures.pop(key, None)
+                    if key not in keys:
+                        self._callbacks.pop(key, None)
+            for key in keys:
+                if key not in self.futures and key not in self.results:
+                    future = self._executor.submit(self.load, key)
+                    self.futures[key] = future
+                    future.add_done_callback(partial(self._done, key))
+
+    def get(self, key: K, wait: bool = False) -> Optional[V]:
+        """
+        Returns the prefetched value for key or None
+
+        With wait=True a running or queued load for key is awaited instead of returning None,
+        None if the load fails or gets cancelled meanwhile (by prefetch of other keys, discard or clear)
+        """
+        if key in self.results:
+            return self.results.get(key)
+        if wait:
+            with self._lock:
+                future = self.futures.get(key)
+            if future is not None:
+                try:
+                    return future.result()
+                except CancelledError:
+                    return None
+                except Exception:
+                    # Logged by _done
+                    return None
+        return None
+
+    def when_ready(self, key: K, callback: ReadyCallback[K, V]) -> None:
+        """
+        Calls callback(key, value) once the value for key got loaded, value is None if loading failed
+
+        The callback gets called from the loading thread, or right away if the value is already loaded.
+        If key is neither loaded nor loading, callback gets called right away with None.
+        Callbacks of keys that get cancelled or discarded are never called.
+        """
+        with self._lock:
+            if key in self.futures:
+                self._callbacks.setdefault(key, []).append(callback)
+                return
+            value = self.results.get(key)
+        callback(key, value)
+
+    def discard(self, key: K) -> None:
+        with self._lock:
+            future = self.futures.pop(key, None)
+            if future:
+                future.cancel()
+            self._callbacks.pop(key, None)
+        self.results.discard(key)
+
+    def clear(self) -> None:
+        """
+        Cancels all queued loads and forgets all results, running loads finish but their results are dropped
+        """
+        with self._lock:
+            for future in list(self.futures.values()):
+                future.cancel()
+            self.futures.clear()
+            self._callbacks.clear()
+        self.results.clear()
+
+    def shutdown(self) -> None:
+        self.clear()
+        self._executor.shutdown(wait=False)
+
+    def _done(self, key: K, future: Future[V]) -> None:
+        with self._lock:
+            if self.futures.get(key) is not future:
+                # discarded or cleared in the meantime
+                return
+            del self.futures[key]
+            if future.cancelled():
+                return
+            value = None
+            exception = future.exception()
+            if exception is None:
+                value = future.result()
+                self.results.put(key, value)
+            callbacks = self._callbacks.pop(key, [])
+        if exception is not None:
+            log = getLogger('ocrd_browser.util.prefetch.Prefetcher')
+            log.error('Prefetching %s failed: %s', key, exception)
+        for callback in callbacks:
+            callback(key, value)
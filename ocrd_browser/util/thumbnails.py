@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import cv2
+import os
+
+from hashlib import md5
+from io import BytesIO
+from math import ceil
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock, Thread
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+from PIL import Image, PngImagePlugin, TiffImagePlugin, UnidentifiedImageError
+from gi.repository import GLib
+from ocrd_utils import getLogger
+
+from .config import Thumbnails
+from .image import ImagePyramid, pil_scale
+
+__all__ = ['Thumbnail', 'ThumbnailCache', 'load_thumbnail']
+
+SOFTWARE = 'ocrd-browser'
+# Names of the thumbnails ocrd-browser wrote, in the thumbnail directory
+INDEX = '.ocrd-browser-index'
+
+# TIFF tags
+NEW_SUBFILE_TYPE = 254
+JPEG_INTERCHANGE_FORMAT = 513
+JPEG_INTERCHANGE_FORMAT_LENGTH = 514
+
+
+class Thumbnail(NamedTuple):
+    image: Image.Image
+    # Size of the original image
+    width: int
+    height: int
+
+
+class ThumbnailCache:
+    """
+    Persistent thumbnail cache following the freedesktop.org thumbnail specification
+
+    Thumbnails are PNGs named after the md5 of the file URI and are only valid as long as the
+    modification time and size stored in them match the file, so other applications can share them.
+    max_size only counts and evicts the thumbnails written by ocrd-browser, which are listed in an index file. The
+    ones of other applications in the shared directory are never looked at. Eviction runs in a background thread.
+    See https://specifications.freedesktop.org/thumbnail-spec/latest/
+
+    Usage:
+    > cache = ThumbnailCache.from_settings(SettingsFactory.settings().thumbnails, document.directory)
+    > thumbnail = cache.get(path) or cache.put(path, Image.open(path))
+    """
+    FLAVOR = 'large'
+    SIZE = 256
+
+    def __init__(self, directory: Path, max_size: Optional[int] = None, eviction: str = 'lru'):
+        """
+        :param directory: Base directory of the cache, thumbnails go into its "large" subdirectory
+        :param max_size: Maximum total size of the thumbnails in bytes, None for no limit
+        :param eviction: 'lru' drops least recently used thumbnails first, 'fifo' the oldest ones
+        """
+        self.directory = directory / self.FLAVOR
+        self.max_size = max_size
+        self.eviction = eviction
+        self._size: Optional[int] = None
+        self._evicting = False
+        self._lock = Lock()
+
+    @classmethod
+    def from_settings(cls, settings: Thumbnails, workspace_directory: Optional[Path] = None) -> Optional[ThumbnailCache]:
+        """
+        Creates the cache configured in [Thumbnails], None if thumbnail caching is disabled
+
+        A relative directory is relative to the workspace, the default is the shared ~/.cache/thumbnails
+        """
+        if settings.max_size == 0:
+            return None
+        if settings.directory is None:
+            directory = Path(GLib.get_user_cache_dir()) / 'thumbnails'
+        else:
+            directory = Path(settings.directory).expanduser()
+            if not directory.is_absolute():
+                if workspace_directory is None:
+                    return None
+                directory = workspace_directory / directory
+        return cls(directory, settings.max_size * 1024 * 1024, settings.eviction)
+
+    @staticmethod
+    def uri(path: Union[Path, str]) -> str:
+        return Path(path).absolute().as_uri()
+
+    def thumbnail_path(self, path: Union[Path, str]) -> Path:
+        return self.directory / (md5(self.uri(path).encode()).hexdigest() + '.png')
+
+    def get(self, path: Union[Path, str]) -> Optional[Thumbnail]:
+        """
+        The cached thumbnail for path, None if there is none or the file changed since it was cached
+        """
+        thumbnail_path = self.thumbnail_path(path)
+        try:
+            stat = os.stat(path)
+            with Image.open(thumbnail_path) as thumbnail:
+                text = getattr(thumbnail, 'text', {})
+                if text.get('Thumb::URI') != self.uri(path) or text.get('Thumb::MTime') != str(int(stat.st_mtime)):
+                    return None
+                if 'Thumb::Size' in text and text['Thumb::Size'] != str(stat.st_size):
+                    return None
+                thumbnail.load()
+                width, height = int(text.get('Thumb::Image::Width', 0)), int(text.get('Thumb::Image::Height', 0))
+                if self.eviction == 'lru':
+                    os.utime(thumbnail_path)
+                return Thumbnail(thumbnail.copy(), width, height)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, path: Union[Path, str], image: Image.Image, size: Optional[Tuple[int, int]] = None) -> Thumbnail:
+        """
+        Scales image down to a thumbnail, stores it for path and returns it
+
+        :param size: Size of the original image, if image is already reduced
+        """
+        width, height = size or image.size
+        stat = os.stat(path)
+        thumbnail = image.copy() if image.mode in ('RGB', 'RGBA') else image.convert('RGB')
+        thumbnail.thumbnail((self.SIZE, self.SIZE))
+        info = PngImagePlugin.PngInfo()
+        info.add_text('Thumb::URI', self.uri(path))
+        info.add_text('Thumb::MTime', str(int(stat.st_mtime)))
+        info.add_text('Thumb::Size', str(stat.st_size))
+        info.add_text('Thumb::Image::Width', str(width))
+        info.add_text('Thumb::Image::Height', str(height))
+        info.add_text('Software', SOFTWARE)
+        try:
+            self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            # Write to a temporary file first, so no other process ever sees a partial thumbnail
+            with NamedTemporaryFile(dir=self.directory, prefix='.ocrd-browser-', suffix='.png', delete=False) as file:
+                thumbnail.save(file, 'PNG', pnginfo=info)
+            os.chmod(file.name, 0o600)
+            os.replace(file.name, self.thumbnail_path(path))
+            self._added(self.thumbnail_path(path))
+        except OSError as e:
+            getLogger('ocrd_browser.util.thumbnails.ThumbnailCache').warning('Could not cache thumbnail for %s: %s', path, e)
+        return Thumbnail(thumbnail, width, height)
+
+    def evict(self) -> None:
+        """
+        Deletes thumbnails written by ocrd-browser until they fit into max_size again
+
+        Only the thumbnails in the index get looked at, the index gets rewritten without the deleted and vanished ones.
+        """
+        if self.max_size is None:
+            return
+        with self._lock:
+            index = self.directory / INDEX
+            try:
+                with open(index) as file:
+                    names = list(dict.fromkeys(line.strip() for line in file if line.strip()))
+            except FileNotFoundError:
+                return
+            entries = []
+            for name in names:
+                try:
+                    stat = os.stat(self.directory / name)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+            self._size = sum(size for _, size, _ in entries)
+            kept = []
+            # lru: get() touches the thumbnails, so the modification time is the time of last use
+            for _, size, name in sorted(entries):
+                if self._size > self.max_size:
+                    if not self._is_own(self.directory / name):
+                        # Replaced by another application meanwhile
+                        self._size -= size
+                        continue
+                    try:
+                        os.remove(self.directory / name)
+                        self._size -= size
+                        continue
+                    except OSError:
+                        pass
+                kept.append(name)
+            try:
+                with NamedTemporaryFile('w', dir=self.directory, prefix=INDEX + '.', delete=False) as temporary:
+                    temporary.writelines(name + '\n' for name in kept)
+                os.replace(temporary.name, index)
+            except OSError as e:
+                getLogger('ocrd_browser.util.thumbnails.ThumbnailCache').warning('Could not update %s: %s', index, e)
+
+    @staticmethod
+    def _is_own(path: Path) -> bool:
+        """
+        Whether ocrd-browser wrote the thumbnail at path, its tEXt chunks precede the image data, so only the header gets read
+        """
+        try:
+            with Image.open(path) as thumbnail:
+                return bool(thumbnail.info.get('Software') == SOFTWARE)
+        except (OSError, ValueError):
+            return False
+
+    def _added(self, thumbnail_path: Path) -> None:
+        """
+        Adds the thumbnail to the index and starts evicting in the background if the cache got full
+        """
+        size = os.path.getsize(thumbnail_path)
+        with self._lock:
+            with open(self.directory / INDEX, 'a') as index:
+                index.write(thumbnail_path.name + '\n')
+            if self.max_size is None:
+                return
+            if self._size is not None:
+                self._size += size
+            if (self._size is None or self._size > self.max_size) and not self._evicting:
+                self._evicting = True
+                Thread(target=self._evict_in_background, name='thumbnail-eviction', daemon=True).start()
+
+    def _evict_in_background(self) -> None:
+        try:
+            self.evict()
+        finally:
+            with self._lock:
+                self._evicting = False
+
+
+def load_thumbnail(path: Union[Path, str], width: int) -> Thumbnail:
+    """
+    Decodes the image at path at the lowest resolution the file offers that is at least width pixels wide
+
+    In order of preference:
+     * an embedded EXIF thumbnail (JPEG)
+     * a reduced resolution image from the following IFDs (TIFF)
+     * DCT scaled decoding by 1/2, 1/4 or 1/8 (JPEG)
+     * a full decode
+    """
+    size = None
+    try:
+        with Image.open(path) as image:
+            size = image.size
+            reduced = None
+            try:
+                reduced = _exif_thumbnail(image, width) or _tiff_reduced(image, width)
+            except Exception as e:
+                getLogger('ocrd_browser.util.thumbnails.load_thumbnail').debug('No reduced image in %s: %s', path, e)
+            if reduced is not None:
+                return Thumbnail(_reduce(reduced, width), *size)
+            if image.format == 'JPEG':
+                image.draft('RGB', (width, ceil(width * image.height / image.width)))
+                return Thumbnail(_reduce(image, width), *size)
+    except UnidentifiedImageError:
+        pass
+    # OpenCV decodes TIFF and PNG faster than Pillow and scales them down while decoding
+    flags = cv2.IMREAD_COLOR
+    if size:
+        for factor, reduced_flags in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if size[0] >= factor * width:
+                flags = reduced_flags
+                break
+    decoded = cv2.imread(str(path), flags)
+    if decoded is None:
+        raise ValueError('Could not decode {}'.format(path))
+    height, original_width = decoded.shape[:2]
+    return Thumbnail(Image.fromarray(cv2.cvtColor(decoded, cv2.COLOR_BGR2RGB)), *(size or (original_width, height)))
+
+
+def _reduce(image: Image.Image, width: int) -> Image.Image:
+    """
+    Converts image to a mode Image.reduce supports and reduces it by an integer factor to at least width pixels
+    """
+    if image.mode == '1':
+        # Grayscale gives smoother thumbnails than nearest neighbour for bilevel images
+        image = image.convert('L')
+    elif image.mode.startswith('I'):
+        image = pil_scale(image)
+    elif image.mode not in ImagePyramid.REDUCIBLE_MODES:
+        image = image.convert('RGB')
+    factor = image.width // width
+    return image.reduce(factor) if factor > 1 else image.copy()
+
+
+def _matches(original: Tuple[int, int], size: Tuple[int, int], width: int) -> bool:
+    """
+    Can an image of size be a thumbnail of the original size that is at least width pixels wide?
+    """
+    return width <= size[0] < original[0] and abs(size[0] / size[1] - original[0] / original[1]) < 0.01
+
+
+def _exif_thumbnail(image: Image.Image, width: int) -> Optional[Image.Image]:
+    data = image.info.get('exif')
+    if image.format != 'JPEG' or not data:
+        return None
+    if data.startswith(b'Exif\x00\x00'):
+        data = data[6:]
+    fp = BytesIO(data)
+    ifd = TiffImagePlugin.ImageFileDirectory_v2(data[:8])
+    # The thumbnail is described in the second IFD (IFD1)
+    for _ in range(2):
+        if not ifd.next:
+            return None
+        fp.seek(ifd.next)
+        ifd.load(fp)
+    offset, length = ifd.get(JPEG_INTERCHANGE_FORMAT), ifd.get(JPEG_INTERCHANGE_FORMAT_LENGTH)
+    if not offset or not length:
+        return None
+    thumbnail = Image.open(BytesIO(data[offset:offset + length]))
+    if not _matches(image.size, thumbnail.size, width):
+        return None
+    thumbnail.load()
+    return thumbnail
+
+
+def _tiff_reduced(image: Image.Image, width: int) -> Optional[Image.Image]:
+    """
+    The smallest suitable reduced resolution image from the IFDs following the first one
+
+    SubIFDs are not supported, Pillow has no public API to decode them.
+    """
+    if not isinstance(image, TiffImagePlugin.TiffImageFile):
+        return None
+    original = image.size
+    # (width, frame) of all suitable reduced resolution images
+    candidates: List[Tuple[int, int]] = []
+    frame = 1
+    while True:
+        try:
+            image.seek(frame)
+        except EOFError:
+            break
+        if not image.tag_v2.get(NEW_SUBFILE_TYPE, 0) & 1:
+            # Not a reduced resolution image but the next page
+            break
+        if _matches(original, image.size, width):
+            candidates.append((image.width, frame))
+        frame += 1
+    if not candidates:
+        return None
+    _, frame = min(candidates)
+    image.seek(frame)
+    image.load()
+    return image.copy()
@@ -1,15 +1,18 @@
-from gi.repository import Gtk, Pango, GObject
+from gi.repository import Gtk, Gdk, GdkPixbuf, Pango, GObject
 
-from typing import List, Any, Optional, Dict, cast, TYPE_CHECKING
+from typing import List, Any, Optional, Dict, Tuple, cast, TYPE_CHECKING
 
-from math import log
+from math import ceil, log
 from enum import Enum
 
 from ocrd_utils.constants import MIMETYPE_PAGE, MIME_TO_EXT
+from ocrd_browser.util.cache import LruCacheView
 from ocrd_browser.util.file_groups import FileGroupHandle
 from ocrd_browser.util.gtk import WhenIdle
+from ocrd_browser.util.image import ImagePyramid, pil_to_pixbuf
 
 if TYPE_CHECKING:
+    from cairo import Context
     from ocrd_browser.model import Document, Page
 
 
@@ -92,6 +95,9 @@ class View:
     def pages_selected(self, _sender: Gtk.Widget, page_ids: List[str]) -> None:
         pass
 
+    def document_changed(self, _sender: Gtk.Widget, subtype: str, changes: Any) -> None:
+        pass
+
     def reload(self) -> None:
         if self.page_id:
             self.current = self.document.page_for_id(self.page_id, self.use_file_group)
@@ -222,7 +228,7 @@ class FileGroupSelector(Gtk.Box, Configurator):
         value = FileGroupHandle.cast(value)
         self.value = value
         active_id = None
-        for id_, group, mime, _ext in self.groups.get_model():
+        for id_, group, mime, *_ in self.groups.get_model():
             if (value.group is None or value.group == group) and (value.mime is None or value.mime == mime):
                 active_id = id_
                 break
@@ -249,10 +255,12 @@ class FileGroupComboBox(Gtk.ComboBox):
     COLUMN_GROUP = 1
     COLUMN_MIME = 2
     COLUMN_EXT = 3
+    COLUMN_FILES = 4
+    COLUMN_PAGES = 5
 
     def __init__(self, filter_: Optional['FileGroupFilter'] = None, show_mime: bool = False, show_ext: bool = True):
         Gtk.ComboBox.__init__(self, visible=True, has_tooltip=True, popup_fixed_width=False)
-        self.set_model(Gtk.ListStore(str, str, str, str))
+        self.set_model(Gtk.ListStore(str, str, str, str, int, int))
         self.filter = filter_
         self.set_id_column(self.COLUMN_ID)
 
@@ -268,8 +276,9 @@ class FileGroupComboBox(Gtk.ComboBox):
         model = self.get_model()
         if len(model) > 0:
             row = self.get_model()[self.get_active()][:]
-            phs = {'fileGrp': row[self.COLUMN_GROUP], 'ext': row[self.COLUMN_EXT], 'mime': row[self.COLUMN_MIME]}
-            tooltip.set_text('fileGrp: {fileGrp} (Mime-Type: {mime})'.format(**phs))
+            phs = {'fileGrp': row[self.COLUMN_GROUP], 'ext': row[self.COLUMN_EXT], 'mime': row[self.COLUMN_MIME],
+                   'files': row[self.COLUMN_FILES], 'pages': row[self.COLUMN_PAGES]}
+            tooltip.set_text('fileGrp: {fileGrp} (Mime-Type: {mime}), {files} files on {pages} pages'.format(**phs))
             return True
         return False
 
@@ -288,13 +297,13 @@ class FileGroupComboBox(Gtk.ComboBox):
 
 class FileGroupModel(Gtk.ListStore):
     def __init__(self, document: 'Document'):
-        super().__init__(str, str, str, str)
-        for fg in document.file_groups:
+        super().__init__(str, str, str, str, int, int)
+        for fg, stats in document.file_group_stats.items():
             if fg.mime == 'text/html':
                 ext = '.html'
             else:
                 ext = MIME_TO_EXT.get(fg.mime, '.???')
-            self.append((fg.key, fg.group, fg.mime, ext))
+            self.append((fg.key, fg.group, fg.mime, ext, stats.files, stats.pages))
 
     @classmethod
     def build(cls, document: 'Document', filter_: 'FileGroupFilter' = None) -> 'FileGroupModel':
@@ -354,3 +363,70 @@ class SplitViewButton(Gtk.Button):
         self.set_always_show_image(True)
         # noinspection PyArgumentList
         self.set_image(Gtk.Image.new_from_icon_name('split-{}'.format(direction), Gtk.IconSize.SMALL_TOOLBAR))
+
+
+class TiledImage(Gtk.DrawingArea):
+    """
+    Shows an ImagePyramid scaled to a height, horizontally centered like a Gtk.Image
+
+    Only the tiles intersecting the visible area get scaled and converted to pixbufs,
+    so zooming into very large images never needs a pixbuf of the whole scaled image.
+    The most recently drawn tiles are cached within the shared memory budget ([Cache] memory).
+    """
+    TILE_SIZE = 256
+    MAX_TILES = 256
+
+    def __init__(self, **properties: Any):
+        super().__init__(**properties)
+        self.pyramid: Optional[ImagePyramid] = None
+        self.width = 0
+        self.height = 0
+        self.tiles: LruCacheView[Tuple[int, int, int], GdkPixbuf.Pixbuf] = LruCacheView(
+            lambda pixbuf: pixbuf.get_byte_length(), max_entries=self.MAX_TILES
+        )
+        self.connect('draw', self._on_draw)
+
+    def set_image(self, pyramid: Optional[ImagePyramid], height: int = 0) -> None:
+        if pyramid is not self.pyramid:
+            self.tiles.clear()
+        self.pyramid = pyramid
+        self.width, self.height = pyramid.scaled_size(None, max(1, height)) if pyramid else (0, 0)
+        self.set_size_request(self.width, self.height)
+        self.queue_draw()
+
+    @property
+    def offset(self) -> int:
+        return max(0, (int(self.get_allocated_width()) - self.width) // 2)
+
+    def tile(self, column: int, row: int) -> GdkPixbuf.Pixbuf:
+        key = (self.height, column, row)
+        pixbuf = self.tiles.get(key)
+        if pixbuf is None:
+            assert self.pyramid is not None
+            x, y = column * self.TILE_SIZE, row * self.TILE_SIZE
+            box = (x, y, min(x + self.TILE_SIZE, self.width), min(y + self.TILE_SIZE, self.height))
+            pixbuf = pil_to_pixbuf(self.pyramid.region(self.height, box))
+            self.tiles.put(key, pixbuf)
+        return pixbuf
+
+    def visible_tiles(self, left: float, top: float, right: float, bottom: float) -> List[Tuple[int, int]]:
+        """
+        (column, row) of all tiles intersecting the rectangle in widget coordinates
+        """
+        if not self.pyramid or not self.width or not self.height:
+            return []
+        offset = self.offset
+        columns = range(max(0, int(left - offset) // self.TILE_SIZE), min(ceil(self.width / self.TILE_SIZE), int(right - offset) // self.TILE_SIZE + 1))
+        rows = range(max(0, int(top) // self.TILE_SIZE), min(ceil(self.height / self.TILE_SIZE), int(bottom) // self.TILE_SIZE + 1))
+        return [(column, row) for row in rows for column in columns]
+
+    def _on_draw(self, _area: Gtk.DrawingArea, context: 'Context[Any]') -> bool:
+        # The clip is the part of the widget the Gtk.Viewport actually shows
+        offset = self.offset
+        for column, row in self.visible_tiles(*context.clip_extents()):
+            pixbuf = self.tile(column, row)
+            x, y = offset + column * self.TILE_SIZE, row * self.TILE_SIZE
+            Gdk.cairo_set_source_pixbuf(context, pixbuf, x, y)
+            context.rectangle(x, y, pixbuf.get_width(), pixbuf.get_height())
+            context.fill()
+        return False
@@ -3,7 +3,7 @@ from gi.repository import Gtk, Gdk, GLib, Gio
 from typing import Any, List, Optional
 
 from itertools import zip_longest
-from ocrd_browser.util.image import pil_to_pixbuf, pil_scale
+from ocrd_browser.util.image import pil_to_pixbuf
 from .base import (
     View,
     FileGroupSelector,
@@ -146,12 +146,13 @@ class ViewImages(View):
                 self.last_rescale = scale_config.value
                 for box, page in zip_longest(self.image_box.get_children(), self.pages):
                     images = {child.get_name(): child for child in box.get_children()}
-                    for i, img in enumerate(page.images if page else [None]):
+                    # The pyramids of Page are cached, so zooming does not resample the full images over and over
+                    for i, pyramid in enumerate(page.pyramids if page else [None]):
                         name = 'image_{}'.format(i)
                         image: Gtk.Image
                         image = images[name]
-                        if img:
-                            thumbnail = pil_scale(img, None, int(scale_config.get_exp() * img.height))
+                        if pyramid:
+                            thumbnail = pyramid.scale(None, int(scale_config.get_exp() * pyramid.image.height))
                             image.set_from_pixbuf(pil_to_pixbuf(thumbnail))
 
     def on_button(self, _widget: Gtk.EventBox, event: Gdk.EventButton) -> bool:
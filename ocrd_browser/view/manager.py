@@ -110,12 +110,14 @@ class ViewManager:
         try:
             win.disconnect_by_func(view.page_activated)
             win.disconnect_by_func(view.pages_selected)
+            win.disconnect_by_func(view.document_changed)
         except Exception as e:
             print(e)
 
     def connect(self, win: Gtk.Window, view: View) -> None:
         win.connect('page_activated', view.page_activated)
         win.connect('pages_selected', view.pages_selected)
+        win.connect('document_changed', view.document_changed)
 
     def print(self) -> None:
         return
@@ -2,6 +2,7 @@ from gi.repository import Gtk, Gdk, GObject, Pango, Gio, GLib
 
 from typing import Any, Optional, Tuple, Dict, List, NamedTuple, FrozenSet
 
+from math import ceil
 from pathlib import Path
 from PIL import Image
 from cairo import Context
@@ -10,19 +11,22 @@ from xml.sax.saxutils import escape
 from ocrd_models.ocrd_page import AlternativeImageType
 from shapely.geometry import Polygon
 
-from ocrd_browser.util.image import pil_to_pixbuf, pil_scale
+from ocrd_browser.util.image import ImagePyramid
 from ocrd_utils.constants import MIMETYPE_PAGE
 from .base import (
     View,
     FileGroupSelector,
     FileGroupFilter,
     ImageZoomSelector,
-    Configurator
+    Configurator,
+    TiledImage
 )
 from ..model import Page, Document, IMAGE_FROM_PAGE_FILENAME_SUPPORT
 from ..model.page_xml_renderer import PageXmlRenderer, RegionMap, Feature, Region
+from ..util.config import SettingsFactory
 from ..util.file_groups import FileGroupHandle
 from ..util.gtk import WhenIdle, ActionRegistry
+from ..util.prefetch import Prefetcher
 
 
 class FeatureDescription:
@@ -116,6 +120,116 @@ class ImageVersion(NamedTuple):
         return versions
 
 
+class PageRendering:
+    """
+    A rendered page: the composited image, its RegionMap and the ImagePyramid to display it
+
+    The image might be rendered at a lower scale, size and the RegionMap refer to the unscaled page image
+    """
+    def __init__(self, request: 'PageRenderRequest', page: Page, image: Image.Image, region_map: RegionMap, size: Tuple[int, int]):
+        self.request = request
+        self.page = page
+        self.image = image
+        self.region_map = region_map
+        self.size = size
+        self.pyramid = ImagePyramid(image)
+
+    def prepare(self, scale: float) -> None:
+        """
+        Builds the pyramid level needed to display the page at scale
+        """
+        self.pyramid.level(self.pyramid.level_for(None, int(scale * self.size[1])))
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Estimated memory footprint in bytes, weighs the rendering in the shared memory budget ([Cache] memory)
+        """
+        return self.pyramid.nbytes
+
+
+class PagePlaceholder:
+    """
+    A low resolution preview of a page image, shown while the PageRendering is not ready
+    """
+    SIZE = 384
+
+    def __init__(self, image: Image.Image, height: int):
+        self.image = image
+        self.height = height
+        self.pyramid = ImagePyramid(image)
+
+    @classmethod
+    def from_file(cls, path: Path) -> 'PagePlaceholder':
+        with Image.open(path) as image:
+            height = image.height
+            # Lets the JPEG decoder skip detail we don't need, no-op for other formats
+            image.draft('RGB', (cls.SIZE, cls.SIZE))
+            image.thumbnail((cls.SIZE, cls.SIZE))
+            return cls(image.copy(), height)
+
+
+class PageRenderRequest(NamedTuple):
+    """
+    Everything needed to render a page like ViewPage does, usable as a (prefetch) cache key
+
+    The image version is identified by its fileGrp and features instead of its path,
+    so the same request can be applied to neighbouring pages.
+    """
+    page_id: str
+    file_group: Optional[str]
+    features: Feature
+    image_group: Optional[str]
+    image_features: str
+    scale: float = 1.0
+
+    @classmethod
+    def create(cls, page_id: str, file_group: Optional[str], features: Feature, image_version: Tuple[Optional[str], str], scale: float = 1.0) -> 'PageRenderRequest':
+        path, image_features = image_version
+        return cls(page_id, file_group, features, Path(path).parent.name if path else None, image_features, scale)
+
+    def image_filename(self, doc: Document, page: Page) -> Optional[str]:
+        """
+        Finds the page's image version with matching fileGrp and features, like ImageVersionSelector.set_page does
+        """
+        if self.image_group is None:
+            return None
+        for version in ImageVersion.list_from_page(doc, page):
+            if version.path.parent.name == self.image_group and ','.join(sorted(version.features)) == self.image_features:
+                return str(version.path)
+        return None
+
+    def placeholder(self, doc: Document) -> Optional[PagePlaceholder]:
+        page = doc.page_for_id(self.page_id, self.file_group)
+        if not page:
+            return None
+        filename = self.image_filename(doc, page) if IMAGE_FROM_PAGE_FILENAME_SUPPORT else None
+        if not filename and page.pc_gts:
+            filename = page.pc_gts.get_Page().imageFilename
+        if not filename and page.image_files:
+            filename = page.image_files[0].local_filename
+        path = doc.path(filename) if filename else None
+        return PagePlaceholder.from_file(path) if path and path.exists() else None
+
+    def render(self, doc: Document, page: Optional[Page] = None) -> Optional[PageRendering]:
+        page = page or doc.page_for_id(self.page_id, self.file_group)
+        if not page:
+            return None
+        selected_features = ImageFeatures.from_string(self.image_features)
+        parameters = {
+            'feature_selector': ','.join(selected_features),
+            'feature_filter': ','.join(ImageFeatures.negate(selected_features))
+        }
+        if IMAGE_FROM_PAGE_FILENAME_SUPPORT:
+            parameters['filename'] = self.image_filename(doc, page)
+        page_image, page_coords, _ = page.get_image(**parameters)
+        if not page_image:
+            return None
+        renderer = PageXmlRenderer(page_image, page_coords, page.id, self.features, scale=self.scale)
+        renderer.render_all(page.pc_gts)
+        return PageRendering(self, page, *renderer.get_result(), renderer.size)
+
+
 class ImageVersionSelector(Gtk.Box, Configurator):
 
     COLUMN_FEATURES = 0
@@ -297,10 +411,14 @@ class ViewPage(View):
 
         # GTK
         self.image: Optional[Gtk.Image] = None
+        self.canvas: Optional[TiledImage] = None
         self.highlight: Optional[Gtk.DrawingArea] = None
         self.status_bar: Optional[Gtk.Box] = None
 
         # Data
+        self.rendering: Optional[PageRendering] = None
+        self.placeholder: Optional[PagePlaceholder] = None
+        self.pending: Optional[PageRenderRequest] = None
         self.page_image: Optional[Image.Image] = None
         self.region_map: Optional[RegionMap] = None
         self.t: Optional[Transformation] = None
@@ -308,6 +426,15 @@ class ViewPage(View):
         self.last_rescale: int = -100
         self.viewport_size: Gdk.Rectangle
 
+        prefetch_settings = SettingsFactory.settings().prefetch
+        self.prefetcher: Prefetcher[PageRenderRequest, Optional[PageRendering]] = Prefetcher(
+            self._prefetch_rendering, prefetch_settings.workers, prefetch_settings.next + prefetch_settings.previous + 1,
+            weigher=lambda rendering: rendering.nbytes if rendering else 0
+        )
+        self.placeholders: Prefetcher[PageRenderRequest, Optional[PagePlaceholder]] = Prefetcher(
+            lambda request: request.placeholder(self.document), 1, prefetch_settings.next + prefetch_settings.previous + 1
+        )
+
     def build(self) -> None:
         super(ViewPage, self).build()
 
@@ -325,6 +452,11 @@ class ViewPage(View):
         actions.create(name='zoom_to', param_type=GLib.VariantType('s'), callback=self._on_zoom_to)
 
         self.image = Gtk.Image(visible=True, icon_name='gtk-missing-image', icon_size=Gtk.IconSize.DIALOG, valign=Gtk.Align.START)
+        self.canvas = TiledImage(visible=False, valign=Gtk.Align.START)
+        self.canvas.connect('size-allocate', lambda *_args: self.update_transformation())
+        images = Gtk.Box(visible=True, orientation=Gtk.Orientation.VERTICAL)
+        images.pack_start(self.image, False, False, 0)
+        images.pack_start(self.canvas, False, False, 0)
 
         self.highlight = Gtk.DrawingArea(visible=True, valign=Gtk.Align.FILL, halign=Gtk.Align.FILL, can_focus=True, has_focus=True, focus_on_click=True, is_focus=True)
         self.highlight.add_events(Gdk.EventMask.SMOOTH_SCROLL_MASK | Gdk.EventMask.BUTTON_PRESS_MASK | Gdk.EventMask.POINTER_MOTION_MASK)
@@ -337,7 +469,7 @@ class ViewPage(View):
         self.highlight.insert_action_group("view", actions.for_widget)
 
         overlay = Gtk.Overlay(visible=True)
-        overlay.add(self.image)
+        overlay.add(images)
         overlay.add_overlay(self.highlight)
 
         viewport = Gtk.Viewport(visible=True, hscroll_policy='natural', vscroll_policy='natural')
@@ -345,6 +477,7 @@ class ViewPage(View):
         viewport.add(overlay)
 
         self.scroller.add(viewport)
+        self.container.connect('destroy', self._on_destroy)
         self.status_bar = Gtk.Box(visible=True, orientation=Gtk.Orientation.HORIZONTAL)
         self.container.pack_end(self.status_bar, False, False, 0)
         self.update_status_bar()
@@ -357,44 +490,135 @@ class ViewPage(View):
             WhenIdle.call(self.redraw, priority=50)
         if name == 'scale':
             WhenIdle.call(self.rescale)
+            shown = self.pending or (self.rendering and self.rendering.request)
+            if self.current and (not shown or self.render_scale > shown.scale):
+                # Zoomed in past the resolution the page was rendered at, zooming out is served by its pyramid
+                WhenIdle.call(self.redraw, priority=50)
 
     @property
     def use_file_group(self) -> str:
         return self.file_group.group
 
+    def set_document(self, document: Document) -> None:
+        self.pending = None
+        self.prefetcher.clear()
+        self.placeholders.clear()
+        super().set_document(document)
+
+    def document_changed(self, _sender: Gtk.Widget, subtype: str, changes: Any) -> None:
+        self.prefetcher.clear()
+        self.placeholders.clear()
+
+    def render_request(self, page_id: str) -> PageRenderRequest:
+        return PageRenderRequest.create(page_id, self.use_file_group, self.features, self.image_version, self.render_scale)
+
+    @property
+    def render_scale(self) -> float:
+        """
+        Pages get rendered at the next power of two at or above the zoom level, at most at full resolution
+        """
+        return float(min(1.0, 2.0 ** ceil(self.scale)))
+
     def redraw(self) -> None:
-        got_result = False
-        if self.current:
-            selected_features = ImageFeatures.from_string(self.image_version[1])
-            parameters = {
-                'feature_selector': ','.join(selected_features),
-                'feature_filter': ','.join(ImageFeatures.negate(selected_features))
-            }
-            if IMAGE_FROM_PAGE_FILENAME_SUPPORT:
-                parameters['filename'] = self.image_version[0]
-            page_image, page_coords, _ = self.current.get_image(**parameters)
-            if page_image:
-                renderer = PageXmlRenderer(page_image, page_coords, self.current.id, self.features)
-                renderer.render_all(self.current.pc_gts)
-                self.page_image, self.region_map = renderer.get_result()
-                self.current_region = self.region_map.refetch(self.current_region)
-                got_result = True
-        if not got_result:
-            self.page_image, self.region_map = None, None
+        """
+        Shows the rendering of the current page, if it is not ready yet it gets rendered in the background
+
+        Until then a low resolution placeholder is shown, or the previous rendering if only features or image version changed.
+        """
+        self.pending = None
+        if not self.current:
+            self.show_rendering(None)
+            return
+        request = self.render_request(self.current.id)
+        rendering = self.prefetcher.get(request)
+        if rendering:
+            self.show_rendering(rendering)
+        else:
+            self.pending = request
+            if not self.rendering or self.rendering.page.id != request.page_id:
+                self.show_placeholder(self.placeholders.get(request))
+                if not self.placeholder:
+                    self.placeholders.prefetch([request])
+                    self.placeholders.when_ready(request, lambda key, placeholder: GLib.idle_add(self._on_placeholder, key, placeholder))
+        # Queues the current page first, cancels queued renders for pages and configurations we moved away from
+        self.prefetch()
+        if self.pending:
+            self.prefetcher.when_ready(request, lambda key, rendering: GLib.idle_add(self._on_rendered, key, rendering))
+
+    def show_rendering(self, rendering: Optional[PageRendering]) -> None:
+        self.rendering, self.placeholder = rendering, None
+        if self.rendering:
+            self.page_image, self.region_map = self.rendering.image, self.rendering.region_map
+            self.current_region = self.region_map.refetch(self.current_region)
+        else:
+            self.page_image, self.region_map, self.current_region = None, None, None
         self.update_transformation()
         WhenIdle.call(self.rescale, force=True)
 
+    def show_placeholder(self, placeholder: Optional[PagePlaceholder]) -> None:
+        self.rendering, self.placeholder = None, placeholder
+        self.page_image, self.region_map, self.current_region = None, None, None
+        self.t = None
+        self.highlight.queue_draw()
+        WhenIdle.call(self.rescale, force=True)
+
+    def _on_rendered(self, request: PageRenderRequest, rendering: Optional[PageRendering]) -> bool:
+        if request == self.pending:
+            self.pending = None
+            self.show_rendering(rendering)
+        return False
+
+    def _on_placeholder(self, request: PageRenderRequest, placeholder: Optional[PagePlaceholder]) -> bool:
+        if request == self.pending and not self.rendering:
+            self.show_placeholder(placeholder)
+        return False
+
+    def _on_destroy(self, _container: Gtk.Widget) -> None:
+        self.pending = None
+        self.prefetcher.shutdown()
+        self.placeholders.shutdown()
+
+    def prefetch(self) -> None:
+        """
+        Renders the current and then the neighbouring pages with the current configuration in the background
+        """
+        if self.document and self.page_id:
+            settings = SettingsFactory.settings().prefetch
+            page_ids = [self.page_id] + self.document.page_ids_around(self.page_id, settings.previous, settings.next)
+            self.prefetcher.prefetch([self.render_request(page_id) for page_id in page_ids])
+
+    def _prefetch_rendering(self, request: PageRenderRequest) -> Optional[PageRendering]:
+        rendering = request.render(self.document)
+        if rendering:
+            # Prepare the image for the current zoom level, so activating the page just swaps it in
+            rendering.prepare(2.0 ** self.scale)
+        return rendering
+
     def rescale(self, force: bool = False) -> None:
-        if self.page_image:
-            scale_config: ImageZoomSelector = self.configurators['scale']
+        scale_config: ImageZoomSelector = self.configurators['scale']
+        if self.rendering:
             if force or abs(scale_config.value - self.last_rescale) > (scale_config.scale.get_adjustment().get_step_increment() - 0.0001):
                 self.last_rescale = scale_config.value
-                thumbnail = pil_scale(self.page_image, None, int(scale_config.get_exp() * self.page_image.height))
-                self.image.set_from_pixbuf(pil_to_pixbuf(thumbnail))
+                self.show_image(self.rendering.pyramid, int(scale_config.get_exp() * self.rendering.size[1]))
+        elif self.placeholder:
+            self.show_image(self.placeholder.pyramid, int(scale_config.get_exp() * self.placeholder.height))
+        elif self.pending:
+            self.show_icon('image-loading')
         else:
-            self.image.set_from_icon_name('missing-image', Gtk.IconSize.DIALOG)
+            self.show_icon('missing-image')
         self.update_transformation()
 
+    def show_image(self, pyramid: ImagePyramid, height: int) -> None:
+        self.canvas.set_image(pyramid, height)
+        self.canvas.show()
+        self.image.hide()
+
+    def show_icon(self, icon_name: str) -> None:
+        self.canvas.set_image(None)
+        self.canvas.hide()
+        self.image.set_from_icon_name(icon_name, Gtk.IconSize.DIALOG)
+        self.image.show()
+
     def _on_mouse(self, _widget: Gtk.Overlay, e: Gdk.EventButton) -> None:
         if self.t is None or self.region_map is None:
             return
@@ -460,11 +684,14 @@ class ViewPage(View):
         self.update_transformation()
 
     def _on_zoom_to(self, _action: Gio.SimpleAction, to_v: Optional[GLib.Variant] = None) -> None:
+        if self.rendering is None:
+            return
+        width, height = self.rendering.size
         scale_config: ImageZoomSelector = self.configurators['scale']
         scale_config.zoom_to(
             to_v.get_string(),
-            self.viewport_size.width / self.page_image.width,
-            self.viewport_size.height / self.page_image.height
+            self.viewport_size.width / width,
+            self.viewport_size.height / height
         )
         self.update_transformation()
 
@@ -589,18 +816,17 @@ class ViewPage(View):
             context.stroke()
 
     def update_transformation(self) -> None:
-        if self.page_image is None or self.image is None or self.image.get_pixbuf() is None:
+        if self.rendering is None or self.canvas is None or self.canvas.pyramid is not self.rendering.pyramid:
             return
 
-        pb = self.image.get_pixbuf()
-        size, _ = self.image.get_allocated_size()
+        width, height = self.rendering.size
 
         self.t = Transformation(
-            self.page_image.width / pb.get_width(),
-            -(size.width - pb.get_width()) * 0.5,
-            -size.height * 0.0 + pb.get_height() * 0.0,
-            self.page_image.width,
-            self.page_image.height
+            width / self.canvas.width,
+            -self.canvas.offset,
+            0.0,
+            width,
+            height
         )
         self.highlight.queue_draw()
 
@@ -629,4 +855,17 @@ class ViewPage(View):
 
         dialog.destroy()
         if filename:
-            self.page_image.save(filename)
+            image = self.full_resolution_image()
+            if image:
+                image.save(filename)
+
+    def full_resolution_image(self) -> Optional[Image.Image]:
+        """
+        The current page rendered at scale 1.0, the shown rendering might be scaled down for the zoom level
+        """
+        if not self.rendering:
+            return None
+        if self.rendering.request.scale == 1.0:
+            return self.rendering.image
+        rendering = self.rendering.request._replace(scale=1.0).render(self.document, self.rendering.page)
+        return rendering.image if rendering else None
@@ -1,7 +1,15 @@
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from tempfile import TemporaryDirectory
+from tempfile import TemporaryDirectory, gettempdir
+from unittest.mock import patch
 
-from ocrd_browser.util.file_groups import FileGroupHandle
+import numpy as np
+
+from ocrd_browser.util.file_groups import FileGroupHandle, FileGroupStats
 from tests import TestCase, ASSETS_PATH, TEST_BASE_PATH
 from ocrd_browser.model import Document, Page
 from datetime import datetime
@@ -19,6 +27,31 @@ class DocumentTestCase(TestCase):
         doc = Document.load(self.path)
         self.assertEqual(['PHYS_0017', 'PHYS_0020'], doc.page_ids)
 
+    def test_page_ids_around(self):
+        doc = Document.load(self.path)
+        self.assertEqual(['PHYS_0020'], doc.page_ids_around('PHYS_0017', 1, 2))
+        self.assertEqual(['PHYS_0017'], doc.page_ids_around('PHYS_0020', 1, 2))
+        self.assertEqual([], doc.page_ids_around('PHYS_0020', 0, 2))
+        self.assertEqual([], doc.page_ids_around('PHYS_9999', 1, 2))
+
+    def test_page_position(self):
+        doc = Document.load(self.path)
+        self.assertEqual(0, doc.page_position('PHYS_0017'))
+        self.assertEqual(1, doc.page_position('PHYS_0020'))
+        self.assertIsNone(doc.page_position('PHYS_9999'))
+
+    def test_page_position_after_reorder(self):
+        doc = Document.clone(self.path)
+        self.assertEqual(0, doc.page_position('PHYS_0017'))
+        doc.reorder(['PHYS_0020', 'PHYS_0017'])
+        self.assertEqual(1, doc.page_position('PHYS_0017'))
+
+    def test_display_id_range(self):
+        doc = Document.load(self.path)
+        self.assertEqual(['PHYS_0017', 'PHYS_0020'], doc.display_id_range('PHYS_0020', 2))
+        self.assertEqual(['PHYS_0020'], doc.display_id_range('PHYS_0020', 1))
+        self.assertEqual([], doc.display_id_range('PHYS_9999', 2))
+
     def test_get_file_groups(self):
         doc = Document.load(self.path)
         expected = [
@@ -53,6 +86,96 @@ class DocumentTestCase(TestCase):
         self.assertEqual('OCR-D-IMG-BIN_0001.IMG-BIN.png', image_paths['PHYS_0017'].name)
         self.assertEqual('OCR-D-IMG-BIN_0002.IMG-BIN.png', image_paths['PHYS_0020'].name)
 
+    def test_lazy_load(self):
+        path = ASSETS_PATH / '../example/workspaces/kant_aufklaerung_1784_bin/mets.xml'
+        eager = Document.load(path)
+        doc = Document.load(path, lazy=True)
+        group = FileGroupHandle('OCR-D-IMG-BIN', 'image/png')
+        self.assertEqual(eager.page_ids, doc.page_ids)
+        self.assertEqual(eager.file_groups, doc.file_groups)
+        self.assertEqual(eager.get_image_paths(group), doc.get_image_paths(group))
+        self.assertEqual(eager.title, doc.title)
+        loaded = []
+        doc.when_loaded(loaded.append)
+        # Waits for the workspace
+        self.assertEqual(eager.workspace.mets.unique_identifier, doc.workspace.mets.unique_identifier)
+        self.assertFalse(doc.loading)
+        self.assertEqual([doc], loaded)
+        self.assertEqual(eager.get_image_paths(group), doc.get_image_paths(group))
+
+    def test_lazy_load_relative_path(self):
+        cwd = os.getcwd()
+        os.chdir(TEST_BASE_PATH / 'example/workspaces')
+        try:
+            doc = Document.load('kant_aufklaerung_1784_bin/mets.xml', lazy=True)
+            self.assertEqual(doc.page_ids, Document.load(TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin/mets.xml').page_ids)
+            self.assertEqual((TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin').resolve(), Path(doc.workspace.directory).resolve())
+        finally:
+            os.chdir(cwd)
+
+    def test_lazy_load_builds_the_page_file_index_once(self):
+        path = TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin/mets.xml'
+        with patch.object(Document, '_build_page_file_index', wraps=Document._build_page_file_index) as build:
+            doc = Document.load(path, lazy=True)
+            self.assertIn('PHYS_0017', doc.page_file_index)
+        self.assertEqual(1, build.call_count)
+
+    def test_lazy_workspace_is_taken_over_once(self):
+        doc = Document.load(TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin/mets.xml', lazy=True)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            workspaces = list(executor.map(lambda _: doc.workspace, range(16)))
+        self.assertEqual(1, len(set(map(id, workspaces))))
+        self.assertFalse(doc.loading)
+
+    def test_page_file_index(self):
+        doc = Document.load(self.path)
+        images = doc.page_file_index['PHYS_0017'][FileGroupHandle('OCR-D-IMG', 'image/tiff')]
+        self.assertEqual(['INPUT_0017.tif'], [Path(image.local_filename).name for image in images])
+
+    def test_find_page_files_behaves_like_mets_find_files(self):
+        doc = Document.load(self.path)
+        for page_id in doc.page_ids:
+            for file_group, mimetype in [(None, None), ('OCR-D-IMG', None), (None, '//image/.*'), ('OCR-D-GT-PAGE', 'application/vnd.prima.page+xml')]:
+                expected = [file.ID for file in doc.workspace.mets.find_files(pageId=page_id, fileGrp=file_group, mimetype=mimetype)]
+                actual = [file.ID for file in doc.find_page_files(page_id, file_group, mimetype)]
+                self.assertEqual(expected, actual)
+
+    def test_page_file_index_is_patched_on_delete_page(self):
+        doc = Document.clone(self.path)
+        self.assertIn('PHYS_0017', doc.page_file_index)
+        doc.delete_page('PHYS_0017')
+        self.assertNotIn('PHYS_0017', doc.page_file_index)
+        self.assertEqual([], doc.files_for_page_id('PHYS_0017'))
+
+    def test_page_file_index_is_patched_on_add_image(self):
+        doc = Document.clone(self.path)
+        self.assertNotIn('PHYS_0021', doc.page_file_index)
+        doc.add_image(np.zeros((10, 10, 3), dtype=np.uint8), 'PHYS_0021', 'OCR-D-IMG_0021')
+        self.assertEqual(['OCR-D-IMG_0021'], [file.ID for file in doc.find_page_files('PHYS_0021', 'OCR-D-IMG', 'image/png')])
+
+    def test_file_group_stats(self):
+        doc = Document.load(self.path)
+        self.assertEqual(FileGroupStats(2, 2), doc.file_group_stats[FileGroupHandle('OCR-D-IMG', 'image/tiff')])
+        self.assertEqual(doc.file_groups, list(doc.file_group_stats.keys()))
+
+    def test_file_group_stats_are_patched_on_delete_page(self):
+        doc = Document.clone(self.path)
+        self.assertEqual(FileGroupStats(2, 2), doc.file_group_stats[FileGroupHandle('OCR-D-IMG', 'image/tiff')])
+        doc.delete_page('PHYS_0017')
+        self.assertEqual(FileGroupStats(1, 1), doc.file_group_stats[FileGroupHandle('OCR-D-IMG', 'image/tiff')])
+        self.assertEqual(doc._build_file_group_stats(), doc.file_group_stats)
+
+    def test_file_group_stats_are_patched_on_add_image(self):
+        doc = Document.clone(self.path)
+        self.assertNotIn(FileGroupHandle('OCR-D-IMG', 'image/png'), doc.file_group_stats)
+        doc.add_image(np.zeros((10, 10, 3), dtype=np.uint8), 'PHYS_0021', 'OCR-D-IMG_0021')
+        doc.add_image(np.zeros((10, 10, 3), dtype=np.uint8), 'PHYS_0021', 'OCR-D-IMG_0021')
+        self.assertEqual(FileGroupStats(1, 1), doc.file_group_stats[FileGroupHandle('OCR-D-IMG', 'image/png')])
+        self.assertEqual(FileGroupHandle('OCR-D-IMG', 'image/png'), doc.file_groups[-1])
+        doc.delete_images('PHYS_0021', 'OCR-D-IMG')
+        self.assertNotIn(FileGroupHandle('OCR-D-IMG', 'image/png'), doc.file_group_stats)
+        self.assertEqual(doc._build_file_group_stats(), doc.file_group_stats)
+
     def test_get_default_image_group(self):
         doc = Document.load(ASSETS_PATH / 'kant_aufklaerung_1784-complex/data/mets.xml')
         file_group = doc.get_default_image_group(['OCR-D-IMG-BIN', 'OCR-D-IMG.*'])
@@ -87,6 +210,27 @@ class DocumentTestCase(TestCase):
         doc.reorder(['PHYS_0020', 'PHYS_0017'])
         self.assertEqual(['PHYS_0020', 'PHYS_0017'], doc.page_ids)
 
+    def test_reorder_is_saved(self):
+        doc = Document.clone(self.path)
+        doc.reorder(['PHYS_0020', 'PHYS_0017'])
+        self.assertEqual(['PHYS_0020', 'PHYS_0017'], doc.workspace.mets.physical_pages)
+        self.assertEqual(['PHYS_0020', 'PHYS_0017'], Document.load(doc.directory / doc.mets_filename).page_ids)
+
+    def test_reorder_with_mets_caching(self):
+        doc = Document.clone(self.path)
+        # noinspection PyProtectedMember
+        doc.workspace.mets._cache_flag = True
+        doc.workspace.mets.refresh_caches()
+        doc.reorder(['PHYS_0020', 'PHYS_0017'])
+        self.assertEqual(['PHYS_0020', 'PHYS_0017'], doc.workspace.mets.physical_pages)
+        self.assertEqual(1, doc.page_position('PHYS_0017'))
+
+    def test_reorder_with_duplicate_ids_raises_value_error(self):
+        doc = Document.clone(self.path)
+        with self.assertRaises(ValueError):
+            doc.reorder(['PHYS_0020', 'PHYS_0017', 'PHYS_0020'])
+        self.assertEqual(['PHYS_0017', 'PHYS_0020'], doc.page_ids)
+
     def test_reorder_with_wrong_ids_raises_value_error(self):
         doc = Document.clone(self.path)
         with self.assertRaises(ValueError) as context:
@@ -99,6 +243,44 @@ class DocumentTestCase(TestCase):
         doc.delete_page('PHYS_0017')
         self.assertEqual(['PHYS_0020'], doc.page_ids)
 
+    def test_batch_saves_and_emits_once(self):
+        events = []
+        doc = Document.clone(self.path, emitter=lambda *args: events.append(args))
+        with patch.object(doc.workspace, 'save_mets', wraps=doc.workspace.save_mets) as save_mets:
+            with doc.batch():
+                doc.delete_page('PHYS_0017')
+                doc.delete_page('PHYS_0020')
+                self.assertEqual([], events)
+                self.assertFalse(doc.modified)
+        save_mets.assert_called_once()
+        self.assertTrue(doc.modified)
+        self.assertEqual([('document_changed', 'page_deleted', ['PHYS_0017', 'PHYS_0020'])], events)
+
+    def test_batch_keeps_the_order_of_different_changes(self):
+        events = []
+        doc = Document.clone(self.path, emitter=lambda *args: events.append(args))
+        with doc.batch():
+            doc.add_image(np.zeros((10, 10, 3), dtype=np.uint8), 'PHYS_0021', 'OCR-D-IMG_0021')
+            with doc.batch():
+                doc.delete_page('PHYS_0021')
+            doc.reorder(['PHYS_0020', 'PHYS_0017'])
+            doc.reorder(['PHYS_0017', 'PHYS_0020'])
+        self.assertEqual([
+            ('document_changed', 'page_added', ['PHYS_0021']),
+            ('document_changed', 'page_deleted', ['PHYS_0021']),
+            ('document_changed', 'reordered', {'PHYS_0017': 'PHYS_0017', 'PHYS_0020': 'PHYS_0020'}),
+        ], events)
+
+    def test_batch_saves_and_emits_on_exception(self):
+        events = []
+        doc = Document.clone(self.path, emitter=lambda *args: events.append(args))
+        with self.assertRaises(KeyError):
+            with doc.batch():
+                doc.delete_page('PHYS_0017')
+                raise KeyError('PHYS_0020')
+        self.assertEqual([('document_changed', 'page_deleted', ['PHYS_0017'])], events)
+        self.assertEqual(['PHYS_0020'], Document.load(doc.directory / doc.mets_filename).page_ids)
+
     def test_clone(self):
         doc = Document.clone(self.path)
         self.assertIn('browse-ocrd-clone-', doc.workspace.directory)
@@ -109,6 +291,53 @@ class DocumentTestCase(TestCase):
         for original, cloned in zip(sorted(original_files), sorted(cloned_files)):
             self.assertEqual(original.read_bytes(), cloned.read_bytes())
 
+    def test_clone_next_to_the_workspace_with_reflinks(self):
+        path = TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin/mets.xml'
+
+        def fake_reflink(source, destination):
+            shutil.copy2(source, destination)
+            return True
+
+        with patch('ocrd_browser.model.document.reflink', fake_reflink):
+            doc = Document.clone(path)
+        directory = Path(doc.workspace.directory)
+        try:
+            self.assertEqual(path.parent.resolve().parent, directory.parent)
+            self.assertEqual(['mets.xml'], [child.name for child in directory.iterdir() if child.is_file()])
+            self.assertEqual(doc.page_ids, Document.load(path).page_ids)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_clone_to_the_temp_directory_without_reflinks(self):
+        path = TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin/mets.xml'
+        with patch('ocrd_browser.model.document.reflink', return_value=False):
+            doc = Document.clone(path)
+        self.assertEqual(Path(gettempdir()).resolve(), Path(doc.workspace.directory).resolve().parent)
+        self.assertEqual([], list(path.parent.resolve().parent.glob('.browse-ocrd-clone-*')))
+
+    def test_writing_to_a_clone_leaves_the_original_alone(self):
+        path = TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin/mets.xml'
+        doc = Document.clone(path)
+        file = doc.files_for_page_id('PHYS_0017', 'OCR-D-GT-PAGE')[0]
+        original = path.parent / file.local_filename
+        content = original.read_bytes()
+        with open(doc.path(file), 'r+b') as cloned:
+            cloned.write(b'changed')
+        self.assertEqual(content, original.read_bytes())
+
+    def test_abandoned_clones_get_removed(self):
+        with TemporaryDirectory() as directory:
+            # A process that is not running anymore
+            process = subprocess.Popen([sys.executable, '-c', ''])
+            process.wait()
+            abandoned = Path(directory) / '.browse-ocrd-clone-{}-abc_123'.format(process.pid)
+            running = Path(directory) / 'browse-ocrd-clone-{}-abc_123'.format(os.getpid())
+            unrelated = Path(directory) / 'browse-ocrd-clone-of-mine'
+            for clone in (abandoned, running, unrelated):
+                (clone / 'OCR-D-IMG').mkdir(parents=True)
+            Document._remove_abandoned_clones(Path(directory))
+            self.assertEqual([running, unrelated], sorted(Path(directory).iterdir()))
+
     def test_save(self):
         doc = Document.clone(self.path)
         with TemporaryDirectory(prefix='browse-ocrd tests') as directory:
@@ -125,6 +354,69 @@ class DocumentTestCase(TestCase):
                     saved_file = saved.files_for_page_id(page_id, fg.group, fg.mime)[0]
                     self.assertEqual(original_file, saved_file)
 
+    def test_save_copies_only_changed_files(self):
+        doc = Document.clone(self.path)
+        with TemporaryDirectory(prefix='browse-ocrd tests') as directory:
+            saved_mets = directory + '/mets.xml'
+            doc.save_as(saved_mets, backup_directory=False)
+            image = Path(directory, doc.find_page_files('PHYS_0017', 'OCR-D-IMG')[0].local_filename)
+            inode = image.stat().st_ino
+            doc.reorder(['PHYS_0020', 'PHYS_0017'])
+            doc.save_as(saved_mets, backup_directory=False)
+            self.assertEqual(inode, image.stat().st_ino)
+            self.assertEqual(['PHYS_0020', 'PHYS_0017'], Document.load(saved_mets).page_ids)
+
+    def test_save_deletes_files_of_deleted_pages(self):
+        doc = Document.clone(self.path)
+        with TemporaryDirectory(prefix='browse-ocrd tests') as directory:
+            saved_mets = directory + '/mets.xml'
+            doc.save_as(saved_mets, backup_directory=False)
+            image = Path(directory, doc.find_page_files('PHYS_0017', 'OCR-D-IMG')[0].local_filename)
+            self.assertTrue(image.exists())
+            doc.delete_page('PHYS_0017')
+            doc.save_as(saved_mets, backup_directory=False)
+            self.assertFalse(image.exists())
+
+    def test_save_deletes_nothing_outside_the_workspace(self):
+        doc = Document.clone(TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin/mets.xml')
+        with TemporaryDirectory(prefix='browse-ocrd tests') as directory:
+            saved_mets = Path(directory, 'workspace', 'mets.xml')
+            doc.save_as(saved_mets, backup_directory=False)
+            outside = Path(directory, 'outside.xml')
+            outside.write_text('not part of the workspace')
+            # A previous mets.xml referencing a file outside of the workspace
+            saved_mets.write_text(saved_mets.read_text().replace('OCR-D-GT-ALTO/PAGE_0017_ALTO.xml', '../outside.xml'))
+            doc.save_as(saved_mets, backup_directory=False)
+            self.assertTrue(outside.exists())
+
+    def test_save_copies_files_outside_the_workspace_into_it(self):
+        doc = Document.clone(TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin/mets.xml')
+        with TemporaryDirectory(prefix='browse-ocrd tests') as directory:
+            outside = Path(directory, 'outside.xml')
+            file = doc.find_page_files('PHYS_0017', 'OCR-D-GT-ALTO')[0]
+            outside.write_bytes(doc.path(file).read_bytes())
+            file.local_filename = str(outside)
+            doc.save_mets()
+            saved_mets = Path(directory, 'workspace', 'mets.xml')
+            doc.save_as(saved_mets, backup_directory=False)
+            saved = Document.load(saved_mets)
+            self.assertTrue(Path(directory, 'workspace', 'OCR-D-GT-ALTO', 'outside.xml').exists())
+            self.assertTrue(outside.exists())
+            self.assertEqual(len(saved.workspace.mets.find_all_files()), len(doc.workspace.mets.find_all_files()))
+
+    def test_save_backs_up_previous_workspace(self):
+        doc = Document.clone(self.path)
+        with TemporaryDirectory(prefix='browse-ocrd tests') as directory:
+            saved_mets = Path(directory, 'workspace', 'mets.xml')
+            backup = Path(directory, 'backup')
+            doc.save_as(saved_mets)
+            doc.reorder(['PHYS_0020', 'PHYS_0017'])
+            doc.save_as(saved_mets, backup_directory=backup)
+            self.assertEqual(['PHYS_0017', 'PHYS_0020'], Document.load(backup / 'mets.xml').page_ids)
+            self.assertEqual(['PHYS_0020', 'PHYS_0017'], Document.load(saved_mets).page_ids)
+            image = doc.find_page_files('PHYS_0017', 'OCR-D-IMG')[0].local_filename
+            self.assertEqual((saved_mets.parent / image).read_bytes(), (backup / image).read_bytes())
+
     def test_derive_backup_directory(self):
         self.assertEqual(
             Path('/home/jk/.bak.important_project.20200813-184321'),
@@ -163,6 +455,29 @@ class DocumentTestCase(TestCase):
         # self.assertEqual(1, len(log_watch.records))
         # self.assertEqual("No PAGE-XML but 2 images for page 'PHYS_0017' in fileGrp 'OCR-D-IMG-CLIP'", log_watch.records[0].msg)
 
+    def test_page_for_id_shares_parsed_page_xml(self):
+        doc = Document.load(self.path)
+        page = doc.page_for_id('PHYS_0017', 'OCR-D-GT-PAGE')
+        same_page = doc.page_for_id('PHYS_0017', 'OCR-D-GT-PAGE')
+        self.assertIsNot(page, same_page)
+        self.assertIs(page.pc_gts, same_page.pc_gts)
+
+    def test_page_cache_is_invalidated_by_modification(self):
+        doc = Document.clone(self.path)
+        pc_gts = doc.page_for_id('PHYS_0017', 'OCR-D-GT-PAGE').pc_gts
+        doc.delete_images('PHYS_0017', 'OCR-D-IMG')
+        self.assertNotIn(('PHYS_0017', 'OCR-D-GT-PAGE'), doc.page_cache)
+        self.assertIsNot(pc_gts, doc.page_for_id('PHYS_0017', 'OCR-D-GT-PAGE').pc_gts)
+
+    def test_page_cache_is_invalidated_by_file_modification(self):
+        doc = Document.clone(self.path)
+        page = doc.page_for_id('PHYS_0017', 'OCR-D-GT-PAGE')
+        pc_gts = page.pc_gts
+        path = doc.path(page.page_file)
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        self.assertIsNot(pc_gts, doc.page_for_id('PHYS_0017', 'OCR-D-GT-PAGE').pc_gts)
+
     def test_modify_when_not_editable(self):
         doc = Document.load(self.path)
         with self.assertRaises(PermissionError):
@@ -187,3 +502,14 @@ class DocumentTestCase(TestCase):
         image, info, exif = page.get_image(feature_selector='', feature_filter='binarized')
         # Assert no exceptions happened and no image returned
         self.assertIsNone(image)
+
+    def test_parallel_parsing_restores_cwd_and_streams(self):
+        doc = Document.load(TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin/mets.xml')
+        cwd, stderr = os.getcwd(), sys.stderr
+        page_file = doc.page_for_id('PHYS_0017', 'OCR-D-GT-PAGE').page_file
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            pc_gtses = list(pool.map(lambda _: doc.page_for_file(page_file), range(16)))
+        self.assertTrue(all(pc_gts.get_Page() is not None for pc_gts in pc_gtses))
+        self.assertEqual(cwd, os.getcwd())
+        self.assertIs(stderr, sys.stderr)
+        self.assertFalse(sys.stderr.closed)
@@ -0,0 +1,65 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from ocrd_browser.model import Document
+from ocrd_browser.model.mets_summary import MetsSummary
+from ocrd_browser.util.file_groups import FileGroupHandle
+from tests import TestCase, TEST_BASE_PATH
+
+METS = '''<?xml version="1.0" encoding="UTF-8"?>
+<mets:mets xmlns:mets="http://www.loc.gov/METS/" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <mets:fileSec>
+    <mets:fileGrp USE="OCR-D-IMG">
+      <mets:file ID="IMG_2" MIMETYPE="image/tiff">
+        <mets:FLocat LOCTYPE="URL" xlink:href="https://example.org/IMG_2.tif"/>
+        <mets:FLocat LOCTYPE="OTHER" OTHERLOCTYPE="FILE" xlink:href="OCR-D-IMG/IMG_2.tif"/>
+      </mets:file>
+      <mets:file ID="IMG_1" MIMETYPE="image/tiff">
+        <mets:FLocat LOCTYPE="URL" xlink:href="file:///data/OCR-D-IMG/IMG%201.tif"/>
+      </mets:file>
+      <mets:file ID="IMG_3" MIMETYPE="image/tiff">
+        <mets:FLocat LOCTYPE="URL" xlink:href="https://example.org/IMG_3.tif"/>
+      </mets:file>
+    </mets:fileGrp>
+  </mets:fileSec>
+  <mets:structMap TYPE="LOGICAL">
+    <mets:div TYPE="page" ID="LOG_1"><mets:fptr FILEID="IMG_1"/></mets:div>
+  </mets:structMap>
+  <mets:structMap TYPE="PHYSICAL">
+    <mets:div TYPE="physSequence">
+      <mets:div TYPE="page" ID="PHYS_1"><mets:fptr FILEID="IMG_1"/></mets:div>
+      <mets:div TYPE="page" ID="PHYS_2"><mets:fptr FILEID="IMG_2"/></mets:div>
+      <mets:div TYPE="page" ID="PHYS_3"><mets:fptr FILEID="IMG_3"/></mets:div>
+    </mets:div>
+  </mets:structMap>
+</mets:mets>
+'''
+
+
+class MetsSummaryTestCase(TestCase):
+
+    def test_matches_document(self):
+        path = TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin/mets.xml'
+        summary = MetsSummary.parse(path)
+        doc = Document.load(path)
+        self.assertEqual(doc.page_ids, summary.page_ids)
+        self.assertEqual(doc.file_groups, summary.file_groups)
+        self.assertEqual(doc.file_group_stats, summary.file_group_stats)
+        self.assertEqual(doc.directory, summary.directory)
+        self.assertEqual(doc.title, summary.unique_identifier)
+        for page_id, groups in doc.page_file_index.items():
+            expected = {group: [str(file.local_filename) for file in files] for group, files in groups.items()}
+            self.assertEqual(expected, summary.page_files[page_id])
+
+    def test_parse(self):
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / 'mets.xml'
+            path.write_text(METS)
+            summary = MetsSummary.parse(path)
+        self.assertEqual(['PHYS_1', 'PHYS_2', 'PHYS_3'], summary.page_ids)
+        self.assertEqual([FileGroupHandle('OCR-D-IMG', 'image/tiff')], summary.file_groups)
+        self.assertEqual({FileGroupHandle('OCR-D-IMG', 'image/tiff'): ['/data/OCR-D-IMG/IMG 1.tif']}, summary.page_files['PHYS_1'])
+        # The local copy wins over the URL
+        self.assertEqual({FileGroupHandle('OCR-D-IMG', 'image/tiff'): ['OCR-D-IMG/IMG_2.tif']}, summary.page_files['PHYS_2'])
+        # Remote only
+        self.assertEqual({}, summary.page_files['PHYS_3'])
@@ -1,5 +1,9 @@
+from unittest.mock import patch
+
 from tests import TestCase, TEST_BASE_PATH, ASSETS_PATH
 from ocrd_browser.model import Document, IMAGE_FROM_PAGE_FILENAME_SUPPORT
+from ocrd_browser.model.page import Page
+from ocrd_browser.util.cache import LruCache
 
 
 class PageTestCase(TestCase):
@@ -30,3 +34,45 @@ class PageTestCase(TestCase):
         image, info, exif = page.get_image(feature_selector='', feature_filter='binarized')
         # Assert no exceptions happened but image is None
         self.assertIsNone(image)
+
+    def test_decoded_data_gets_evicted_and_reloaded(self):
+        doc = Document.load(TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin/mets.xml')
+        budget = 5000000
+        with patch('ocrd_browser.util.cache._memory_cache', LruCache(budget, weigher=lambda w: w.size)) as shared:
+            page_xml = doc.page_for_id('PHYS_0017', 'OCR-D-GT-PAGE')
+            image = doc.page_for_id('PHYS_0020', 'OCR-D-IMG-BIN')
+            pc_gts = page_xml.pc_gts
+            self.assertIsNotNone(pc_gts)
+            self.assertIn(('PHYS_0017', 'OCR-D-GT-PAGE'), doc.page_cache)
+            # The pyramid of 1457 x 2084 grayscale pixels leaves no room for the parsed PAGE-XML
+            self.assertEqual(1, len(image.pyramids))
+            self.assertNotIn(('PHYS_0017', 'OCR-D-GT-PAGE'), doc.page_cache)
+            self.assertIn(image._key, Page._pyramids)
+            self.assertLessEqual(shared.weight, budget)
+            # The page in use keeps its PAGE-XML, so changes made through it do not get lost
+            self.assertIs(pc_gts, page_xml.pc_gts)
+            # Loaded again for a new page
+            self.assertIsNotNone(doc.page_for_id('PHYS_0017', 'OCR-D-GT-PAGE').page)
+            self.assertIn(('PHYS_0017', 'OCR-D-GT-PAGE'), doc.page_cache)
+            self.assertNotIn(image._key, Page._pyramids)
+            self.assertEqual(1, len(image.images))
+
+    def test_pc_gts_is_not_checked_for_changes_on_every_access(self):
+        doc = Document.load(TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin/mets.xml')
+        page = doc.page_for_id('PHYS_0017', 'OCR-D-GT-PAGE')
+        pc_gts = page.pc_gts
+        with patch.object(doc, 'cached_page_for_file') as cached_page_for_file:
+            self.assertIs(pc_gts, page.pc_gts)
+            self.assertIsNotNone(page.page)
+        cached_page_for_file.assert_not_called()
+
+    def test_pyramids_get_dropped_with_page(self):
+        doc = Document.load(TEST_BASE_PATH / 'example/workspaces/kant_aufklaerung_1784_bin/mets.xml')
+        with patch('ocrd_browser.util.cache._memory_cache', LruCache(10000000, weigher=lambda w: w.size)) as shared:
+            page = doc.page_for_id('PHYS_0020', 'OCR-D-IMG-BIN')
+            self.assertEqual(1, len(page.pyramids))
+            key = page._key
+            self.assertIn(key, Page._pyramids)
+            del page
+            self.assertNotIn(key, Page._pyramids)
+            self.assertEqual(0, shared.weight)
@@ -1,6 +1,10 @@
-from tests import TestCase
-from ocrd_browser.model.page_xml_renderer import RegionFactory, Region
-from ocrd_models.ocrd_page import CoordsType, SeparatorRegionType
+import numpy as np
+from PIL import Image, ImageDraw
+
+from tests import TestCase, TEST_BASE_PATH
+from ocrd_browser.model.page_xml_renderer import RegionFactory, Region, PageXmlRenderer, Feature, Operations, RegionMap, RegionBase
+from ocrd_models.ocrd_page import CoordsType, SeparatorRegionType, parse
+from shapely.geometry import Point
 
 
 class RegionFactoryTestCase(TestCase):
@@ -51,3 +55,74 @@ class RegionFactoryTestCase(TestCase):
         with self.assertLogs('ocrd_browser.model.page_xml_renderer', level='WARNING'):
             region = self.factory.create(ds)
         self.assertRegex(region.warnings[0], r'has too few points')
+
+
+class OperationsTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.pc_gts = parse(str(TEST_BASE_PATH / 'example/workspaces/aletheiaexamplepage/OCR-D-GT-PAGE/PAGE_2017.xml'), silence=True)
+        page = self.pc_gts.get_Page()
+        self.size = (page.imageWidth, page.imageHeight)
+        self.coords = {
+            'transform': [[1., 0., 0.], [0., 1., 0.], [0., 0., 1.]],
+            'angle': 0,
+            'features': ''
+        }
+
+    def render(self, features: Feature, scale: float = 1.0) -> PageXmlRenderer:
+        canvas = Image.fromarray(np.random.default_rng(42).integers(0, 256, (self.size[1], self.size[0], 3), dtype=np.uint8))
+        renderer = PageXmlRenderer(canvas, self.coords, 'PAGE_2017', features, scale=scale)
+        renderer.render_all(self.pc_gts)
+        return renderer
+
+    @staticmethod
+    def paint_full_layers(operations: Operations, canvas: Image.Image):
+        regions = RegionMap()
+        for _depth, layer_operations in operations.layers():
+            layer = Image.new(mode='RGBA', size=canvas.size, color='#FFFFFF00')
+            draw = ImageDraw.Draw(layer)
+            for operation in layer_operations:
+                operation.paint(draw, regions)
+            canvas.alpha_composite(layer)
+        return canvas, regions
+
+    def test_paint_equals_full_layer_compositing(self):
+        for features in [Feature.DEFAULT, Feature.DEFAULT | Feature.ORDER | Feature.WORDS | Feature.GLYPHS | Feature.PRINT_SPACE]:
+            with self.subTest(features=features):
+                expected_image, expected_regions = self.paint_full_layers(self.render(features).operations, self.render(features).canvas.copy())
+                image, regions = self.render(features).get_result()
+                self.assertEqual(expected_image.tobytes(), image.tobytes())
+                self.assertEqual(list(expected_regions.region_by_id.keys()), list(regions.region_by_id.keys()))
+
+    def test_clusters_contain_every_operation_once(self):
+        operations = self.render(Feature.DEFAULT | Feature.ORDER | Feature.WORDS).operations
+        for _depth, layer_operations in operations.layers():
+            clusters = Operations.clusters(layer_operations, self.size)
+            painted = [operation for _box, cluster in clusters for operation in cluster]
+            self.assertCountEqual(layer_operations, painted)
+            for (left, top, right, bottom), _cluster in clusters:
+                self.assertTrue(0 <= left < right <= self.size[0] and 0 <= top < bottom <= self.size[1])
+
+    def test_paint_at_display_scale(self):
+        features = Feature.DEFAULT | Feature.ORDER | Feature.WORDS
+        full_image, full_regions = self.render(features & ~Feature.IMAGE).get_result()
+        image, regions = self.render(features & ~Feature.IMAGE, 0.25).get_result()
+
+        self.assertEqual((round(self.size[0] * 0.25), round(self.size[1] * 0.25)), image.size)
+        # RegionMap stays in unscaled coordinates
+        self.assertEqual(full_regions.region_by_id.keys(), regions.region_by_id.keys())
+        for id_, region in regions.region_by_id.items():
+            self.assertEqual(full_regions.get(id_).poly.bounds, region.poly.bounds)
+        # and looks like the scaled down full resolution rendering
+        difference = np.abs(np.asarray(full_image.resize(image.size), dtype=float) - np.asarray(image, dtype=float))
+        self.assertLess(difference.mean(), 8)
+
+    def test_find_regions_equals_tree_walk(self):
+        _image, regions = self.render(Feature.DEFAULT | Feature.PRINT_SPACE | Feature.WORDS | Feature.GLYPHS, 0.1).get_result()
+        for x in range(0, self.size[0], 89):
+            for y in range(0, self.size[1], 97):
+                p = Point(x, y)
+                self.assertEqual(RegionBase.find_regions(regions, p), regions.find_regions(p))
+
+    def test_find_region_in_empty_region_map(self):
+        self.assertIsNone(RegionMap().find_region(10, 10))
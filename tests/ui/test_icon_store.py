@@ -1,4 +1,5 @@
 import unittest
+from concurrent.futures import Future
 from gi.repository import Gtk, GdkPixbuf, GObject, GLib
 from ocrd_browser.ui.icon_store import LazyLoadingListStore
 from tests import TestCase
@@ -15,6 +16,7 @@ class LazyLoadingListStoreTestCase(TestCase):
         self.lazy_list_store = LazyLoadingListStore(*self.types, init_row=self.logging_init, load_row=self.logging_load,
                                                     hash_row=self.hash_row)
         self.init_log = []
+        self.load_log = []
         self.backup_idle_add = GLib.idle_add
         GLib.idle_add = call_instantly
 
@@ -25,8 +27,8 @@ class LazyLoadingListStoreTestCase(TestCase):
         self.init_log.append(row[:])
 
     def logging_load(self, row: Gtk.TreeModelRow):
-        pass
-        # self.init_log.append(row[:])
+        self.load_log.append(row[0])
+        return row
 
     def hash_row(self, row: Gtk.TreeModelRow):
         return row[0]
@@ -63,6 +65,98 @@ class LazyLoadingListStoreTestCase(TestCase):
         self.lazy_list_store.append(('a', 5, None))
         self.assertEqual(self.lazy_list_store[-1][1], 15)
 
+    def start_recording(self, max_workers: int = 2):
+        """
+        Starts loading with an executor that only records what gets submitted
+        """
+        submitted = []
+
+        class RecordingExecutor:
+            def submit(self, fn, row):
+                submitted.append(row[0])
+                future = Future()
+                future.load = lambda: fn(row)
+                return future
+
+            def shutdown(self, wait=True):
+                pass
+
+        self.lazy_list_store.max_workers = max_workers
+        self.lazy_list_store.futures = {}
+        self.lazy_list_store.pool = RecordingExecutor()
+        return submitted
+
+    def finish_loading(self):
+        # The done callbacks collect instantly, as GLib.idle_add is patched
+        for future in list(self.lazy_list_store.futures):
+            future.set_result(future.load())
+
+    def test_loads_visible_rows_first(self):
+        for name in 'abcdefghij':
+            self.lazy_list_store.append((name, 0, None))
+        submitted = self.start_recording()
+        self.lazy_list_store.set_visible_range(5, 6)
+        self.lazy_list_store.submit_all()
+        self.assertEqual(['f', 'g'], submitted)
+        self.finish_loading()
+        self.assertEqual(['f', 'g', 'e', 'h'], submitted)
+        self.assertEqual('f', self.lazy_list_store[5][-1])
+
+    def test_reprioritises_on_visible_range_change(self):
+        for name in 'abcdefghij':
+            self.lazy_list_store.append((name, 0, None))
+        submitted = self.start_recording(max_workers=1)
+        self.lazy_list_store.submit_all()
+        self.lazy_list_store.set_visible_range(8, 9)
+        self.finish_loading()
+        self.assertEqual(['a', 'i'], submitted)
+
+    def test_skips_removed_rows(self):
+        for name in 'abc':
+            self.lazy_list_store.append((name, 0, None))
+        submitted = self.start_recording(max_workers=1)
+        self.lazy_list_store.submit_all()
+        del self.lazy_list_store[1]
+        self.finish_loading()
+        self.finish_loading()
+        self.assertEqual(['a', 'c'], submitted)
+
+    def test_reloads_rows_changed_while_loading(self):
+        self.lazy_list_store.append(('a', 0, None))
+        submitted = self.start_recording(max_workers=1)
+        self.lazy_list_store.submit_all()
+        self.lazy_list_store[0][0] = 'b'
+        self.finish_loading()
+        self.assertEqual(['a', 'b'], submitted)
+        self.assertIsNone(self.lazy_list_store[0][-1])
+        self.finish_loading()
+        self.assertEqual('b', self.lazy_list_store[0][-1])
+
+    def test_reload_skips_unchanged_rows(self):
+        self.lazy_list_store.append(('a', 0, None))
+        submitted = self.start_recording()
+        self.lazy_list_store.submit_all()
+        self.finish_loading()
+        self.lazy_list_store.reload(self.lazy_list_store[0])
+        self.finish_loading()
+        self.assertEqual(['a', 'a'], submitted)
+        self.assertEqual(['a'], self.load_log)
+
+    def test_shutdown_stops_loading(self):
+        self.lazy_list_store.append(('a', 0, None))
+        submitted = self.start_recording()
+        self.lazy_list_store.shutdown()
+        self.lazy_list_store.submit_all()
+        self.assertEqual([], submitted)
+        self.assertIsNone(self.lazy_list_store.pool)
+
+    def test_start_loading_after_shutdown_does_nothing(self):
+        self.lazy_list_store.append(('a', 0, None))
+        self.lazy_list_store.shutdown()
+        self.assertFalse(self.lazy_list_store.start_loading())
+        self.assertIsNone(self.lazy_list_store.pool)
+        self.assertIsNone(self.lazy_list_store.futures)
+
 
 if __name__ == '__main__':
     unittest.main()
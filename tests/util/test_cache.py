@@ -0,0 +1,94 @@
+import unittest
+
+from ocrd_browser.util.cache import LruCache, LruCacheView
+from tests import TestCase
+
+
+class LruCacheTestCase(TestCase):
+
+    def test_get_returns_default_for_missing_key(self):
+        cache = LruCache(2)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(5, cache.get('a', 5))
+
+    def test_evicts_least_recently_used(self):
+        cache = LruCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(['a', 'c'], cache.keys())
+        self.assertNotIn('b', cache)
+
+    def test_replacing_a_key_does_not_grow_the_cache(self):
+        cache = LruCache(2)
+        cache.put('a', 1)
+        cache.put('a', 2)
+        self.assertEqual(1, len(cache))
+        self.assertEqual(2, cache.get('a'))
+
+    def test_weigher_turns_budget_into_weight_budget(self):
+        cache = LruCache(10, weigher=len)
+        cache.put('a', 'xxxx')
+        cache.put('b', 'xxxx')
+        self.assertEqual(8, cache.weight)
+        cache.put('c', 'xxxx')
+        self.assertEqual(['b', 'c'], cache.keys())
+        self.assertEqual(8, cache.weight)
+
+    def test_value_heavier_than_budget_is_not_kept(self):
+        cache = LruCache(3, weigher=len)
+        cache.put('a', 'xxxx')
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.weight)
+
+    def test_discard_where(self):
+        cache = LruCache(10)
+        cache.put(('PHYS_0017', 'OCR-D-GT-PAGE'), 1)
+        cache.put(('PHYS_0017', 'OCR-D-OCR'), 2)
+        cache.put(('PHYS_0020', 'OCR-D-GT-PAGE'), 3)
+        cache.discard_where(lambda key: key[0] == 'PHYS_0017')
+        self.assertEqual([('PHYS_0020', 'OCR-D-GT-PAGE')], cache.keys())
+        self.assertEqual(1, cache.weight)
+
+
+class LruCacheViewTestCase(TestCase):
+
+    def setUp(self):
+        self.shared = LruCache(10, weigher=lambda weighed: weighed.size)
+
+    def test_views_share_the_budget(self):
+        images = LruCacheView(len, shared=self.shared)
+        tiles = LruCacheView(len, shared=self.shared)
+        images.put('a', 'xxxx')
+        tiles.put('a', 'xxxx')
+        self.assertEqual('xxxx', images.get('a'))
+        tiles.put('b', 'xxxx')
+        # The least recently used entry of all views got evicted
+        self.assertIsNone(tiles.get('a'))
+        self.assertEqual(['b'], tiles.keys())
+        self.assertEqual(['a'], images.keys())
+        self.assertEqual(8, self.shared.weight)
+
+    def test_max_entries_limits_the_entries_of_the_view(self):
+        view = LruCacheView(lambda _value: 1, max_entries=2, shared=self.shared)
+        for key in 'abc':
+            view.put(key, key)
+        self.assertEqual(['b', 'c'], view.keys())
+        self.assertEqual(2, self.shared.weight)
+
+    def test_clear_keeps_the_entries_of_other_views(self):
+        images = LruCacheView(len, shared=self.shared)
+        tiles = LruCacheView(len, shared=self.shared)
+        images.put('a', 'xx')
+        tiles.put('a', 'xx')
+        tiles.put('b', 'xx')
+        tiles.clear()
+        self.assertEqual(0, len(tiles))
+        self.assertNotIn('a', tiles)
+        self.assertEqual('xx', images.get('a'))
+        self.assertEqual(2, self.shared.weight)
+
+
+if __name__ == '__main__':
+    unittest.main()
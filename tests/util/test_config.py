@@ -21,6 +21,48 @@ class SettingsTestCase(TestCase):
         settings = Settings()
         self.assertEqual([re.compile('OCR-D-IMG'), re.compile('OCR-D-IMG.*')], settings.file_groups.preferred_images)
 
+    def test_cache_default(self):
+        settings = Settings()
+        self.assertEqual(32, settings.cache.page_xml)
+        self.assertEqual(2048, settings.cache.memory)
+
+    def test_cache_memory_positive(self):
+        with self.assertRaises(ValidationError):
+            Settings(cache={'memory': 0})
+
+    def test_cache_environment(self):
+        os.environ['BROCRD__CACHE__PAGE_XML'] = '8'
+        settings = SettingsFactory.build_from_files([TEST_BASE_PATH / 'example/config/simple.conf'])
+        self.assertEqual(8, settings.cache.page_xml)
+        del os.environ['BROCRD__CACHE__PAGE_XML']
+
+    def test_prefetch_default(self):
+        settings = Settings()
+        self.assertEqual((2, 1, 2), (settings.prefetch.next, settings.prefetch.previous, settings.prefetch.workers))
+
+    def test_thumbnails_default(self):
+        settings = Settings()
+        self.assertEqual((None, 512, 'lru'), (settings.thumbnails.directory, settings.thumbnails.max_size, settings.thumbnails.eviction))
+        self.assertEqual(4, settings.thumbnails.workers)
+        self.assertFalse(settings.thumbnails.watch)
+
+    def test_save_default(self):
+        settings = Settings()
+        self.assertEqual(4, settings.save.workers)
+        self.assertEqual('link', settings.save.backup)
+
+    def test_save_unknown_backup(self):
+        with self.assertRaises(ValidationError):
+            Settings(save={'backup': 'copy'})
+
+    def test_thumbnails_workers_positive(self):
+        with self.assertRaises(ValidationError):
+            Settings(thumbnails={'workers': 0})
+
+    def test_thumbnails_unknown_eviction(self):
+        with self.assertRaises(ValidationError):
+            Settings(thumbnails={'eviction': 'random'})
+
     def test_value_loaded(self):
         self.assertEqual([re.compile('OCR-D-IMG'), re.compile('OCR-D-IMG.*'), re.compile('ORIGINAL')],
                          self.settings.file_groups.preferred_images)
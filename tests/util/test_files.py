@@ -0,0 +1,79 @@
+import errno
+import os
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from ocrd_browser.util.files import copy_if_changed, link_or_copy, reflink_or_copy, snapshot
+from tests import TestCase
+
+
+class FilesTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.source = Path(self.directory.name) / 'source.txt'
+        self.source.write_text('original')
+        self.destination = Path(self.directory.name) / 'destination.txt'
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_link_or_copy(self):
+        method = link_or_copy(self.source, self.destination)
+        self.assertIn(method, ('reflink', 'hardlink', 'copy'))
+        self.assertEqual('original', self.destination.read_text())
+
+    def test_reflink_or_copy_never_shares_the_file(self):
+        method = reflink_or_copy(self.source, self.destination)
+        self.assertIn(method, ('reflink', 'copy'))
+        with open(self.destination, 'r+') as file:
+            file.write('changed')
+        self.assertEqual('original', self.source.read_text())
+        self.assertEqual(1, os.stat(self.source).st_nlink)
+
+    def test_copy_if_changed(self):
+        self.assertTrue(copy_if_changed(self.source, self.destination))
+        self.assertEqual('original', self.destination.read_text())
+        self.assertFalse(copy_if_changed(self.source, self.destination))
+
+    def test_copy_if_changed_copies_modified_source(self):
+        copy_if_changed(self.source, self.destination)
+        self.source.write_text('modified')
+        os.utime(self.source, (0, 0))
+        self.assertTrue(copy_if_changed(self.source, self.destination))
+        self.assertEqual('modified', self.destination.read_text())
+
+    def _workspace(self):
+        workspace = Path(self.directory.name) / 'workspace'
+        (workspace / 'OCR-D-IMG').mkdir(parents=True)
+        (workspace / 'mets.xml').write_text('mets')
+        (workspace / 'OCR-D-IMG' / 'page.tif').write_text('image')
+        return workspace
+
+    def test_snapshot_same_file_system(self):
+        workspace = self._workspace()
+        backup = Path(self.directory.name) / 'backup'
+        methods = snapshot(workspace, backup)
+        self.assertEqual(2, sum(methods.values()))
+        self.assertNotIn('copy', methods)
+        self.assertEqual('image', (backup / 'OCR-D-IMG' / 'page.tif').read_text())
+        # Replacing a file in the workspace keeps the backup
+        copy_if_changed(self.source, workspace / 'mets.xml')
+        self.assertEqual('mets', (backup / 'mets.xml').read_text())
+
+    def test_snapshot_cross_file_system(self):
+        workspace = self._workspace()
+        backup = Path(self.directory.name) / 'backup'
+        cross_device = OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        with patch('ocrd_browser.util.files.reflink', return_value=False), \
+                patch('ocrd_browser.util.files.os.link', side_effect=cross_device):
+            methods = snapshot(workspace, backup)
+        self.assertEqual({'copy': 2}, methods)
+        self.assertEqual('mets', (backup / 'mets.xml').read_text())
+        self.assertEqual('image', (backup / 'OCR-D-IMG' / 'page.tif').read_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
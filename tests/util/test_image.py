@@ -1,9 +1,9 @@
 import unittest
-from PIL import Image, ImageDraw
+from PIL import Image, ImageChops, ImageDraw
 from gi.repository import GdkPixbuf
 
 from tests import TestCase, data_provider
-from ocrd_browser.util.image import pil_to_pixbuf
+from ocrd_browser.util.image import pil_to_pixbuf, pil_scale, ImagePyramid
 
 
 def _image_modes():
@@ -37,6 +37,38 @@ class ImageUtilTestCase(TestCase):
         self.assertSequenceEqual(fg1_test, self._get_pixbuf_pixel(pb, 0, 0))
         self.assertSequenceEqual(fg2_test, self._get_pixbuf_pixel(pb, pil.size[0] - 1, 1))
 
+    def test_pyramid_levels(self):
+        pyramid = ImagePyramid(Image.new('RGB', (1000, 700)))
+        self.assertEqual((1000, 700), pyramid.level(0).size)
+        self.assertEqual((250, 175), pyramid.level(2).size)
+        self.assertEqual(0, pyramid.level_for(None, 700))
+        self.assertEqual(0, pyramid.level_for(None, 351))
+        self.assertEqual(1, pyramid.level_for(None, 350))
+        self.assertEqual(2, pyramid.level_for(200, None))
+        self.assertEqual(0, pyramid.level_for(None, 1400))
+
+    @data_provider(_image_modes)
+    def test_pyramid_scale_like_pil_scale(self, mode, bg, fg1, fg2, *_):
+        image = self._generate_test_image(mode, bg, fg1, fg2).resize((500, 300))
+        pyramid = ImagePyramid(image)
+        for height in (300, 149, 70, 13):
+            scaled = pyramid.scale(None, height)
+            expected = pil_scale(image, None, height)
+            self.assertEqual(expected.size, scaled.size)
+            diff = ImageChops.difference(scaled.convert('RGBA'), expected.convert('RGBA'))
+            mean = sum(diff.convert('L').getdata()) / (scaled.width * scaled.height)
+            self.assertLess(mean, 24)
+
+    def test_pyramid_region_like_crop(self):
+        image = Image.linear_gradient('L').resize((1000, 700))
+        pyramid = ImagePyramid(image)
+        for height, box in ((700, (0, 0, 256, 256)), (300, (256, 256, 428, 300)), (1400, (1792, 1024, 2000, 1280))):
+            region = pyramid.region(height, box)
+            expected = pil_scale(image, None, height).crop(box)
+            self.assertEqual(expected.size, region.size)
+            diff = ImageChops.difference(region, expected)
+            self.assertLess(max(diff.getdata()), 8)
+
     @staticmethod
     def _get_pixbuf_pixel(pb: GdkPixbuf.Pixbuf, x, y):
         bytes = pb.get_pixels()
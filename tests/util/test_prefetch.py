@@ -0,0 +1,164 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from time import sleep
+from unittest.mock import patch
+
+from ocrd_browser.util.cache import LruCache
+from ocrd_browser.util.prefetch import Prefetcher
+from tests import TestCase
+
+
+class PrefetcherTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.loaded = []
+        self.prefetcher = Prefetcher(self.load, max_workers=1, max_results=2)
+
+    def tearDown(self) -> None:
+        self.prefetcher.shutdown()
+
+    def load(self, key):
+        self.loaded.append(key)
+        return key * 2
+
+    def test_get_before_prefetch_returns_none(self):
+        self.assertIsNone(self.prefetcher.get(3))
+        self.assertIsNone(self.prefetcher.get(3, wait=True))
+
+    def test_get_waits_for_prefetched_value(self):
+        self.prefetcher.prefetch([3])
+        self.assertEqual(6, self.prefetcher.get(3, wait=True))
+        self.assertEqual(6, self.prefetcher.get(3))
+
+    def test_prefetch_loads_each_key_once(self):
+        self.prefetcher.prefetch([3])
+        self.prefetcher.get(3, wait=True)
+        self.prefetcher.prefetch([3])
+        self.assertEqual([3], self.loaded)
+
+    def test_prefetch_cancels_queued_keys(self):
+        started, release = Event(), Event()
+
+        def blocking_load(key):
+            started.set()
+            release.wait(5)
+            return self.load(key)
+
+        self.prefetcher.load = blocking_load
+        self.prefetcher.prefetch([1, 2])
+        started.wait(5)
+        self.prefetcher.prefetch([1, 3])
+        release.set()
+        self.assertEqual(6, self.prefetcher.get(3, wait=True))
+        self.assertEqual([1, 3], self.loaded)
+
+    def test_get_returns_none_when_the_awaited_key_gets_cancelled(self):
+        started, release = Event(), Event()
+
+        def blocking_load(key):
+            started.set()
+            release.wait(5)
+            return self.load(key)
+
+        self.prefetcher.load = blocking_load
+        self.prefetcher.prefetch([1, 2])
+        started.wait(5)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            waiting = executor.submit(self.prefetcher.get, 2, True)
+            # Let it wait for the queued key
+            sleep(0.1)
+            self.prefetcher.prefetch([1, 3])
+            self.assertIsNone(waiting.result(5))
+        release.set()
+
+    def test_clear_drops_running_results(self):
+        started, release = Event(), Event()
+
+        def blocking_load(key):
+            started.set()
+            release.wait(5)
+            return self.load(key)
+
+        self.prefetcher.load = blocking_load
+        self.prefetcher.prefetch([1])
+        started.wait(5)
+        self.prefetcher.clear()
+        release.set()
+        self.prefetcher.shutdown()
+        self.prefetcher._executor.shutdown(wait=True)
+        self.assertIsNone(self.prefetcher.get(1))
+
+    def test_prefetch_queues_keys_in_given_order(self):
+        started, release = Event(), Event()
+
+        def blocking_load(key):
+            started.set()
+            release.wait(5)
+            return self.load(key)
+
+        self.prefetcher.load = blocking_load
+        self.prefetcher.prefetch([1, 2, 3])
+        started.wait(5)
+        self.prefetcher.prefetch([1, 3, 2])
+        release.set()
+        self.prefetcher.get(2, wait=True)
+        self.assertEqual([1, 3, 2], self.loaded)
+
+    def test_when_ready_is_called_after_loading(self):
+        ready = []
+        self.prefetcher.prefetch([3])
+        self.prefetcher.when_ready(3, lambda key, value: ready.append((key, value)))
+        self.prefetcher.get(3, wait=True)
+        self.prefetcher._executor.shutdown(wait=True)
+        self.assertEqual([(3, 6)], ready)
+
+    def test_when_ready_is_called_right_away(self):
+        ready = []
+        self.prefetcher.prefetch([3])
+        self.prefetcher.get(3, wait=True)
+        self.prefetcher.when_ready(3, lambda key, value: ready.append((key, value)))
+        self.prefetcher.when_ready(4, lambda key, value: ready.append((key, value)))
+        self.assertEqual([(3, 6), (4, None)], ready)
+
+    def test_when_ready_is_not_called_for_cancelled_keys(self):
+        started, release = Event(), Event()
+        ready = []
+
+        def blocking_load(key):
+            started.set()
+            release.wait(5)
+            return self.load(key)
+
+        self.prefetcher.load = blocking_load
+        self.prefetcher.prefetch([1, 2])
+        started.wait(5)
+        self.prefetcher.when_ready(2, lambda key, value: ready.append((key, value)))
+        self.prefetcher.prefetch([1])
+        release.set()
+        self.prefetcher._executor.shutdown(wait=True)
+        self.assertEqual([], ready)
+
+    def test_failing_load_is_not_cached(self):
+        def failing_load(key):
+            raise ValueError(key)
+
+        self.prefetcher.load = failing_load
+        with self.assertLogs('ocrd_browser.util.prefetch', level='ERROR'):
+            self.prefetcher.prefetch([1])
+            self.assertIsNone(self.prefetcher.get(1, wait=True))
+            self.prefetcher._executor.shutdown(wait=True)
+        self.assertNotIn(1, self.prefetcher.results)
+
+    def test_weighed_results_count_against_the_memory_budget(self):
+        self.prefetcher = Prefetcher(self.load, max_workers=1, max_results=2, weigher=lambda value: value)
+        with patch('ocrd_browser.util.cache._memory_cache', LruCache(10, weigher=lambda w: w.size)) as shared:
+            self.prefetcher.prefetch([3, 4])
+            self.prefetcher._executor.shutdown(wait=True)
+            self.assertIsNone(self.prefetcher.get(3))
+            self.assertEqual(8, self.prefetcher.get(4))
+            self.assertEqual(8, shared.weight)
+
+
+if __name__ == '__main__':
+    unittest.main()
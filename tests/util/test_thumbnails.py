@@ -0,0 +1,179 @@
+import os
+import struct
+import threading
+import unittest
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from PIL import Image
+
+from ocrd_browser.util.config import Thumbnails
+from ocrd_browser.util.thumbnails import INDEX, ThumbnailCache, load_thumbnail
+from tests import TestCase
+
+
+class ThumbnailCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+        self.cache = ThumbnailCache(self.directory / 'thumbnails')
+        self.image_path = self._image('page.png', (1000, 1400))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _image(self, name, size):
+        path = self.directory / name
+        Image.new('RGB', size, (255, 0, 0)).save(path)
+        return path
+
+    def test_miss_before_put(self):
+        self.assertIsNone(self.cache.get(self.image_path))
+
+    def test_put_then_get(self):
+        with Image.open(self.image_path) as image:
+            self.cache.put(self.image_path, image)
+        thumbnail = self.cache.get(self.image_path)
+        self.assertEqual((1000, 1400), (thumbnail.width, thumbnail.height))
+        self.assertEqual((183, 256), thumbnail.image.size)
+        self.assertEqual((255, 0, 0), thumbnail.image.getpixel((10, 10)))
+
+    def test_freedesktop_naming(self):
+        with Image.open(self.image_path) as image:
+            self.cache.put(self.image_path, image)
+        uri = self.image_path.absolute().as_uri()
+        thumbnail_path = self.cache.thumbnail_path(self.image_path)
+        self.assertEqual(self.directory / 'thumbnails' / 'large', thumbnail_path.parent)
+        with Image.open(thumbnail_path) as thumbnail:
+            self.assertEqual(uri, thumbnail.text['Thumb::URI'])
+
+    def test_modified_file_invalidates_thumbnail(self):
+        with Image.open(self.image_path) as image:
+            self.cache.put(self.image_path, image)
+        stat = os.stat(self.image_path)
+        os.utime(self.image_path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertIsNone(self.cache.get(self.image_path))
+
+    def test_evicts_least_recently_used(self):
+        paths = [self._image('page{}.png'.format(i), (512, 512)) for i in range(3)]
+        cache = ThumbnailCache(self.directory / 'thumbnails')
+        for i, path in enumerate(paths):
+            with Image.open(path) as image:
+                cache.put(path, image)
+            os.utime(cache.thumbnail_path(path), (i, i))
+        cache.get(paths[0])
+        cache.max_size = os.path.getsize(cache.thumbnail_path(paths[0])) * 2
+        cache.evict()
+        self.assertIsNotNone(cache.get(paths[0]))
+        self.assertIsNone(cache.get(paths[1]))
+        self.assertIsNotNone(cache.get(paths[2]))
+
+    def test_evict_leaves_thumbnails_of_other_applications_alone(self):
+        cache = ThumbnailCache(self.directory / 'thumbnails')
+        with Image.open(self.image_path) as image:
+            cache.put(self.image_path, image)
+        foreign = cache.directory / ('0' * 32 + '.png')
+        Image.new('RGB', (256, 256)).save(foreign)
+        os.utime(foreign, (0, 0))
+        cache.max_size = os.path.getsize(cache.thumbnail_path(self.image_path))
+        cache.evict()
+        self.assertTrue(foreign.exists())
+        self.assertIsNotNone(cache.get(self.image_path))
+        cache.max_size = 0
+        cache.evict()
+        self.assertTrue(foreign.exists())
+        self.assertIsNone(cache.get(self.image_path))
+
+    def test_evict_looks_only_at_indexed_thumbnails(self):
+        cache = ThumbnailCache(self.directory / 'thumbnails')
+        with Image.open(self.image_path) as image:
+            cache.put(self.image_path, image)
+        for i in range(20):
+            Image.new('RGB', (256, 256)).save(cache.directory / ('{:032x}.png'.format(i)))
+        cache.max_size = 0
+        with patch.object(ThumbnailCache, '_is_own', wraps=ThumbnailCache._is_own) as is_own:
+            cache.evict()
+        is_own.assert_called_once_with(cache.thumbnail_path(self.image_path))
+        self.assertEqual(20, len(list(cache.directory.glob('*.png'))))
+        self.assertEqual('', (cache.directory / INDEX).read_text())
+
+    def test_put_evicts_in_the_background(self):
+        paths = [self._image('page{}.png'.format(i), (512, 512)) for i in range(3)]
+        cache = ThumbnailCache(self.directory / 'thumbnails', max_size=1)
+        for path in paths:
+            with Image.open(path) as image:
+                cache.put(path, image)
+            for thread in threading.enumerate():
+                if thread.name == 'thumbnail-eviction':
+                    thread.join(5)
+        self.assertEqual([], list(cache.directory.glob('*.png')))
+
+    def test_from_settings(self):
+        self.assertIsNone(ThumbnailCache.from_settings(Thumbnails(max_size=0)))
+        cache = ThumbnailCache.from_settings(Thumbnails(directory='.thumbnails', max_size=1), self.directory)
+        self.assertEqual(self.directory / '.thumbnails' / 'large', cache.directory)
+        self.assertEqual(1024 * 1024, cache.max_size)
+
+
+class LoadThumbnailTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_jpeg_exif_thumbnail(self):
+        embedded = BytesIO()
+        Image.new('RGB', (300, 400), (0, 0, 255)).save(embedded, 'JPEG')
+        # TIFF header, empty IFD0, IFD1 pointing to the embedded JPEG
+        header = struct.pack('<2sHIHI', b'II', 42, 8, 0, 14)
+        ifd1 = struct.pack('<HHHIIHHIII', 2, 513, 4, 1, 44, 514, 4, 1, len(embedded.getvalue()), 0)
+        exif = b'Exif\x00\x00' + header + ifd1 + embedded.getvalue()
+        path = self.directory / 'page.jpg'
+        Image.new('RGB', (3000, 4000), (255, 0, 0)).save(path, exif=exif)
+        thumbnail = load_thumbnail(path, 256)
+        self.assertEqual((3000, 4000), (thumbnail.width, thumbnail.height))
+        self.assertEqual((300, 400), thumbnail.image.size)
+        self.assertLess(thumbnail.image.getpixel((5, 5))[0], 16)
+
+    def test_jpeg_draft(self):
+        path = self.directory / 'page.jpg'
+        Image.new('RGB', (3000, 4000), (255, 0, 0)).save(path)
+        thumbnail = load_thumbnail(path, 256)
+        self.assertEqual((3000, 4000), (thumbnail.width, thumbnail.height))
+        self.assertEqual((375, 500), thumbnail.image.size)
+
+    def test_tiff_reduced_resolution_ifd(self):
+        path = self.directory / 'page.tif'
+        image = Image.new('RGB', (2000, 3000), (255, 0, 0))
+        reduced = Image.new('RGB', (500, 750), (0, 255, 0))
+        # NewSubfileType 1: reduced resolution version of the image
+        image.save(path, save_all=True, append_images=[reduced], tiffinfo={254: 1})
+        thumbnail = load_thumbnail(path, 256)
+        self.assertEqual((2000, 3000), (thumbnail.width, thumbnail.height))
+        self.assertEqual((0, 255, 0), thumbnail.image.getpixel((5, 5)))
+
+    def test_tiff_other_pages_get_ignored(self):
+        path = self.directory / 'page.tif'
+        image = Image.new('RGB', (2000, 3000), (255, 0, 0))
+        image.save(path, save_all=True, append_images=[Image.new('RGB', (500, 750), (0, 255, 0))])
+        thumbnail = load_thumbnail(path, 256)
+        self.assertEqual((255, 0, 0), thumbnail.image.getpixel((5, 5)))
+        self.assertEqual((500, 750), thumbnail.image.size)
+
+    def test_full_decode(self):
+        path = self.directory / 'page.tif'
+        Image.new('1', (2000, 3000), 1).save(path, compression='group4')
+        thumbnail = load_thumbnail(path, 256)
+        self.assertEqual((2000, 3000), (thumbnail.width, thumbnail.height))
+        self.assertEqual((500, 750), thumbnail.image.size)
+        self.assertEqual((255, 255, 255), thumbnail.image.getpixel((5, 5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
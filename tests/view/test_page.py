@@ -1,6 +1,11 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, call, patch
+from PIL import Image
+from ocrd_browser.model.page_xml_renderer import Feature
 from ocrd_browser.view import ViewPage
+from ocrd_browser.view.page import PageRenderRequest
+from ocrd_browser.view.base import TiledImage
+from ocrd_browser.util.image import ImagePyramid
 from ocrd_browser.ui import MainWindow
 from tests import TestCase
 
@@ -13,6 +18,46 @@ class ViewPageTestCase(TestCase):
     def test_can_construct(self):
         self.assertIsNotNone(self.vx)
 
+    def test_screenshot_renders_full_resolution(self):
+        full = Image.new('RGB', (40, 20))
+        request = PageRenderRequest('PHYS_0017', 'OCR-D-GT-PAGE', Feature.DEFAULT, None, '', 0.25)
+        self.vx.rendering = MagicMock(request=request, image=Image.new('RGB', (10, 5)))
+        with patch.object(PageRenderRequest, 'render', autospec=True, return_value=MagicMock(image=full)) as render:
+            self.assertIs(full, self.vx.full_resolution_image())
+        self.assertEqual(1.0, render.call_args[0][0].scale)
+
+    def test_only_zooming_in_renders_again(self):
+        self.vx.current = MagicMock(id='PHYS_0017')
+        self.vx.rendering = MagicMock(request=PageRenderRequest('PHYS_0017', 'OCR-D-GT-PAGE', Feature.DEFAULT, None, '', 0.5))
+        with patch('ocrd_browser.view.page.WhenIdle') as when_idle:
+            self.vx.config_changed('scale', (-2.0,))
+            self.assertNotIn(call(self.vx.redraw, priority=50), when_idle.call.call_args_list)
+            self.vx.config_changed('scale', (0.0,))
+            self.assertIn(call(self.vx.redraw, priority=50), when_idle.call.call_args_list)
+
+
+class TiledImageTestCase(TestCase):
+
+    def setUp(self):
+        self.tiled = TiledImage()
+        self.tiled.set_image(ImagePyramid(Image.new('RGB', (2000, 1000))), 2000)
+
+    def test_size(self):
+        self.assertEqual((4000, 2000), (self.tiled.width, self.tiled.height))
+
+    def test_visible_tiles(self):
+        self.assertEqual([(0, 0)], self.tiled.visible_tiles(0, 0, 100, 100))
+        self.assertEqual([(1, 2), (2, 2), (1, 3), (2, 3)], self.tiled.visible_tiles(300, 600, 600, 800))
+        self.assertEqual([(15, 7)], self.tiled.visible_tiles(3900, 1900, 5000, 3000))
+
+    def test_tiles_get_cached(self):
+        tile = self.tiled.tile(1, 1)
+        self.assertEqual((256, 256), (tile.get_width(), tile.get_height()))
+        self.assertIs(tile, self.tiled.tile(1, 1))
+        self.assertEqual(1, len(self.tiled.tiles))
+        edge = self.tiled.tile(15, 7)
+        self.assertEqual((4000 - 15 * 256, 2000 - 7 * 256), (edge.get_width(), edge.get_height()))
+
 
 if __name__ == '__main__':
     unittest.main()